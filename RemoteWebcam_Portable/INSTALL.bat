@@ -127,6 +127,26 @@ if not exist "%INSTALL_DIR%" mkdir "%INSTALL_DIR%"
 
 copy "%SCRIPT_DIR%main.py" "%INSTALL_DIR%\" >nul
 copy "%SCRIPT_DIR%ngrok_helper.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%bitrate.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%device_registry.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%encode_pool.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%encode_worker.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%frame_sources.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%http_client.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%lazy_import.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%metrics.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%motion_detector.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%network_info.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%presence.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%recorder.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%recording_index.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%session_auth.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%signaling.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%signaling_client.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%snapshots.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%state_backend.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%transforms.py" "%INSTALL_DIR%\" >nul
+copy "%SCRIPT_DIR%webrtc_helper.py" "%INSTALL_DIR%\" >nul
 copy "%SCRIPT_DIR%start_ngrok.bat" "%INSTALL_DIR%\" >nul
 copy "%SCRIPT_DIR%requirements.txt" "%INSTALL_DIR%\" >nul
 
@@ -0,0 +1,1170 @@
+"""
+Benchmark - Load and latency test suite for the streaming endpoints
+
+Starts main.py with a synthetic frame source on a local port (no camera or
+network needed) and attaches simulated clients:
+
+    N MJPEG viewers      /api/stream/mjpeg
+    M frame pollers      /api/stream/frame
+    K signaling clients  SocketIO join_device round trips
+
+Reports delivered FPS per client, frame-age latency percentiles (capture
+time from the X-Timestamp header to arrival), server CPU time per captured
+frame and server memory. CPU and memory are read from /proc, so those
+columns are Linux only.
+
+The signaling suite instead runs N concurrent WebRTC negotiations through
+the relay against a simulated remote device (offer, trickled ICE
+candidates, answer) and reports messages and bytes per negotiation, with
+the legacy room broadcast and one-message-per-candidate relaying compared
+against device-addressed offers and batched candidates.
+
+The startup suite measures time from launch to the first /health answer
+and to the first served frame, with the public IP and ngrok lookups
+pointed at a local stub that answers after a configurable delay.
+
+The encode suite runs in this process, without a server: it feeds
+synthetic frames to an EncodePool as fast as the pool accepts them and
+reports sustained encoded FPS per worker count (0 is encoding inline on
+the submitting thread, as the capture thread does without a pool).
+
+The memory suite imports the server into this process (threading mode,
+synthetic camera) and drives N MJPEG viewers through Flask's test client
+under tracemalloc. It reports peak traced memory while streaming and how
+many distinct payload objects each frame was delivered as: 1 means every
+viewer was handed the same bytes, N would mean a copy per viewer.
+
+The adaptive suite validates per-viewer adaptive bitrate: one MJPEG viewer
+on loopback reads at a throttled rate (with a small receive buffer), with
+adaptation on and off, and reports delivered FPS, frame-age latency and
+the level the controller settled on. Adaptive runs fail when p50 or p99
+latency (after the first half, while the controller settles) exceeds
+--target-latency.
+
+The reconnect suite runs the device against local_relay.py (a stand-in
+for the cloud relay), stops the relay for a given outage, restarts it and
+measures how long the device takes to be registered again, and how many
+connection attempts reached the relay meanwhile.
+
+The workers suite starts two servers sharing a SQLite STATE_BACKEND,
+registers a simulated device on the first and sends an offer from a viewer
+on the second. With --message-queue the device must receive the offer and
+the answer must come back; without one the viewer must get a
+signaling_error instead of the offer being dropped silently.
+
+Suites with thresholds add a passed column (load and signaling: no client
+errors and p99 within --max-p99-ms, reconnect: recovery within
+--reconnect-max plus RECOVERY_SLACK, adaptive and workers as above), and
+the run exits non-zero when any row failed.
+
+Example:
+    python benchmark.py --modes threading,eventlet --viewers 1,10,50 --pollers 5 --signaling 5
+    python benchmark.py --json results.json
+    python benchmark.py --suite signaling --negotiations 20
+    python benchmark.py --suite startup --network-delay 5
+    python benchmark.py --suite encode --workers 0,1,2,4 --pools thread,process --resolution 1920x1080
+    python benchmark.py --suite memory --viewers 1,10,25
+    python benchmark.py --suite adaptive --rates 100,300,1000
+    python benchmark.py --suite reconnect --outages 2,10,30
+    python benchmark.py --suite workers --message-queue redis://127.0.0.1:6379/0
+"""
+
+import argparse
+import http.client
+import http.server
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PASSWORD = "luohino"
+RECOVERY_SLACK = 5.0  # seconds past the reconnect backoff cap a relay re-registration may take
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list (0 if empty)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def start_server(port, async_mode, extra_env=None):
+    """Launch main.py with a synthetic camera and no cloud signaling"""
+    env = dict(os.environ)
+    env.update({
+        'HTTP_PORT': str(port),
+        'ASYNC_MODE': async_mode,
+        'FRAME_SOURCE': 'synthetic',
+        'MOTION_DETECTION': '0',
+        'SIGNALING_SERVER': '',
+    })
+    env.update(extra_env or {})
+    return subprocess.Popen(
+        [sys.executable, os.path.join(SCRIPT_DIR, 'main.py')],
+        cwd=SCRIPT_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def request_json(port, method, path, body=None, timeout=5):
+    """Small JSON request helper on top of http.client"""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read() or b'{}')
+    finally:
+        conn.close()
+
+
+def wait_for_health(port, timeout=30):
+    """Poll /health until the server answers, returns the health payload"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            status, data = request_json(port, 'GET', '/health', timeout=1)
+            if status == 200:
+                return data
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"Server on port {port} did not become healthy")
+
+
+def login(port):
+    """Exchange the password for a session token"""
+    status, data = request_json(port, 'POST', '/api/authenticate', {'password': PASSWORD})
+    if status != 200:
+        raise RuntimeError(f"Login failed: {data}")
+    return data['token']
+
+
+def start_camera(port, device_id, token):
+    """Start streaming on the benchmark server"""
+    status, data = request_json(port, 'POST', '/api/stream/start',
+                                {'token': token, 'device_id': device_id})
+    if status != 200:
+        raise RuntimeError(f"Could not start camera: {data}")
+
+
+def frames_captured(port, token):
+    """Sequence number of the latest captured frame"""
+    _, data = request_json(port, 'GET', f'/api/stream/viewers?token={token}')
+    return data.get('frame_seq', 0)
+
+
+def process_stats(pid):
+    """
+    CPU seconds and memory of a process from /proc.
+
+    Returns:
+        dict with cpu_seconds, rss_mb and peak_rss_mb (None off Linux)
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # Fields after the parenthesised command name; utime/stime are 14/15
+            fields = f.read().rsplit(')', 1)[1].split()
+        cpu_seconds = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+        memory = {}
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    name, value = line.split(':', 1)
+                    memory[name] = int(value.split()[0]) / 1024.0
+        return {
+            'cpu_seconds': cpu_seconds,
+            'rss_mb': memory.get('VmRSS'),
+            'peak_rss_mb': memory.get('VmHWM')
+        }
+    except (OSError, ValueError, IndexError):
+        return {'cpu_seconds': None, 'rss_mb': None, 'peak_rss_mb': None}
+
+
+def new_result():
+    return {'frames': 0, 'bytes': 0, 'latencies': [], 'elapsed': 0.0, 'error': None}
+
+
+def read_mjpeg_part(response):
+    """
+    Read one multipart part.
+
+    Returns:
+        (headers dict, payload bytes), or (None, None) at end of stream
+    """
+    line = response.readline()
+    while line and not line.startswith(b'--'):
+        line = response.readline()
+    if not line:
+        return None, None
+
+    headers = {}
+    while True:
+        line = response.readline()
+        if not line or line in (b'\r\n', b'\n'):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    payload = response.read(int(headers.get('content-length', 0)))
+    return headers, payload
+
+
+def mjpeg_viewer(port, token, stop_event, result, path='/api/stream/mjpeg'):
+    """Consume an MJPEG stream, recording frame count, bytes and latencies"""
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        conn.request('GET', f'{path}?token={token}')
+        response = conn.getresponse()
+        start = time.time()
+        while not stop_event.is_set():
+            headers, payload = read_mjpeg_part(response)
+            if headers is None:
+                break
+            now = time.time()
+            result['frames'] += 1
+            result['bytes'] += len(payload)
+            if 'x-timestamp' in headers:
+                result['latencies'].append(now - float(headers['x-timestamp']))
+        result['elapsed'] = time.time() - start
+        conn.close()
+    except Exception as e:
+        result['error'] = str(e)
+
+
+def frame_poller(port, token, stop_event, result, interval=0.1, path='/api/stream/frame'):
+    """Poll single frames on a keep-alive connection, counting new frames only"""
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        start = time.time()
+        last_timestamp = None
+        while not stop_event.is_set():
+            conn.request('GET', path, headers={'Authorization': f'Bearer {token}'})
+            response = conn.getresponse()
+            payload = response.read()
+            now = time.time()
+            timestamp = response.getheader('X-Timestamp')
+            if response.status == 200 and timestamp and timestamp != last_timestamp:
+                last_timestamp = timestamp
+                result['frames'] += 1
+                result['bytes'] += len(payload)
+                result['latencies'].append(now - float(timestamp))
+            stop_event.wait(interval)
+        result['elapsed'] = time.time() - start
+        conn.close()
+    except Exception as e:
+        result['error'] = str(e)
+
+
+def signaling_client(port, token, device_id, stop_event, result, interval=0.1):
+    """Measure SocketIO join_device -> joined_device round trips"""
+    try:
+        import socketio as client_socketio
+    except ImportError:
+        result['error'] = 'python-socketio not installed'
+        return
+
+    sio = client_socketio.Client(reconnection=False)
+    joined = threading.Event()
+    sio.on('joined_device', lambda data: joined.set())
+    try:
+        sio.connect(f'http://127.0.0.1:{port}', transports=['websocket'], auth={'token': token})
+        start = time.time()
+        while not stop_event.is_set():
+            joined.clear()
+            sent = time.time()
+            sio.emit('join_device', {'device_id': device_id})
+            if joined.wait(timeout=5):
+                result['frames'] += 1
+                result['latencies'].append(time.time() - sent)
+            stop_event.wait(interval)
+        result['elapsed'] = time.time() - start
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        sio.disconnect()
+
+
+def summarize(results, prefix):
+    """Aggregate per-client results into rate and latency columns"""
+    latencies = [latency for result in results for latency in result['latencies']]
+    rates = [result['frames'] / result['elapsed'] for result in results if result['elapsed']]
+    return {
+        f'{prefix}_errors': sum(1 for result in results if result['error']),
+        f'{prefix}_rate_mean': round(sum(rates) / len(rates), 1) if rates else 0.0,
+        f'{prefix}_rate_min': round(min(rates), 1) if rates else 0.0,
+        f'{prefix}_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        f'{prefix}_p99_ms': round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def run_load(server, port, token, device_id, viewers, pollers, signaling, duration, max_p99_ms):
+    """Attach all simulated clients for duration seconds and measure"""
+    stop_event = threading.Event()
+    groups = {
+        'mjpeg': ([new_result() for _ in range(viewers)], mjpeg_viewer, (port, token)),
+        'poll': ([new_result() for _ in range(pollers)], frame_poller, (port, token)),
+        'sio': ([new_result() for _ in range(signaling)], signaling_client, (port, token, device_id)),
+    }
+
+    threads = []
+    for results, target, args in groups.values():
+        for result in results:
+            threads.append(threading.Thread(target=target, args=args + (stop_event, result), daemon=True))
+
+    seq_before = frames_captured(port, token)
+    proc_before = process_stats(server.pid)
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    proc_after = process_stats(server.pid)
+    frames = frames_captured(port, token) - seq_before
+
+    row = {'viewers': viewers, 'pollers': pollers, 'signaling': signaling,
+           'captured_fps': round(frames / duration, 1)}
+    for name, (results, _, _) in groups.items():
+        if results:
+            row.update(summarize(results, name))
+    clients = [name for name, (results, _, _) in groups.items() if results]
+    row['passed'] = all(row[f'{name}_errors'] == 0 and row[f'{name}_rate_min'] > 0
+                        and row[f'{name}_p99_ms'] <= max_p99_ms for name in clients)
+
+    if proc_after['cpu_seconds'] is not None:
+        cpu = proc_after['cpu_seconds'] - proc_before['cpu_seconds']
+        row['cpu_pct'] = round(100 * cpu / duration, 1)
+        row['cpu_ms_per_frame'] = round(1000 * cpu / frames, 2) if frames else None
+        row['rss_mb'] = round(proc_after['rss_mb'], 1)
+        row['peak_rss_mb'] = round(proc_after['peak_rss_mb'], 1)
+    return row
+
+
+def run_mode(async_mode, viewer_counts, pollers, signaling, duration, port, max_p99_ms):
+    """Benchmark one async mode across viewer counts"""
+    server = start_server(port, async_mode)
+    try:
+        health = wait_for_health(port)
+        token = login(port)
+        start_camera(port, health['device_id'], token)
+        time.sleep(1)  # Let the capture thread warm up
+        return [dict(run_load(server, port, token, health['device_id'], count, pollers, signaling, duration,
+                              max_p99_ms),
+                     mode=async_mode)
+                for count in viewer_counts]
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+# Signaling suite
+
+SIGNALING_EVENTS = ('offer', 'answer', 'ice_candidate', 'ice_candidates')
+FAKE_SDP = 'v=0\r\n' + ''.join(f'a=fake-attribute-{i}:{"x" * 24}\r\n' for i in range(40))
+CANDIDATES_PER_PEER = 8
+
+
+class TrafficCounter:
+    """Signaling messages and payload bytes seen by all simulated clients"""
+
+    def __init__(self, serializer=''):
+        self.serializer = serializer
+        self.messages = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def count(self, data):
+        if self.serializer == 'msgpack':
+            import msgpack
+            size = len(msgpack.packb(data))
+        else:
+            size = len(json.dumps(data, separators=(',', ':')))
+        with self.lock:
+            self.messages += 1
+            self.bytes += size
+
+
+def counting_client(counter, handlers):
+    """SocketIO client that counts signaling traffic in both directions"""
+    import socketio as client_socketio
+
+    options = {'serializer': counter.serializer} if counter.serializer else {}
+    sio = client_socketio.Client(reconnection=False, **options)
+    emit = sio.emit
+
+    def counted_emit(event, data=None, **kwargs):
+        if event in SIGNALING_EVENTS:
+            counter.count(data)
+        return emit(event, data, **kwargs)
+    sio.emit = counted_emit
+
+    def counted(handler):
+        def receive(data):
+            counter.count(data)
+            if handler:
+                handler(data)
+        return receive
+
+    for event in SIGNALING_EVENTS:
+        sio.on(event, counted(handlers.get(event)))
+    return sio
+
+
+def fake_device(port, token, device_id, register, counter, finished):
+    """
+    Remote device that answers every offer.
+
+    register=True announces it with device_register (and batch support),
+    otherwise it only joins its room like older devices.
+    """
+    sio = None
+
+    def mark_done(peer):
+        finished.setdefault(peer, threading.Event()).set()
+
+    def on_offer(data):
+        sio.emit('answer', {'to': data['from'], 'answer': {'type': 'answer', 'sdp': FAKE_SDP}})
+
+    def on_candidate(data):
+        candidate = data.get('candidate')
+        if not candidate or not candidate.get('candidate'):
+            mark_done(data['from'])
+
+    def on_candidates(data):
+        if data.get('done'):
+            mark_done(data['from'])
+
+    sio = counting_client(counter, {'offer': on_offer, 'ice_candidate': on_candidate,
+                                    'ice_candidates': on_candidates})
+    registered = threading.Event()
+    sio.on('device_registered', lambda data: registered.set())
+    sio.on('joined_device', lambda data: registered.set())
+    sio.connect(f'http://127.0.0.1:{port}', transports=['websocket'],
+                auth={'token': token, 'features': ['ice_batch'] if register else []})
+    if register:
+        sio.emit('device_register', {'device_id': device_id, 'device_name': 'benchmark-device',
+                                     'features': ['ice_batch']})
+    else:
+        sio.emit('join_device', {'device_id': device_id})
+    if not registered.wait(timeout=5):
+        raise RuntimeError('Simulated device did not register')
+    return sio
+
+
+def negotiate(port, token, device_id, counter, finished, result, ready, go):
+    """One viewer: join the device room, offer, trickle candidates, await the answer"""
+    answered = threading.Event()
+    sio = counting_client(counter, {'answer': lambda data: answered.set()})
+    try:
+        joined = threading.Event()
+        sio.on('joined_device', lambda data: joined.set())
+        sio.connect(f'http://127.0.0.1:{port}', transports=['websocket'], auth={'token': token})
+        sio.emit('join_device', {'device_id': device_id})
+        joined.wait(timeout=5)
+        ready.set()
+        go.wait()
+
+        start = time.time()
+        sio.emit('offer', {'device_id': device_id, 'offer': {'type': 'offer', 'sdp': FAKE_SDP}})
+        for i in range(CANDIDATES_PER_PEER):
+            time.sleep(0.002)  # Trickle like a browser gathering candidates
+            sio.emit('ice_candidate', {'device_id': device_id, 'candidate': {
+                'candidate': f'candidate:{i} 1 udp 2122260223 192.168.1.{i + 10} {50000 + i} typ host',
+                'sdpMid': '0', 'sdpMLineIndex': 0}})
+        sio.emit('ice_candidate', {'device_id': device_id, 'candidate': {'candidate': '', 'sdpMid': '0'}})
+
+        done = finished.setdefault(sio.get_sid(), threading.Event())
+        if answered.wait(timeout=10) and done.wait(timeout=10):
+            result['latencies'].append(time.time() - start)
+            result['frames'] += 1
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        ready.set()
+        sio.disconnect()
+
+
+def run_signaling_variant(name, async_mode, negotiations, port, extra_env, register, max_p99_ms, serializer=''):
+    """Run concurrent negotiations against one server configuration"""
+    server = start_server(port, async_mode, extra_env)
+    device = None
+    try:
+        wait_for_health(port)
+        token = login(port)
+        counter = TrafficCounter(serializer)
+        finished = {}
+        device_id = 'benchmark-device'
+        device = fake_device(port, token, device_id, register, counter, finished)
+
+        results = [new_result() for _ in range(negotiations)]
+        go = threading.Event()
+        threads = []
+        for result in results:
+            ready = threading.Event()
+            thread = threading.Thread(target=negotiate, daemon=True,
+                                      args=(port, token, device_id, counter, finished, result, ready, go))
+            thread.start()
+            ready.wait(timeout=10)
+            threads.append(thread)
+
+        with counter.lock:
+            counter.messages = counter.bytes = 0
+        go.set()
+        for thread in threads:
+            thread.join(timeout=30)
+
+        completed = sum(result['frames'] for result in results)
+        latencies = [latency for result in results for latency in result['latencies']]
+        p99_ms = round(percentile(latencies, 99) * 1000, 1)
+        return {
+            'variant': name,
+            'mode': async_mode,
+            'negotiations': negotiations,
+            'completed': completed,
+            'messages': counter.messages,
+            'bytes': counter.bytes,
+            'msgs_per_negotiation': round(counter.messages / completed, 1) if completed else None,
+            'bytes_per_negotiation': round(counter.bytes / completed) if completed else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p99_ms': p99_ms,
+            'passed': completed == negotiations and p99_ms <= max_p99_ms,
+        }
+    finally:
+        if device is not None:
+            device.disconnect()
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def run_signaling_suite(async_mode, negotiations, port, max_p99_ms):
+    """Legacy broadcast relaying vs addressed offers and batched candidates"""
+    variants = [
+        ('legacy', {'ICE_BATCH_WINDOW': '0'}, False, ''),
+        ('batched', {}, True, ''),
+    ]
+    try:
+        import msgpack  # noqa: F401
+        variants.append(('batched+msgpack', {'SIGNALING_SERIALIZER': 'msgpack'}, True, 'msgpack'))
+    except ImportError:
+        pass
+    return [run_signaling_variant(name, async_mode, negotiations, port, env, register, max_p99_ms, serializer)
+            for name, env, register, serializer in variants]
+
+
+# Startup suite
+
+class SlowNetworkHandler(http.server.BaseHTTPRequestHandler):
+    """Stands in for ipify and the ngrok API, answering after server.delay"""
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        if self.path.startswith('/api/tunnels'):
+            body = {'tunnels': []}
+        else:
+            body = {'ip': '203.0.113.7'}
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def wait_for_frame(port, token, timeout=30):
+    """Poll /api/stream/frame until a frame is served"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            conn.request('GET', '/api/stream/frame', headers={'Authorization': f'Bearer {token}'})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                return
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.05)
+    raise RuntimeError(f"No frame from port {port}")
+
+
+def run_startup(async_mode, port, delay, runs):
+    """Launch to /health and launch to first frame, with slow network lookups"""
+    stub = http.server.ThreadingHTTPServer(('127.0.0.1', 0), SlowNetworkHandler)
+    stub.daemon_threads = True
+    stub.delay = delay
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    stub_url = f'http://127.0.0.1:{stub.server_address[1]}'
+    extra_env = {
+        'PUBLIC_IP_URL': f'{stub_url}/ip',
+        'NGROK_API_URL': f'{stub_url}/api/tunnels',
+    }
+
+    health_times, frame_times = [], []
+    try:
+        for _ in range(runs):
+            launched = time.time()
+            server = start_server(port, async_mode, extra_env)
+            try:
+                health = wait_for_health(port, timeout=delay + 30)
+                health_times.append(time.time() - launched)
+                token = login(port)
+                start_camera(port, health['device_id'], token)
+                wait_for_frame(port, token)
+                frame_times.append(time.time() - launched)
+            finally:
+                server.terminate()
+                server.wait(timeout=10)
+    finally:
+        stub.shutdown()
+        stub.server_close()
+
+    return {
+        'mode': async_mode,
+        'network_delay': delay,
+        'runs': runs,
+        'health_s_mean': round(sum(health_times) / len(health_times), 2),
+        'health_s_max': round(max(health_times), 2),
+        'first_frame_s_mean': round(sum(frame_times) / len(frame_times), 2),
+        'first_frame_s_max': round(max(frame_times), 2),
+    }
+
+
+# Encode suite
+
+def synthetic_frames(width, height, count=8):
+    """A few distinct BGR frames with gradients and noise (not trivially compressible)"""
+    import numpy as np
+    rng = np.random.default_rng(0)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    frames = []
+    for i in range(count):
+        base = np.stack([(x + i * 16) % 256 + y * 0, (y + i * 8) % 256 + x * 0, (x + y) / 2], axis=-1)
+        noise = rng.integers(0, 24, size=(height, width, 3))
+        frames.append(np.clip(base + noise, 0, 255).astype(np.uint8))
+    return frames
+
+
+def run_encode(pool_kind, workers, width, height, quality, duration):
+    """Sustained encoded FPS for one pool configuration"""
+    from encode_pool import EncodePool, encode_image
+
+    frames = synthetic_frames(width, height)
+    encoded = {'frames': 0, 'bytes': 0, 'last': -1, 'out_of_order': 0}
+    submitted = dropped = 0
+
+    if workers == 0:
+        start = time.time()
+        while time.time() - start < duration:
+            jpeg = encode_image(frames[submitted % len(frames)], quality, None)
+            submitted += 1
+            encoded['frames'] += 1
+            encoded['bytes'] += len(jpeg)
+        elapsed = time.time() - start
+    else:
+        pool = EncodePool(workers, pool_kind)
+        stream = pool.stream()
+
+        def on_encoded(seq, jpeg, seconds):
+            if seq < encoded['last']:
+                encoded['out_of_order'] += 1
+            encoded['last'] = seq
+            if jpeg:
+                encoded['frames'] += 1
+                encoded['bytes'] += len(jpeg)
+
+        stream.on_encoded = on_encoded
+        pool.start()
+        try:
+            # Warm up: workers import cv2 (and spawn) before the clock starts
+            for _ in range(workers):
+                stream.submit(frames[0], quality, context=-1)
+            while stream.in_flight():
+                time.sleep(0.01)
+            encoded['frames'] = encoded['bytes'] = 0
+
+            start = time.time()
+            while time.time() - start < duration:
+                if stream.submit(frames[submitted % len(frames)], quality, context=submitted):
+                    submitted += 1
+                else:
+                    dropped += 1
+                    time.sleep(0.0005)  # Every slot busy
+            while stream.in_flight():
+                time.sleep(0.001)
+            elapsed = time.time() - start
+        finally:
+            pool.close()
+
+    return {
+        'pool': pool_kind if workers else 'inline',
+        'workers': workers,
+        'resolution': f'{width}x{height}',
+        'frames': encoded['frames'],
+        'encoded_fps': round(encoded['frames'] / elapsed, 1),
+        'mb_per_s': round(encoded['bytes'] / elapsed / 1e6, 1),
+        'pool_full': dropped,
+        'out_of_order': encoded['out_of_order'],
+    }
+
+
+def run_encode_suite(pool_kinds, worker_counts, resolution, quality, duration):
+    """Encoded FPS against worker count for each pool kind"""
+    width, height = (int(v) for v in resolution.lower().split('x'))
+    rows = []
+    if 0 in worker_counts:
+        rows.append(run_encode('inline', 0, width, height, quality, duration))
+    for pool_kind in pool_kinds:
+        for workers in worker_counts:
+            if workers:
+                rows.append(run_encode(pool_kind, workers, width, height, quality, duration))
+    return rows
+
+
+# Memory suite
+
+def load_server_module():
+    """Import main.py in-process with a synthetic camera and no cloud signaling"""
+    os.environ.update({
+        'ASYNC_MODE': 'threading',
+        'FRAME_SOURCE': 'synthetic',
+        'MOTION_DETECTION': '0',
+        'SIGNALING_SERVER': '',
+    })
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    import main as server
+    return server
+
+
+def test_client_viewer(client, token, stop_event, deliveries, result):
+    """Consume an MJPEG stream through the test client, noting payload identities"""
+    try:
+        response = client.get('/api/stream/mjpeg', headers={'Authorization': f'Bearer {token}'},
+                              buffered=False)
+        timestamp = None
+        for chunk in response.response:
+            if stop_event.is_set():
+                break
+            if chunk.startswith(b'--frame'):
+                timestamp = chunk.rsplit(b'X-Timestamp: ', 1)[-1].split(b'\r', 1)[0]
+            elif len(chunk) > 2:
+                # Payload: record which object it was, not a copy of it
+                deliveries.append((timestamp, id(chunk)))
+                result['frames'] += 1
+                result['bytes'] += len(chunk)
+        response.close()
+    except Exception as e:
+        result['error'] = str(e)
+
+
+def run_memory(server, viewers, duration):
+    """Peak traced memory and payload copies per frame for N concurrent viewers"""
+    import tracemalloc
+
+    client = server.app.test_client()
+    token = client.post('/api/authenticate', json={'password': PASSWORD}).get_json()['token']
+    camera = server.cameras.get()
+    camera.acquire('benchmark')
+    camera.wait_for_frame(0, timeout=5)
+
+    stop_event = threading.Event()
+    deliveries = []  # (frame timestamp, payload id), list.append is atomic
+    results = [new_result() for _ in range(viewers)]
+
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    threads = [threading.Thread(target=test_client_viewer, daemon=True,
+                                args=(client, token, stop_event, deliveries, result))
+               for result in results]
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    current, peak = tracemalloc.get_traced_memory()
+    stop_event.set()
+    for thread in threads:
+        thread.join(timeout=5)
+    tracemalloc.stop()
+    camera.release('benchmark')
+
+    payloads = {}
+    for timestamp, payload_id in deliveries:
+        payloads.setdefault(timestamp, set()).add(payload_id)
+    frames = sum(result['frames'] for result in results)
+    return {
+        'viewers': viewers,
+        'frames_delivered': frames,
+        'frame_kb': round(sum(r['bytes'] for r in results) / frames / 1024, 1) if frames else None,
+        'peak_kb': round((peak - baseline) / 1024),
+        'peak_kb_per_viewer': round((peak - baseline) / 1024 / viewers, 1),
+        'retained_kb': round((current - baseline) / 1024),
+        'payload_objects_per_frame': round(sum(len(ids) for ids in payloads.values()) / len(payloads), 2)
+        if payloads else None,
+        'errors': sum(1 for result in results if result['error']),
+    }
+
+
+def run_memory_suite(viewer_counts, duration):
+    server = load_server_module()
+    try:
+        return [run_memory(server, count, duration) for count in viewer_counts]
+    finally:
+        server.cameras.stop_all()
+
+
+# Adaptive bitrate suite
+
+def throttled_viewer(port, token, rate, adaptive, stop_event, result):
+    """MJPEG viewer that reads at most rate bytes/second, like a slow link"""
+    try:
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        conn.connect()
+        # Keep the client side from soaking up seconds of video
+        conn.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        conn.request('GET', f'/api/stream/mjpeg?token={token}&adaptive={1 if adaptive else 0}')
+        response = conn.getresponse()
+        start = next_read = time.time()
+        while not stop_event.is_set():
+            headers, payload = read_mjpeg_part(response)
+            if headers is None:
+                break
+            now = time.time()
+            result['frames'] += 1
+            result['bytes'] += len(payload)
+            if 'x-timestamp' in headers:
+                result['latencies'].append(now - float(headers['x-timestamp']))
+            # Token bucket: the next part may only be read once this one is paid for
+            next_read = max(next_read, now - 1.0) + len(payload) / rate
+            stop_event.wait(max(0.0, next_read - time.time()))
+        result['elapsed'] = time.time() - start
+        conn.close()
+    except Exception as e:
+        result['error'] = str(e)
+
+
+def run_adaptive(port, rate_kb, adaptive, duration, target_latency):
+    """One throttled viewer against a fresh server"""
+    server = start_server(port, 'threading', {'ADAPTIVE_TARGET_LATENCY': str(target_latency)})
+    try:
+        health = wait_for_health(port)
+        token = login(port)
+        start_camera(port, health['device_id'], token)
+        time.sleep(1)
+
+        stop_event = threading.Event()
+        result = new_result()
+        thread = threading.Thread(target=throttled_viewer, daemon=True,
+                                  args=(port, token, rate_kb * 1024, adaptive, stop_event, result))
+        thread.start()
+        time.sleep(duration)
+        _, viewers = request_json(port, 'GET', f'/api/stream/viewers?token={token}')
+        stop_event.set()
+        thread.join(timeout=10)
+
+        # Latency once the controller had time to settle: second half only
+        latencies = result['latencies'][len(result['latencies']) // 2:]
+        level = next((v.get('adaptive') for v in viewers.get('viewers', []) if v.get('adaptive')), None) or {}
+        row = {
+            'rate_kb_s': rate_kb,
+            'adaptive': adaptive,
+            'fps': round(result['frames'] / result['elapsed'], 1) if result['elapsed'] else 0,
+            'kb_per_frame': round(result['bytes'] / result['frames'] / 1024, 1) if result['frames'] else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000),
+            'p99_ms': round(percentile(latencies, 99) * 1000),
+            'quality': level.get('quality'),
+            'width': level.get('width'),
+            'max_fps': level.get('max_fps'),
+            'steps_down': level.get('steps_down'),
+            'error': result['error'],
+        }
+        if adaptive:
+            # Without adaptation there is no target to hold, those rows are the baseline
+            limit = target_latency * 1000
+            row['passed'] = (not result['error'] and bool(latencies)
+                             and row['p50_ms'] <= limit and row['p99_ms'] <= limit)
+        return row
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def run_adaptive_suite(rates, duration, port, target_latency):
+    return [run_adaptive(port, rate, adaptive, duration, target_latency)
+            for rate in rates for adaptive in (False, True)]
+
+
+# Reconnect suite
+
+def start_relay(port):
+    """Launch the stand-in signaling relay"""
+    return subprocess.Popen(
+        [sys.executable, os.path.join(SCRIPT_DIR, 'local_relay.py'), '--port', str(port)],
+        cwd=SCRIPT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+
+
+def relay_status(port):
+    try:
+        status, data = request_json(port, 'GET', '/api/relay/status', timeout=2)
+        return data if status == 200 else None
+    except OSError:
+        return None
+
+
+def wait_for_registration(relay_port, device_id, since, timeout):
+    """Seconds from since until the device registered with the relay, None on timeout"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = relay_status(relay_port)
+        if status:
+            for registration in status['registrations']:
+                if registration['device_id'] == device_id and registration['time'] >= since:
+                    return registration['time'] - since
+        time.sleep(0.05)
+    return None
+
+
+def run_reconnect_suite(outages, port, reconnect_max):
+    """Recovery time of the device's relay registration after relay outages"""
+    relay_port = port + 1
+    relay = start_relay(relay_port)
+    server = None
+    rows = []
+    try:
+        wait_for_health(relay_port)
+        relay_url = f'http://127.0.0.1:{relay_port}'
+        server = start_server(port, 'threading', {
+            'SIGNALING_SERVER': relay_url,
+            'SIGNALING_RECONNECT_MAX': str(reconnect_max),
+            # Keep the address lookups off the network
+            'PUBLIC_IP_URL': f'{relay_url}/health',
+            'NGROK_API_URL': f'{relay_url}/health',
+        })
+        device_id = wait_for_health(port)['device_id']
+        if wait_for_registration(relay_port, device_id, 0, 30) is None:
+            raise RuntimeError("Device never registered with the local relay")
+
+        for outage in outages:
+            relay.terminate()
+            relay.wait(timeout=10)
+            time.sleep(outage)
+            relay = start_relay(relay_port)
+            wait_for_health(relay_port)
+            back = time.time()
+            recovery = wait_for_registration(relay_port, device_id, back, reconnect_max + 30)
+            status = relay_status(relay_port) or {}
+            rows.append({
+                'outage_s': outage,
+                'recovery_s': round(recovery, 2) if recovery is not None else None,
+                'connects': len(status.get('connects', [])),
+                'registrations': len(status.get('registrations', [])),
+                'registered_cameras': len(status.get('devices', {}).get(device_id, {}).get('cameras', [])),
+                'passed': recovery is not None and recovery <= reconnect_max + RECOVERY_SLACK,
+            })
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=10)
+        relay.terminate()
+        relay.wait(timeout=10)
+    return rows
+
+
+# Workers suite
+
+def run_workers(port, message_queue, directory):
+    """Offer from a viewer on one worker to a device registered on another"""
+    env = {
+        'STATE_BACKEND': f'sqlite:///{os.path.join(directory, "state.db")}',
+        'SESSION_SECRET': 'benchmark-workers',
+        'SIGNALING_MESSAGE_QUEUE': message_queue,
+    }
+    device_port, viewer_port = port, port + 1
+    servers = [start_server(device_port, 'eventlet', env), start_server(viewer_port, 'eventlet', env)]
+    device = viewer = None
+    row = {'message_queue': message_queue or 'none'}
+    try:
+        wait_for_health(device_port)
+        wait_for_health(viewer_port)
+        token = login(device_port)
+        device_id = 'benchmark-device'
+        # Signaling traffic seen by the device alone: anything means the offer arrived
+        device_counter = TrafficCounter('')
+        device = fake_device(device_port, token, device_id, True, device_counter, {})
+
+        answered = threading.Event()
+        errors = []
+        viewer = counting_client(TrafficCounter(''), {'answer': lambda data: answered.set()})
+        viewer.on('signaling_error', errors.append)
+        viewer.connect(f'http://127.0.0.1:{viewer_port}', transports=['websocket'], auth={'token': token})
+
+        start = time.time()
+        viewer.emit('offer', {'device_id': device_id, 'offer': {'type': 'offer', 'sdp': FAKE_SDP}})
+        answered.wait(timeout=5)
+        if not answered.is_set():
+            time.sleep(0.5)  # Give a late signaling_error the chance to arrive
+        row.update({
+            'offer_delivered': device_counter.messages > 0,
+            'answered': answered.is_set(),
+            'latency_ms': round((time.time() - start) * 1000, 1) if answered.is_set() else None,
+            'error_reported': bool(errors),
+        })
+        # Through a queue the offer must arrive; without one it must at least not vanish silently
+        row['passed'] = row['answered'] if message_queue else (row['error_reported'] and not row['offer_delivered'])
+    except Exception as e:
+        row.update({'error': str(e), 'passed': False})
+    finally:
+        for client in (viewer, device):
+            if client is not None:
+                client.disconnect()
+        for server in servers:
+            server.terminate()
+            server.wait(timeout=10)
+    return row
+
+
+def run_workers_suite(port, message_queue):
+    """Cross-worker relaying without a message queue, and with one if given"""
+    with tempfile.TemporaryDirectory() as directory:
+        rows = [run_workers(port, '', directory)]
+        if message_queue:
+            os.remove(os.path.join(directory, 'state.db'))
+            rows.append(run_workers(port, message_queue, directory))
+    return rows
+
+
+def print_table(rows, columns):
+    """Print result rows as an aligned text table"""
+    columns = [c for c in columns if any(c in row for row in rows)]
+    widths = {c: max(len(c), *(len(str(row.get(c, ''))) for row in rows)) for c in columns}
+    print('  '.join(c.ljust(widths[c]) for c in columns))
+    for row in rows:
+        print('  '.join(str(row.get(c, '')).ljust(widths[c]) for c in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Streaming server load and latency benchmark')
+    parser.add_argument('--suite', choices=['load', 'signaling', 'startup', 'encode', 'memory', 'adaptive',
+                                            'reconnect', 'workers'],
+                        default='load',
+                        help='load: streaming clients, signaling: messages per WebRTC negotiation, '
+                             'startup: time to /health and first frame, encode: encode pool FPS, '
+                             'memory: MJPEG allocations per viewer, adaptive: throttled viewer latency, '
+                             'reconnect: relay outage recovery, workers: offers across two workers')
+    parser.add_argument('--modes', default='threading,eventlet',
+                        help='Comma separated async modes to compare')
+    parser.add_argument('--viewers', default='1,10,50', help='Comma separated MJPEG viewer counts')
+    parser.add_argument('--pollers', type=int, default=0, help='/api/stream/frame pollers')
+    parser.add_argument('--signaling', type=int, default=0, help='SocketIO signaling clients')
+    parser.add_argument('--negotiations', type=int, default=20,
+                        help='Concurrent negotiations in the signaling suite')
+    parser.add_argument('--network-delay', type=float, default=5,
+                        help='Seconds the stubbed IP/ngrok lookups take in the startup suite')
+    parser.add_argument('--runs', type=int, default=3, help='Launches per mode in the startup suite')
+    parser.add_argument('--workers', default='0,1,2,4', help='Comma separated encode worker counts')
+    parser.add_argument('--pools', default='thread,process', help='Encode pool kinds to compare')
+    parser.add_argument('--resolution', default='1920x1080', help='Frame size in the encode suite')
+    parser.add_argument('--quality', type=int, default=80, help='JPEG quality in the encode suite')
+    parser.add_argument('--rates', default='100,300,1000',
+                        help='Comma separated viewer read rates (KB/s) in the adaptive suite')
+    parser.add_argument('--target-latency', type=float, default=0.5,
+                        help='ADAPTIVE_TARGET_LATENCY (s) and the p50/p99 limit in the adaptive suite')
+    parser.add_argument('--outages', default='2,10,30', help='Comma separated relay outages (s), reconnect suite')
+    parser.add_argument('--reconnect-max', type=float, default=10,
+                        help='SIGNALING_RECONNECT_MAX for the device in the reconnect suite')
+    parser.add_argument('--message-queue', default='',
+                        help='SIGNALING_MESSAGE_QUEUE to also test in the workers suite (e.g. redis://...)')
+    parser.add_argument('--max-p99-ms', type=float, default=500,
+                        help='p99 latency limit (ms) of the load and signaling suites')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per measurement')
+    parser.add_argument('--port', type=int, default=5055)
+    parser.add_argument('--json', help='Also write results to this file')
+    args = parser.parse_args()
+
+    rows = []
+    if args.suite == 'encode':
+        rows.extend(run_encode_suite(args.pools.split(','), [int(v) for v in args.workers.split(',')],
+                                     args.resolution, args.quality, args.duration))
+    elif args.suite == 'memory':
+        rows.extend(run_memory_suite([int(v) for v in args.viewers.split(',')], args.duration))
+    elif args.suite == 'adaptive':
+        rows.extend(run_adaptive_suite([float(v) for v in args.rates.split(',')], args.duration, args.port,
+                                       args.target_latency))
+    elif args.suite == 'reconnect':
+        rows.extend(run_reconnect_suite([float(v) for v in args.outages.split(',')], args.port, args.reconnect_max))
+    elif args.suite == 'workers':
+        rows.extend(run_workers_suite(args.port, args.message_queue))
+    for mode in (args.modes.split(',') if args.suite in ('load', 'signaling', 'startup') else []):
+        try:
+            if args.suite == 'signaling':
+                rows.extend(run_signaling_suite(mode, args.negotiations, args.port, args.max_p99_ms))
+            elif args.suite == 'startup':
+                rows.extend(run_startup(mode, args.port, delay, args.runs)
+                            for delay in sorted({0.0, args.network_delay}))
+            else:
+                rows.extend(run_mode(mode, [int(v) for v in args.viewers.split(',')],
+                                     args.pollers, args.signaling, args.duration, args.port, args.max_p99_ms))
+        except Exception as e:
+            print(f"{mode}: {e}", file=sys.stderr)
+            rows.append({'mode': mode, 'passed': False})
+
+    if not rows:
+        sys.exit(1)
+
+    columns = {
+        'signaling': [
+            'variant', 'mode', 'negotiations', 'completed', 'msgs_per_negotiation', 'bytes_per_negotiation',
+            'p50_ms', 'p99_ms', 'passed'
+        ],
+        'startup': [
+            'mode', 'network_delay', 'runs', 'health_s_mean', 'health_s_max',
+            'first_frame_s_mean', 'first_frame_s_max'
+        ],
+        'memory': [
+            'viewers', 'frames_delivered', 'frame_kb', 'peak_kb', 'peak_kb_per_viewer', 'retained_kb',
+            'payload_objects_per_frame', 'errors'
+        ],
+        'adaptive': [
+            'rate_kb_s', 'adaptive', 'fps', 'kb_per_frame', 'p50_ms', 'p99_ms',
+            'quality', 'width', 'max_fps', 'steps_down', 'passed', 'error'
+        ],
+        'reconnect': ['outage_s', 'recovery_s', 'connects', 'registrations', 'registered_cameras', 'passed'],
+        'workers': ['message_queue', 'offer_delivered', 'answered', 'latency_ms', 'error_reported', 'passed',
+                    'error'],
+        'encode': [
+            'pool', 'workers', 'resolution', 'frames', 'encoded_fps', 'mb_per_s', 'pool_full', 'out_of_order'
+        ],
+    }
+    print_table(rows, columns.get(args.suite) or [
+        'mode', 'viewers', 'pollers', 'signaling', 'captured_fps',
+        'mjpeg_errors', 'mjpeg_rate_mean', 'mjpeg_rate_min', 'mjpeg_p50_ms', 'mjpeg_p99_ms',
+        'poll_errors', 'poll_rate_mean', 'poll_p50_ms', 'poll_p99_ms',
+        'sio_errors', 'sio_rate_mean', 'sio_p50_ms', 'sio_p99_ms',
+        'cpu_pct', 'cpu_ms_per_frame', 'rss_mb', 'peak_rss_mb', 'passed'
+    ])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'timestamp': time.time(), 'duration': args.duration, 'results': rows}, f, indent=2)
+
+    # Suites with thresholds mark each row; any failure fails the run
+    if any(row.get('passed') is False for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Bitrate - Per-viewer adaptive quality for MJPEG streams
+
+An MJPEG viewer on a slow link cannot say it is falling behind: frames
+pile up in the socket buffers and latency grows without bound. The only
+signal on the server is how long each part takes to write. While the
+kernel buffer has room a write returns at once; once it is full the write
+blocks for as long as the link needs to drain it, so bytes / seconds of
+the blocking writes is an estimate of the link's throughput. Writes that
+did not block only show that the link kept up with what was sent, so they
+can raise the estimate to the delivered rate and no further.
+
+Bytes still in the kernel send buffer are invisible to the frame age
+measured at write time, so send_buffer() suggests a buffer that drains
+within half the latency target at the estimated throughput.
+
+AdaptiveBitrate walks a fixed ladder of (quality, width, fps) levels
+below the tier the viewer asked for. It steps down when a frame is older
+than the latency target by the time it is written, or when the current
+level needs more than the measured throughput, skipping several levels
+when frames are far older than the target, and probes one level up once
+frames have stayed well inside the target for a while and the next
+level's frames fit the measured throughput. The ladder is the same for
+every viewer, so viewers at the same level share cached encodings.
+"""
+
+import math
+import time
+from typing import List, NamedTuple, Optional
+
+
+class Level(NamedTuple):
+    quality: int
+    width: Optional[int]  # None for native
+    fps: Optional[float]  # None for every captured frame
+
+
+# Approximate frame size of a level relative to the one above it
+LEVEL_SIZE_RATIO = 0.6
+
+
+def build_ladder(quality: int, width: Optional[int]) -> List[Level]:
+    """Levels from the requested tier down to a few kB at 2 fps"""
+    candidates = [
+        Level(quality, width, None),
+        Level(65, width, None),
+        Level(65, 480, None),
+        Level(50, 320, None),
+        Level(50, 320, 10),
+        Level(40, 240, 5),
+        Level(35, 160, 2),
+    ]
+    ladder = []
+    for level in candidates:
+        # Never go above what the viewer asked for
+        level = Level(
+            min(level.quality, quality),
+            min(level.width, width) if level.width and width else (level.width or width),
+            level.fps
+        )
+        if not ladder or level != ladder[-1]:
+            ladder.append(level)
+    return ladder
+
+
+class ThroughputEstimator:
+    """EWMA of bytes/second over writes that had to wait for the link"""
+
+    def __init__(self, alpha: float = 0.3, min_blocked: float = 0.005):
+        """
+        Args:
+            alpha: Weight of the newest sample
+            min_blocked: Writes shorter than this went straight into the
+                socket buffer and say nothing about the link
+        """
+        self.alpha = alpha
+        self.min_blocked = min_blocked
+        self.bytes_per_second: Optional[float] = None
+        self.delivered: Optional[float] = None  # EWMA of bytes/second actually written
+        self.last_write: Optional[float] = None
+
+    def sample(self, size: int, seconds: float, now: Optional[float] = None) -> bool:
+        """Add one write, returns True if it was blocked (and counted)"""
+        now = time.monotonic() if now is None else now
+        if self.last_write is not None and now > self.last_write:
+            rate = size / (now - self.last_write)
+            self.delivered = rate if self.delivered is None else self.delivered + self.alpha * (rate - self.delivered)
+        self.last_write = now
+
+        if seconds < self.min_blocked:
+            # Unblocked: the link kept up with the delivered rate, which
+            # may lift a stale estimate, but says nothing beyond it
+            if self.bytes_per_second is not None and self.delivered is not None:
+                self.bytes_per_second = max(self.bytes_per_second, self.delivered)
+            return False
+        rate = size / seconds
+        if self.bytes_per_second is None:
+            self.bytes_per_second = rate
+        else:
+            self.bytes_per_second += self.alpha * (rate - self.bytes_per_second)
+        return True
+
+    def reset(self):
+        self.bytes_per_second = None
+        self.delivered = None
+        self.last_write = None
+
+
+class AdaptiveBitrate:
+    """Picks a ladder level for one viewer from write timings"""
+
+    def __init__(self, quality: int, width: Optional[int], target_latency: float = 0.5,
+                 probe_after: float = 4.0, cooldown: float = 1.0, headroom: float = 0.8,
+                 min_send_buffer: int = 8192, max_send_buffer: int = 64 * 1024):
+        """
+        Args:
+            quality, width: Tier the viewer asked for (the top level)
+            target_latency: Seconds a frame may be old once written
+            probe_after: Seconds at a level before trying the one above
+            cooldown: Minimum seconds between two steps down
+            headroom: Fraction of the measured throughput a level may use
+            min_send_buffer, max_send_buffer: Bounds of send_buffer()
+        """
+        self.ladder = build_ladder(quality, width)
+        self.index = 0
+        self.target_latency = target_latency
+        self.probe_after = probe_after
+        self.cooldown = cooldown
+        self.headroom = headroom
+        self.min_send_buffer = min_send_buffer
+        self.max_send_buffer = max_send_buffer
+        self.throughput = ThroughputEstimator()
+        self.frame_bytes: List[Optional[float]] = [None] * len(self.ladder)  # EWMA per level
+        self.last_change = time.monotonic()
+        self.last_sent = 0.0
+        self.steps_down = 0
+        self.steps_up = 0
+        self.age: Optional[float] = None  # EWMA of frame age when written
+
+    @property
+    def level(self) -> Level:
+        return self.ladder[self.index]
+
+    def delay(self) -> float:
+        """Seconds to wait before the next frame to respect the level's fps"""
+        fps = self.level.fps
+        if not fps:
+            return 0.0
+        return max(0.0, self.last_sent + 1.0 / fps - time.monotonic())
+
+    def send_buffer(self) -> int:
+        """
+        Socket send buffer size (bytes) for the current throughput estimate.
+
+        Sized to drain within half the latency target, the other half is
+        left to the frame's age when written; the maximum until writes
+        have blocked at least once.
+        """
+        budget = self.throughput.bytes_per_second
+        if budget is None:
+            return self.max_send_buffer
+        return int(min(self.max_send_buffer, max(self.min_send_buffer, budget * self.target_latency / 2)))
+
+    def on_sent(self, size: int, seconds: float, frame_age: float):
+        """
+        Account for one written part.
+
+        Args:
+            size: Bytes written (header, JPEG, trailer)
+            seconds: Time the writes took
+            frame_age: Capture-to-written age of the frame (the time left
+                in the send buffer is added when the write blocked)
+        """
+        now = time.monotonic()
+        self.last_sent = now
+        if self.throughput.sample(size, seconds, now):
+            # A blocked write left the send buffer full behind this frame,
+            # it only arrives once that has drained
+            frame_age += self.send_buffer() / self.throughput.bytes_per_second
+        self.age = frame_age if self.age is None else self.age + 0.3 * (frame_age - self.age)
+        sizes = self.frame_bytes
+        sizes[self.index] = size if sizes[self.index] is None else sizes[self.index] + 0.3 * (size - sizes[self.index])
+
+        if frame_age > self.target_latency or self._over_budget(self.index):
+            if now - self.last_change >= self.cooldown and self.index < len(self.ladder) - 1:
+                self.index = self._fitting_level(frame_age)
+                self.last_change = now
+                self.steps_down += 1
+        elif (self.index > 0 and now - self.last_change >= self.probe_after
+              and self.age < self.target_latency / 2 and self._fits(self.index - 1)):
+            # Plenty of room at this level, try one better
+            self.index -= 1
+            self.last_change = now
+            self.steps_up += 1
+
+    def _rate(self, index: int) -> Optional[float]:
+        """Expected bytes/second of a level (None until it has been seen)"""
+        size = self.frame_bytes[index]
+        if size is None:
+            return None
+        fps = self.ladder[index].fps
+        if fps is None:
+            # Every captured frame: assume the rate we actually sent at
+            return None
+        return size * fps
+
+    def _over_budget(self, index: int) -> bool:
+        budget = self.throughput.bytes_per_second
+        rate = self._rate(index)
+        return budget is not None and rate is not None and rate > budget * self.headroom
+
+    def _fits(self, index: int) -> bool:
+        """Whether a level's frames would go out well inside the target"""
+        budget = self.throughput.bytes_per_second
+        if budget is None:
+            return True  # Writes never blocked, the link has room
+        size = self.frame_bytes[index] or (self.frame_bytes[self.index] or 0) / LEVEL_SIZE_RATIO ** (self.index - index)
+        return size / budget <= self.target_latency / 2 and not self._over_budget(index)
+
+    def _fitting_level(self, frame_age: float = 0.0) -> int:
+        """Next level down, or further if frame age or throughput say so"""
+        # Frames far older than the target: skip as many levels as it takes
+        # for frames to shrink by that factor
+        over = frame_age / self.target_latency if self.target_latency > 0 else 0
+        skip = math.ceil(math.log(over) / -math.log(LEVEL_SIZE_RATIO)) if over > 1 else 1
+        index = min(self.index + skip, len(self.ladder) - 1)
+        budget = self.throughput.bytes_per_second
+        current = self.frame_bytes[self.index]
+        if budget and current:
+            # Frame size shrinks roughly with the level; skip ahead while a
+            # level's frames alone would take longer than the target to send
+            while index < len(self.ladder) - 1:
+                size = self.frame_bytes[index] or current * LEVEL_SIZE_RATIO ** (index - self.index)
+                if size / budget <= self.target_latency and not self._over_budget(index):
+                    break
+                index += 1
+        return index
+
+    def describe(self) -> dict:
+        level = self.level
+        return {
+            'level': self.index,
+            'levels': len(self.ladder),
+            'quality': level.quality,
+            'width': level.width,
+            'max_fps': level.fps,
+            'throughput_kbps': round(self.throughput.bytes_per_second * 8 / 1000)
+            if self.throughput.bytes_per_second else None,
+            'frame_age': round(self.age, 3) if self.age is not None else None,
+            'steps_down': self.steps_down,
+            'steps_up': self.steps_up
+        }
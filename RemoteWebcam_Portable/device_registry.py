@@ -0,0 +1,75 @@
+"""
+Device Registry - Devices known to this signaling server
+
+Entries are kept in a StateBackend, so every worker behind a load balancer
+sees the same devices, and expire unless the device re-registers (or its
+worker refreshes it) within the TTL. Registrations made through this
+worker are also reported to a PresenceTracker if one is attached.
+"""
+
+from datetime import datetime
+from typing import List, Optional
+
+from presence import PresenceTracker
+from state_backend import MemoryBackend, StateBackend
+
+NAMESPACE = 'devices'
+
+
+class DeviceRegistry:
+    """device_id -> device info index with TTL expiry"""
+
+    def __init__(self, backend: Optional[StateBackend] = None, ttl: Optional[float] = None,
+                 presence: Optional[PresenceTracker] = None):
+        """
+        Args:
+            backend: Shared state store (in-memory by default)
+            ttl: Seconds a registration lasts, None to never expire
+            presence: Told about every registration, refresh and removal
+        """
+        self.backend = backend or MemoryBackend()
+        self.ttl = ttl
+        self.presence = presence
+
+    def register(self, device_id: str, device_name: str, ip: Optional[str] = None, **extra) -> dict:
+        """Add or refresh a device, stamping last_seen"""
+        info = {
+            'device_id': device_id,
+            'device_name': device_name,
+            'last_seen': datetime.utcnow().isoformat(),
+            'ip': ip
+        }
+        info.update(extra)
+        self.backend.put(NAMESPACE, device_id, info, self.ttl)
+        if self.presence:
+            self.presence.seen(device_id, info, self.ttl)
+        return info
+
+    def touch(self, device_id: str) -> bool:
+        """Extend a registration without changing it, False if it expired"""
+        info = self.get(device_id)
+        if info is None:
+            return False
+        info['last_seen'] = datetime.utcnow().isoformat()
+        self.backend.put(NAMESPACE, device_id, info, self.ttl)
+        if self.presence:
+            self.presence.seen(device_id, info, self.ttl)
+        return True
+
+    def unregister(self, device_id: str):
+        self.backend.delete(NAMESPACE, device_id)
+        if self.presence:
+            self.presence.remove(device_id)
+
+    def get(self, device_id: str) -> Optional[dict]:
+        return self.backend.get(NAMESPACE, device_id)
+
+    def list(self) -> List[dict]:
+        """Snapshot of all live devices"""
+        return list(self.backend.items(NAMESPACE).values())
+
+    def __contains__(self, device_id: str) -> bool:
+        return self.get(device_id) is not None
+
+    def __len__(self) -> int:
+        return len(self.backend.items(NAMESPACE))
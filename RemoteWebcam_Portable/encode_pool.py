@@ -0,0 +1,382 @@
+"""
+Encode Pool - Parallel JPEG encoding off the capture thread
+
+cv2.imencode is the dominant per-frame cost at high resolutions, and
+encoding on the capture thread caps a camera at one core. An EncodePool
+runs a fixed number of workers:
+
+    thread   Worker threads in this process. cv2 releases the GIL while
+             encoding, so threads already scale across cores.
+    process  Worker processes. Raw frames are copied once into a ring of
+             multiprocessing.shared_memory slots and only the slot number
+             and shape go through the task queue, so pixels are never
+             pickled. Encoded JPEGs come back over a pipe per worker.
+             A worker that dies is replaced, and the frame it held is
+             delivered as failed so later frames are not held up.
+             Workers run encode_worker, which imports only numpy and
+             OpenCV, and do not re-run the server's __main__ module.
+
+The ring has a fixed number of slots; when they are all in flight submit()
+returns False and the frame is dropped instead of queueing up latency.
+
+Each camera submits through its own EncodeStream, which hands results back
+in submission order even though workers finish out of order.
+"""
+
+import contextlib
+import logging
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from multiprocessing.connection import wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from encode_worker import encode_image, process_worker
+
+logger = logging.getLogger(__name__)
+
+POOL_KINDS = ('thread', 'process')
+_main_lock = threading.Lock()  # serializes _main_hidden across pools
+
+
+@contextlib.contextmanager
+def _main_hidden():
+    """
+    Start spawned processes without re-importing __main__.
+
+    spawn runs the parent's main script in every child so pickled
+    functions defined there resolve. Worker code lives in encode_worker,
+    and re-running the server (its imports, Flask app, cameras) in each
+    worker only delays the first encoded frame.
+    """
+    with _main_lock:
+        main = sys.modules['__main__']
+        saved = {attr: main.__dict__[attr] for attr in ('__file__', '__spec__') if attr in main.__dict__}
+        main.__dict__.pop('__file__', None)
+        main.__spec__ = None
+        try:
+            yield
+        finally:
+            main.__dict__.pop('__spec__', None)
+            main.__dict__.update(saved)
+
+
+class EncodeStream:
+    """One producer's view of the pool; results come back in submit order"""
+
+    def __init__(self, pool: 'EncodePool', stream_id: int):
+        self.pool = pool
+        self.stream_id = stream_id
+        # Called as on_encoded(context, jpeg or None, encode seconds)
+        self.on_encoded: Optional[Callable[[Any, Optional[bytes], float], None]] = None
+        self.next_seq = 0
+        self.next_delivery = 0
+        self.contexts: Dict[int, Any] = {}  # seq -> caller context, while in flight
+        self.done: Dict[int, Tuple[Optional[bytes], float]] = {}  # finished out of order
+        self.ready: Deque[Tuple[Any, Optional[bytes], float]] = deque()  # in order, not yet delivered
+        self.lock = threading.Lock()
+        self.delivery_lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, image: np.ndarray, quality: int, width: Optional[int] = None,
+               context: Any = None) -> bool:
+        """
+        Queue a frame for encoding.
+
+        Args:
+            image: BGR frame (not modified, copied in process mode)
+            quality: JPEG quality
+            width: Downscale to this width first, None for native
+            context: Handed back to on_encoded with the result
+
+        Returns:
+            bool: False if every slot is busy and the frame was dropped
+        """
+        with self.lock:
+            seq = self.next_seq
+            if not self.pool._submit(self, seq, image, quality, width):
+                self.dropped += 1
+                return False
+            self.next_seq += 1
+            self.contexts[seq] = context
+        return True
+
+    def _complete(self, seq: int, jpeg: Optional[bytes], seconds: float):
+        """Record a result and deliver every result that is now in order"""
+        with self.lock:
+            self.done[seq] = (jpeg, seconds)
+            while self.next_delivery in self.done:
+                jpeg, seconds = self.done.pop(self.next_delivery)
+                self.ready.append((self.contexts.pop(self.next_delivery), jpeg, seconds))
+                self.next_delivery += 1
+
+        # Callbacks (publish, thumbnails, recorder) run outside self.lock so
+        # they never hold up other workers. Whoever holds the delivery lock
+        # drains the queue in order, including results queued meanwhile.
+        while self.delivery_lock.acquire(blocking=False):
+            try:
+                while True:
+                    with self.lock:
+                        if not self.ready:
+                            break
+                        context, jpeg, seconds = self.ready.popleft()
+                    if self.on_encoded:
+                        try:
+                            self.on_encoded(context, jpeg, seconds)
+                        except Exception as e:
+                            logger.error(f"Encode callback error: {e}")
+            finally:
+                self.delivery_lock.release()
+            # A result queued between the last check and the release has
+            # nobody else to deliver it
+            with self.lock:
+                if not self.ready:
+                    return
+
+    def in_flight(self) -> int:
+        return len(self.contexts)
+
+
+class EncodePool:
+    """Fixed set of JPEG encode workers fed through a ring of frame slots"""
+
+    def __init__(self, workers: int, kind: str = 'thread', slots: Optional[int] = None,
+                 run_blocking: Optional[Callable] = None, task_timeout: float = 10.0):
+        """
+        Args:
+            workers: Number of encode threads or processes
+            kind: 'thread' or 'process'
+            slots: Frames in flight at once (default two per worker)
+            run_blocking: Runs a blocking call off the event loop (the
+                server's offload()); called directly when not given
+            task_timeout: Process mode: seconds after which a frame that
+                never came back is given up on and its slot reused
+        """
+        if kind not in POOL_KINDS:
+            raise ValueError(f"Unknown encode pool kind: {kind}")
+        self.workers = max(1, workers)
+        self.kind = kind
+        self.slot_count = slots or self.workers * 2
+        self.run_blocking = run_blocking or (lambda func, *args: func(*args))
+        self.free: queue.Queue = queue.Queue()
+        for slot in range(self.slot_count):
+            self.free.put(slot)
+        self.shared: List[Any] = [None] * self.slot_count  # process mode: SharedMemory per slot
+        self.streams: Dict[int, EncodeStream] = {}
+        self.started = False
+        self.closed = False
+        self.lock = threading.Lock()
+        self.threads: List[threading.Thread] = []
+        self.processes: List[Any] = []
+        self.readers: List[Any] = []  # process mode: result pipe per worker
+        self.current = None  # process mode: slot each worker is encoding
+        self.inflight: Dict[int, Tuple[int, int, float]] = {}  # slot -> (stream_id, seq, submitted)
+        self.task_timeout = task_timeout
+        self.restarts = 0
+        self.context = None
+        self.tasks = None
+
+    def stream(self) -> EncodeStream:
+        """New ordered submission stream (one per camera)"""
+        with self.lock:
+            stream = EncodeStream(self, len(self.streams))
+            self.streams[stream.stream_id] = stream
+            return stream
+
+    def start(self):
+        """Start the workers; called on first submit"""
+        with self.lock:
+            if self.started or self.closed:
+                return
+            self.started = True
+            if self.kind == 'thread':
+                self.tasks = queue.Queue()
+                for i in range(self.workers):
+                    thread = threading.Thread(target=self._thread_worker, daemon=True, name=f'encode-{i}')
+                    thread.start()
+                    self.threads.append(thread)
+            else:
+                # spawn everywhere: forking a process that runs camera threads
+                # (or an eventlet hub) is not safe. SimpleQueue has no feeder
+                # thread, which green threads in the workers would starve.
+                self.context = multiprocessing.get_context('spawn')
+                self.tasks = self.context.SimpleQueue()
+                self.current = self.context.Array('i', [-1] * self.workers, lock=False)
+                for i in range(self.workers):
+                    process, reader = self._spawn(i)
+                    self.processes.append(process)
+                    self.readers.append(reader)
+                collector = threading.Thread(target=self._collect, daemon=True, name='encode-results')
+                collector.start()
+                self.threads.append(collector)
+        logger.info(f"Encode pool: {self.workers} {self.kind} workers, {self.slot_count} slots")
+
+    def _spawn(self, index: int):
+        """Start worker process index, returns (process, result reader)"""
+        reader, writer = self.context.Pipe(duplex=False)
+        process = self.context.Process(target=process_worker, args=(self.tasks, writer, self.current, index),
+                                       daemon=True, name=f'encode-{index}')
+        with _main_hidden():
+            process.start()
+        writer.close()  # The worker has its own copy; EOF once it exits
+        return process, reader
+
+    def _submit(self, stream: EncodeStream, seq: int, image: np.ndarray, quality: int,
+                width: Optional[int]) -> bool:
+        if not self.started:
+            self.start()
+        if self.closed:
+            return False
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            return False
+
+        if self.kind == 'thread':
+            self.tasks.put((stream, seq, slot, image, quality, width))
+            return True
+
+        shm = self._slot_memory(slot, image.nbytes)
+        view = np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)
+        view[...] = image
+        del view
+        with self.lock:
+            self.inflight[slot] = (stream.stream_id, seq, time.monotonic())
+        self.tasks.put((stream.stream_id, seq, slot, shm.name, image.shape, image.dtype.str, quality, width))
+        return True
+
+    def _slot_memory(self, slot: int, size: int):
+        """Shared block for a slot, reallocated if frames got bigger"""
+        from multiprocessing import shared_memory
+        shm = self.shared[slot]
+        if shm is not None and shm.size >= size:
+            return shm
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        shm = self.shared[slot] = shared_memory.SharedMemory(create=True, size=size)
+        return shm
+
+    def _thread_worker(self):
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+            stream, seq, slot, image, quality, width = task
+            start = time.perf_counter()
+            try:
+                jpeg = self.run_blocking(encode_image, image, quality, width)
+            except Exception as e:
+                logger.error(f"Encode error: {e}")
+                jpeg = None
+            self.free.put(slot)
+            stream._complete(seq, jpeg, time.perf_counter() - start)
+
+    def _collect(self):
+        """Process mode: route results back to their streams, replace dead workers"""
+        while not self.closed:
+            readers = list(self.readers)
+            sentinels = [process.sentinel for process in self.processes]
+            ready = self.run_blocking(wait, readers + sentinels, 1.0)
+            for reader in readers:
+                if reader in ready:
+                    self._receive(reader)
+            for index, sentinel in enumerate(sentinels):
+                if sentinel in ready and not self.closed:
+                    self._replace(index)
+            self._expire()
+
+    def _receive(self, reader):
+        """Deliver every result waiting on a worker's pipe"""
+        try:
+            while reader.poll():
+                stream_id, seq, slot, jpeg, seconds = reader.recv()
+                self._finish(slot, stream_id, seq, jpeg, seconds)
+        except (EOFError, OSError):
+            pass  # Worker exited; its sentinel is handled by the collector
+
+    def _finish(self, slot: int, stream_id: int, seq: int, jpeg: Optional[bytes], seconds: float):
+        with self.lock:
+            if self.inflight.get(slot, (None, None))[:2] != (stream_id, seq):
+                return  # Already given up on, the slot may be in use again
+            del self.inflight[slot]
+        self.free.put(slot)
+        self.streams[stream_id]._complete(seq, jpeg, seconds)
+
+    def _abandon(self, slot: int):
+        """Give up on the frame in a slot: free it and deliver a failed encode"""
+        with self.lock:
+            task = self.inflight.get(slot)
+        if task is not None:
+            stream_id, seq, _ = task
+            self._finish(slot, stream_id, seq, None, 0.0)
+
+    def _replace(self, index: int):
+        """Worker index died: recover its frame and start a new worker"""
+        process, reader = self.processes[index], self.readers[index]
+        self._receive(reader)  # Results it sent before dying
+        lost = self.current[index]
+        self.current[index] = -1
+        if lost >= 0:
+            self._abandon(lost)
+        reader.close()
+        self.restarts += 1
+        logger.warning(f"Encode worker {process.name} exited with code {process.exitcode}, restarting")
+        self.processes[index], self.readers[index] = self._spawn(index)
+
+    def _expire(self):
+        """Give up on frames that never came back (worker died before marking them)"""
+        deadline = time.monotonic() - self.task_timeout
+        with self.lock:
+            stale = [slot for slot, (_, _, submitted) in self.inflight.items() if submitted < deadline]
+        for slot in stale:
+            logger.warning(f"Encode of slot {slot} timed out")
+            self._abandon(slot)
+
+    def close(self):
+        """Stop the workers and release shared memory"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            started = self.started
+        if not started:
+            return
+
+        if self.kind == 'thread':
+            for _ in self.threads:
+                self.tasks.put(None)
+            for thread in self.threads:
+                thread.join(timeout=2)
+            return
+
+        for _ in self.processes:
+            self.tasks.put(None)
+        for process in self.processes:
+            process.join(timeout=2)
+            if process.is_alive():
+                process.terminate()
+        for thread in self.threads:
+            thread.join(timeout=2)  # The collector sees closed within a second
+        for reader in self.readers:
+            reader.close()
+        for shm in self.shared:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+        self.shared = [None] * self.slot_count
+
+    def describe(self) -> dict:
+        return {
+            'kind': self.kind,
+            'workers': self.workers,
+            'slots': self.slot_count,
+            'in_flight': self.slot_count - self.free.qsize(),
+            'dropped': sum(stream.dropped for stream in list(self.streams.values())),
+            'restarts': self.restarts
+        }
@@ -0,0 +1,65 @@
+"""
+Encode Worker - Entry point of EncodePool worker processes
+
+Kept apart from encode_pool and the server so a spawned worker only
+imports numpy and OpenCV before it starts encoding. EncodePool also starts
+workers without re-running the server's __main__ module.
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+def encode_image(image: np.ndarray, quality: int, width: Optional[int]) -> Optional[bytes]:
+    """Resize (if asked) and JPEG-encode one BGR frame"""
+    import cv2
+    if width and width < image.shape[1]:
+        height = max(1, round(image.shape[0] * width / image.shape[1]))
+        image = cv2.resize(image, (width, height), None, 0, 0, cv2.INTER_AREA)
+    ok, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+    return buffer.tobytes() if ok else None
+
+
+def _attach(name: str):
+    from multiprocessing import shared_memory
+    try:
+        # Python 3.13+: the parent owns the block, don't track it here
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+def process_worker(tasks, results, current, index: int):
+    """
+    Worker process: encode frames read straight out of shared memory.
+
+    current[index] holds the slot being encoded (-1 when idle), so the
+    pool knows which frame was lost if this process dies.
+    """
+    attached: Dict[int, Any] = {}  # slot -> SharedMemory
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        stream_id, seq, slot, name, shape, dtype, quality, width = task
+        current[index] = slot
+        shm = attached.get(slot)
+        if shm is None or shm.name.lstrip('/') != name.lstrip('/'):
+            if shm is not None:
+                shm.close()  # Slot was reallocated for bigger frames
+            shm = attached[slot] = _attach(name)
+
+        start = time.perf_counter()
+        try:
+            image = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+            jpeg = encode_image(image, quality, width)
+            del image  # Release the view so the block can be closed
+        except Exception:
+            jpeg = None
+        results.send((stream_id, seq, slot, jpeg, time.perf_counter() - start))
+        current[index] = -1
+
+    for shm in attached.values():
+        shm.close()
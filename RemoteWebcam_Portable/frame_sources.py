@@ -0,0 +1,350 @@
+"""
+Frame Sources - Pluggable capture backends for WebcamStreamer
+
+Backends:
+    dshow      DirectShow camera (Windows)
+    v4l2       Video4Linux2 camera (Linux)
+    file       Video file, looped and paced at its native frame rate
+    synthetic  Deterministic NumPy test pattern (no camera needed)
+"""
+
+import logging
+import sys
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from lazy_import import LazyModule
+
+cv2 = LazyModule('cv2')  # imported when the first source opens
+
+logger = logging.getLogger(__name__)
+
+
+def fourcc_to_str(value) -> str:
+    """Decode a CAP_PROP_FOURCC value into its four characters"""
+    value = int(value)
+    return ''.join(chr((value >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00')
+
+
+class FrameSource:
+    """Base class for anything WebcamStreamer can capture from"""
+
+    kind = 'base'
+    passthrough = False  # True when read_jpeg() returns camera-encoded JPEG
+
+    def __init__(self, width: int = 640, height: int = 480, fps: float = 30,
+                 pixel_format: Optional[str] = None):
+        # Requested mode; open() replaces these with what was negotiated
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.pixel_format = pixel_format
+
+    def open(self) -> bool:
+        """Open the source, returns False if it is unavailable"""
+        raise NotImplementedError
+
+    def read(self) -> Optional[np.ndarray]:
+        """Return the next BGR frame, blocking until it is available"""
+        raise NotImplementedError
+
+    def read_jpeg(self) -> Optional[bytes]:
+        """Return the next frame as the camera's own JPEG (passthrough only)"""
+        return None
+
+    def close(self):
+        """Release the source"""
+
+    def describe(self) -> dict:
+        """Negotiated capture mode"""
+        return {
+            'kind': self.kind,
+            'width': self.width,
+            'height': self.height,
+            'fps': self.fps,
+            'pixel_format': self.pixel_format,
+            'passthrough': self.passthrough
+        }
+
+
+class OpenCVCameraSource(FrameSource):
+    """Camera opened through cv2.VideoCapture with a specific backend"""
+
+    kind = 'opencv'
+    backend = 'CAP_ANY'  # cv2 capture API constant, looked up when opening
+
+    def __init__(self, index: int = 0, passthrough: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.index = index
+        self.passthrough = passthrough
+        self.capture = None
+
+    def open(self) -> bool:
+        self.capture = cv2.VideoCapture(self.index, getattr(cv2, self.backend))
+        if not self.capture.isOpened():
+            logger.error(f"Failed to open {self.kind} camera {self.index}")
+            self.close()
+            return False
+
+        if self.passthrough:
+            self.pixel_format = 'MJPG'
+
+        # FOURCC has to be set before the resolution on most drivers
+        if self.pixel_format:
+            self.capture.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*self.pixel_format))
+        self.capture.set(cv2.CAP_PROP_FRAME_WIDTH, self.width)
+        self.capture.set(cv2.CAP_PROP_FRAME_HEIGHT, self.height)
+        self.capture.set(cv2.CAP_PROP_FPS, self.fps)
+        self._negotiate()
+
+        if self.passthrough:
+            self._enable_passthrough()
+        return True
+
+    def _negotiate(self):
+        """Read back the mode the driver actually accepted"""
+        requested = (self.width, self.height, self.fps, self.pixel_format)
+
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)) or self.width
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)) or self.height
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or self.fps
+        self.pixel_format = fourcc_to_str(self.capture.get(cv2.CAP_PROP_FOURCC)) or self.pixel_format
+
+        negotiated = (self.width, self.height, self.fps, self.pixel_format)
+        if negotiated != requested:
+            logger.info(f"Camera {self.index} negotiated {self.width}x{self.height}"
+                        f"@{self.fps:g} {self.pixel_format} (requested "
+                        f"{requested[0]}x{requested[1]}@{requested[2]:g} {requested[3]})")
+
+    def _enable_passthrough(self):
+        """
+        Ask the driver for undecoded MJPG buffers.
+
+        Falls back to normal decoding if the camera did not agree to MJPG or
+        the backend still hands us decoded pixels.
+        """
+        if self.pixel_format == 'MJPG' and self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+            ret, buffer = self.capture.read()
+            if ret and buffer is not None and buffer.ndim <= 2 and buffer.size > 2:
+                data = buffer.reshape(-1)
+                if data[0] == 0xFF and data[1] == 0xD8:  # JPEG SOI marker
+                    logger.info(f"Camera {self.index}: MJPEG passthrough enabled")
+                    return
+
+        logger.info(f"Camera {self.index}: MJPEG passthrough unavailable, decoding frames")
+        self.capture.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+        self.passthrough = False
+
+    def read(self) -> Optional[np.ndarray]:
+        if self.capture is None:
+            return None
+        if self.passthrough:
+            data = self.read_jpeg()
+            if data is None:
+                return None
+            return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        ret, frame = self.capture.read()
+        return frame if ret else None
+
+    def read_jpeg(self) -> Optional[bytes]:
+        if self.capture is None or not self.passthrough:
+            return None
+        ret, buffer = self.capture.read()
+        return buffer.tobytes() if ret and buffer is not None else None
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class DirectShowSource(OpenCVCameraSource):
+    """DirectShow camera (Windows)"""
+
+    kind = 'dshow'
+    backend = 'CAP_DSHOW'
+
+
+class V4L2Source(OpenCVCameraSource):
+    """Video4Linux2 camera (Linux)"""
+
+    kind = 'v4l2'
+    backend = 'CAP_V4L2'
+
+
+class FileSource(FrameSource):
+    """Video file played in a loop at its own frame rate, like a camera"""
+
+    kind = 'file'
+
+    def __init__(self, path: str, loop: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+        self.loop = loop
+        self.capture = None
+        self.next_frame_time = 0.0
+
+    def open(self) -> bool:
+        self.capture = cv2.VideoCapture(self.path)
+        if not self.capture.isOpened():
+            logger.error(f"Failed to open video file {self.path}")
+            self.close()
+            return False
+
+        self.width = int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        self.height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or self.fps
+        self.pixel_format = 'BGR3'
+        self.next_frame_time = time.monotonic()
+        return True
+
+    def read(self) -> Optional[np.ndarray]:
+        if self.capture is None:
+            return None
+
+        ret, frame = self.capture.read()
+        if not ret and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.capture.read()
+        if not ret:
+            return None
+
+        # Pace playback so consumers see the file's real frame rate
+        self.next_frame_time += 1.0 / self.fps
+        delay = self.next_frame_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self.next_frame_time = time.monotonic()
+        return frame
+
+    def close(self):
+        if self.capture is not None:
+            self.capture.release()
+            self.capture = None
+
+
+class SyntheticSource(FrameSource):
+    """
+    Deterministic moving test pattern.
+
+    Frame N is always the same image, so runs are reproducible. With
+    realtime=False frames are produced as fast as they are read, which is
+    what throughput benchmarks want.
+    """
+
+    kind = 'synthetic'
+
+    def __init__(self, realtime: bool = True, **kwargs):
+        super().__init__(**kwargs)
+        self.realtime = realtime
+        self.frame_index = 0
+        self.background = None
+        self.next_frame_time = 0.0
+
+    def open(self) -> bool:
+        # Static gradient background, computed once
+        x = np.linspace(0, 255, self.width, dtype=np.uint8)
+        y = np.linspace(0, 255, self.height, dtype=np.uint8)
+        self.background = np.empty((self.height, self.width, 3), dtype=np.uint8)
+        self.background[:, :, 0] = x[np.newaxis, :]
+        self.background[:, :, 1] = y[:, np.newaxis]
+        self.background[:, :, 2] = 128
+
+        self.pixel_format = 'BGR3'
+        self.frame_index = 0
+        self.next_frame_time = time.monotonic()
+        return True
+
+    def read(self) -> Optional[np.ndarray]:
+        if self.background is None:
+            return None
+
+        if self.realtime:
+            self.next_frame_time += 1.0 / self.fps
+            delay = self.next_frame_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                self.next_frame_time = time.monotonic()
+
+        index = self.frame_index
+        self.frame_index += 1
+
+        frame = self.background.copy()
+        bar = max(8, self.width // 20)
+        x = (index * 4) % (self.width - bar)
+        frame[:, x:x + bar] = 255
+        cv2.putText(frame, f'{index:08d}', (10, self.height - 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2)
+        return frame
+
+    def close(self):
+        self.background = None
+
+
+FRAME_SOURCES = {
+    'dshow': DirectShowSource,
+    'v4l2': V4L2Source,
+    'file': FileSource,
+    'synthetic': SyntheticSource,
+}
+
+
+def resolve_kind(kind: str) -> str:
+    """Map 'auto' to the platform's camera backend"""
+    if kind == 'auto':
+        return 'dshow' if sys.platform == 'win32' else 'v4l2'
+    return kind
+
+
+def probe_cameras(kind: str = 'auto', max_index: int = 4) -> List[int]:
+    """
+    Find camera indexes that can be opened with a camera backend.
+
+    Returns:
+        list: Openable indexes (empty for non-camera sources)
+    """
+    source_class = FRAME_SOURCES.get(resolve_kind(kind))
+    if source_class is None or not issubclass(source_class, OpenCVCameraSource):
+        return []
+
+    found = []
+    for index in range(max_index):
+        capture = cv2.VideoCapture(index, getattr(cv2, source_class.backend))
+        if capture.isOpened():
+            found.append(index)
+        capture.release()
+    logger.info(f"Found cameras at indexes {found}")
+    return found
+
+
+def create_frame_source(kind: str = 'auto', **options) -> FrameSource:
+    """
+    Build a frame source by name.
+
+    Args:
+        kind: 'auto' (DirectShow on Windows, V4L2 elsewhere) or a key of
+            FRAME_SOURCES
+        options: Backend arguments (index, path, width, height, fps,
+            pixel_format, ...). Options a backend does not take are ignored.
+
+    Returns:
+        FrameSource: Unopened source
+    """
+    kind = resolve_kind(kind)
+    if kind not in FRAME_SOURCES:
+        raise ValueError(f"Unknown frame source '{kind}', expected one of {sorted(FRAME_SOURCES)}")
+
+    source_class = FRAME_SOURCES[kind]
+    accepted = {'width', 'height', 'fps', 'pixel_format'}
+    if issubclass(source_class, OpenCVCameraSource):
+        accepted.update(('index', 'passthrough'))
+    elif source_class is FileSource:
+        accepted.update(('path', 'loop'))
+    elif source_class is SyntheticSource:
+        accepted.add('realtime')
+
+    return source_class(**{k: v for k, v in options.items() if k in accepted and v is not None})
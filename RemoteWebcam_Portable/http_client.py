@@ -0,0 +1,39 @@
+"""
+HTTP Client - One pooled session for all outbound HTTP
+
+Public IP lookups, the ngrok API and the signaling client's HTTP
+transport share a single requests.Session, so repeated calls reuse
+keep-alive connections (and TLS sessions) instead of opening a new
+connection every time. requests is imported on first use to keep it off
+the startup path.
+"""
+
+import threading
+
+POOL_CONNECTIONS = 8  # distinct hosts kept in the pool
+POOL_MAXSIZE = 8  # connections per host
+
+_session = None
+_lock = threading.Lock()
+
+
+def session():
+    """The shared requests.Session, created on first use"""
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                pooled = requests.Session()
+                # Retries are the callers' business (backoff, fallbacks)
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+                pooled.mount('http://', adapter)
+                pooled.mount('https://', adapter)
+                _session = pooled
+    return _session
+
+
+def get(url: str, timeout: float = 5, **kwargs):
+    """GET through the shared session"""
+    return session().get(url, timeout=timeout, **kwargs)
@@ -0,0 +1,35 @@
+"""
+Lazy Import - Defer heavy imports until first use
+
+OpenCV takes a noticeable part of startup and is not needed to bind the
+server or answer /health. Modules hold a LazyModule in place of the real
+module and the import happens on the first attribute access, typically
+when a camera is opened.
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    """Stand-in for a module that imports it on first attribute access"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        # Only called for attributes not set in __init__
+        module = self._module or self._load()
+        return getattr(module, attr)
+
+    @property
+    def loaded(self) -> bool:
+        return self._module is not None
@@ -0,0 +1,108 @@
+"""
+Local Relay - Stand-in for the cloud signaling relay
+
+Speaks the part of the relay protocol a device uses (device_register,
+join_device, offer/answer/ICE relaying) so reconnect behaviour can be
+tested on one machine, without a network. /api/relay/status reports the
+registered devices and every connect and registration with its time.
+
+Usage:
+    python local_relay.py --port 5100
+    SIGNALING_SERVER=http://127.0.0.1:5100 python main.py
+"""
+
+import argparse
+import logging
+import time
+from typing import Dict, List
+
+from flask import Flask, jsonify, request
+from flask_socketio import SocketIO, emit, join_room
+
+logger = logging.getLogger(__name__)
+
+app = Flask(__name__)
+socketio = SocketIO(app, async_mode='threading', cors_allowed_origins='*', logger=False, engineio_logger=False)
+
+devices: Dict[str, dict] = {}  # device_id -> registration + sid
+connects: List[float] = []  # connect times, for spotting reconnect stampedes
+registrations: List[dict] = []  # {'device_id', 'time'}
+
+
+@socketio.on('connect')
+def on_connect():
+    connects.append(time.time())
+
+
+@socketio.on('disconnect')
+def on_disconnect(*args):
+    for device_id, info in list(devices.items()):
+        if info['sid'] == request.sid:
+            del devices[device_id]
+
+
+@socketio.on('device_register')
+def on_device_register(data):
+    device_id = data.get('device_id')
+    if not device_id:
+        emit('device_registered', {'success': False, 'message': 'device_id required'})
+        return
+    devices[device_id] = dict(data, sid=request.sid, registered_at=time.time())
+    devices[device_id].pop('password', None)
+    registrations.append({'device_id': device_id, 'time': time.time()})
+    emit('device_registered', {'success': True, 'device_id': device_id})
+
+
+@socketio.on('join_device')
+def on_join_device(data):
+    join_room(f"device:{data.get('device_id')}")
+    emit('joined_device', {'device_id': data.get('device_id')})
+
+
+@socketio.on('offer')
+def on_offer(data):
+    emit('offer', dict(data, **{'from': request.sid}), to=f"device:{data.get('device_id')}")
+
+
+@socketio.on('answer')
+def on_answer(data):
+    emit('answer', dict(data, **{'from': request.sid}), to=data.get('to'))
+
+
+@socketio.on('ice_candidate')
+def on_ice_candidate(data):
+    emit('ice_candidate', dict(data, **{'from': request.sid}), to=data.get('to'))
+
+
+@socketio.on('ice_candidates')
+def on_ice_candidates(data):
+    emit('ice_candidates', dict(data, **{'from': request.sid}), to=data.get('to'))
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'online'})
+
+
+@app.route('/api/relay/status', methods=['GET'])
+def status():
+    return jsonify({
+        'devices': {device_id: {key: value for key, value in info.items() if key != 'sid'}
+                    for device_id, info in devices.items()},
+        'connects': connects,
+        'registrations': registrations
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the signaling relay')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5100)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    logger.info(f"Local relay on http://{args.host}:{args.port}")
+    socketio.run(app, host=args.host, port=args.port, debug=False, allow_unsafe_werkzeug=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,7 +3,39 @@ Remote Webcam Streaming System - Desktop Application
 Runs as Windows service with embedded signaling server and WebRTC streaming
 """
 
+import os
+
+if __name__ == '__main__':
+    # Frozen builds start encode worker processes as this executable; hand
+    # them over before the server's imports run
+    import multiprocessing
+    multiprocessing.freeze_support()
+
+# Server async mode: 'auto' (eventlet, then gevent, then threading),
+# 'eventlet', 'gevent' or 'threading' (Werkzeug dev server). Monkey patching
+# has to happen before anything else imports socket/threading.
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'auto')
+if ASYNC_MODE in ('auto', 'eventlet'):
+    try:
+        import eventlet
+        eventlet.monkey_patch()
+        ASYNC_MODE = 'eventlet'
+    except ImportError:
+        if ASYNC_MODE == 'eventlet':
+            raise
+if ASYNC_MODE in ('auto', 'gevent'):
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+        ASYNC_MODE = 'gevent'
+    except ImportError:
+        if ASYNC_MODE == 'gevent':
+            raise
+if ASYNC_MODE == 'auto':
+    ASYNC_MODE = 'threading'
+
 import asyncio
+import functools
 import json
 import logging
 import socket
@@ -11,18 +43,41 @@ import sys
 import threading
 import time
 import hashlib
-import os
+import hmac
+import importlib.util
 from datetime import datetime
-from typing import Dict, Set, Optional
+from typing import Dict, List, Set, Optional, Tuple
 
-import cv2
 import numpy as np
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from flask_socketio import SocketIO, emit, join_room, leave_room
-import requests
 import socketio as client_socketio
 
+from bitrate import AdaptiveBitrate
+from device_registry import DeviceRegistry
+from encode_pool import EncodePool
+from frame_sources import create_frame_source, probe_cameras
+import http_client
+from lazy_import import LazyModule
+from metrics import REGISTRY, Counter, Gauge, Histogram
+from motion_detector import MotionDetector
+import network_info
+from presence import PresenceTracker
+from recorder import Recorder, RetentionPolicy
+from recording_index import RecordingIndex
+from session_auth import TokenAuthority, extract_token
+from signaling import CandidateBatcher, ICE_BATCH_FEATURE, is_end_of_candidates
+from signaling_client import Backoff, SignalingClient
+from snapshots import SnapshotCache
+from state_backend import create_backend
+from transforms import TransformPipeline, parse_rect, parse_rects
+
+cv2 = LazyModule('cv2')  # only needed once a camera is in use
+# aiortc and av take seconds to import, so WebRTC is loaded on the first offer
+webrtc_helper = LazyModule('webrtc_helper')
+WEBRTC_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ('aiortc', 'av'))
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -34,15 +89,139 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+def offload(func, *args):
+    """
+    Run blocking camera/encode work on a real OS thread.
+    
+    Under eventlet/gevent a cv2 call would otherwise stall the whole event
+    loop; in threading mode the caller already is an OS thread.
+    """
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args)
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+
 # Fixed password for authentication
 FIXED_PASSWORD = "luohino"
 PASSWORD_HASH = hashlib.sha256(FIXED_PASSWORD.encode()).hexdigest()
 
+# Session tokens issued at login. Set SESSION_SECRET to keep tokens valid
+# across restarts, otherwise a random key is generated per process.
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '')
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 12 * 3600))
+
 # Signaling server URL
 SIGNALING_SERVER_URL = os.environ.get('SIGNALING_SERVER', 'https://connection-iyj0.onrender.com')
+# Reconnects to it back off exponentially with full jitter, the delay bound
+# growing from SIGNALING_RECONNECT_MIN to SIGNALING_RECONNECT_MAX seconds
+SIGNALING_RECONNECT_MIN = float(os.environ.get('SIGNALING_RECONNECT_MIN', 1))
+SIGNALING_RECONNECT_MAX = float(os.environ.get('SIGNALING_RECONNECT_MAX', 60))
 
 # Local server port
-HTTP_PORT = 5000
+HTTP_PORT = int(os.environ.get('HTTP_PORT', 5000))
+
+# Frame source: 'auto' (DirectShow on Windows, V4L2 elsewhere), 'dshow',
+# 'v4l2', 'file' (FRAME_SOURCE_PATH) or 'synthetic'
+FRAME_SOURCE = os.environ.get('FRAME_SOURCE', 'auto')
+FRAME_SOURCE_PATH = os.environ.get('FRAME_SOURCE_PATH', '')
+CAMERA_INDEX = int(os.environ.get('CAMERA_INDEX', 0))
+# Cameras to serve: comma separated indexes ('0,1,2'), 'auto' to probe the
+# first MAX_CAMERAS indexes, or empty for just CAMERA_INDEX
+CAMERAS = os.environ.get('CAMERAS', '')
+MAX_CAMERAS = int(os.environ.get('MAX_CAMERAS', 4))
+CAMERA_WIDTH = int(os.environ.get('CAMERA_WIDTH', 640))
+CAMERA_HEIGHT = int(os.environ.get('CAMERA_HEIGHT', 480))
+CAMERA_FPS = float(os.environ.get('CAMERA_FPS', 30))
+CAMERA_PIXEL_FORMAT = os.environ.get('CAMERA_PIXEL_FORMAT') or None  # e.g. MJPG, YUYV
+# Serve the camera's own MJPG frames without decoding/re-encoding when possible
+CAMERA_PASSTHROUGH = os.environ.get('CAMERA_PASSTHROUGH', '1') == '1'
+
+# Transforms applied to every frame before it is published, so before any
+# encode: TRANSFORM_CROP=x,y,w,h keeps a region of the source,
+# TRANSFORM_WIDTH=N downscales, TRANSFORM_MASKS=x,y,w,h;x,y,w,h blacks out
+# privacy rectangles (source pixels) and TRANSFORM_TIMESTAMP=<strftime
+# format> burns in the capture time. Any of them turns off passthrough.
+# Viewers can crop further with ?crop=x,y,w,h.
+TRANSFORM_CROP = parse_rect(os.environ.get('TRANSFORM_CROP', ''))
+TRANSFORM_WIDTH = int(os.environ.get('TRANSFORM_WIDTH', 0)) or None
+TRANSFORM_MASKS = parse_rects(os.environ.get('TRANSFORM_MASKS', ''))
+TRANSFORM_TIMESTAMP = os.environ.get('TRANSFORM_TIMESTAMP', '') or None
+TRANSFORMS_ENABLED = bool(TRANSFORM_CROP or TRANSFORM_WIDTH or TRANSFORM_MASKS or TRANSFORM_TIMESTAMP)
+
+# Camera lifecycle: the device opens for the first consumer and closes after
+# CAMERA_IDLE_TIMEOUT seconds without any (0 keeps it open). Frame pollers
+# and /api/stream/start hold a lease for the given number of seconds.
+CAMERA_IDLE_TIMEOUT = float(os.environ.get('CAMERA_IDLE_TIMEOUT', 30))
+FRAME_POLL_LEASE = float(os.environ.get('FRAME_POLL_LEASE', 10))
+STREAM_START_LEASE = float(os.environ.get('STREAM_START_LEASE', 60))
+
+# Only publish frames when the scene changes (plus a keyframe every N seconds)
+MOTION_DETECTION = os.environ.get('MOTION_DETECTION', '1') == '1'
+MOTION_THRESHOLD = float(os.environ.get('MOTION_THRESHOLD', 0.01))  # fraction of pixels changed
+MOTION_KEYFRAME_INTERVAL = float(os.environ.get('MOTION_KEYFRAME_INTERVAL', 5))
+
+# Recording: 'off', 'continuous' or 'motion' (motion and API triggers, with
+# the seconds before the trigger kept as pre-roll). The oldest segments are
+# deleted once RECORDINGS_MAX_GB is in use.
+RECORDING = os.environ.get('RECORDING', 'off')
+RECORDINGS_DIR = os.environ.get('RECORDINGS_DIR', 'recordings')
+RECORDING_SEGMENT_SECONDS = float(os.environ.get('RECORDING_SEGMENT_SECONDS', 60))
+RECORDING_PRE_ROLL = float(os.environ.get('RECORDING_PRE_ROLL', 10))
+RECORDING_POST_ROLL = float(os.environ.get('RECORDING_POST_ROLL', 15))
+RECORDINGS_MAX_BYTES = int(float(os.environ.get('RECORDINGS_MAX_GB', 10)) * 1024 ** 3)
+RECORDINGS_MAX_AGE = float(os.environ.get('RECORDINGS_MAX_DAYS', 0)) * 86400
+
+# Dashboard thumbnails: one kept every SNAPSHOT_INTERVAL seconds over the
+# last SNAPSHOT_HISTORY seconds, encoded at the 'low' quality tier
+SNAPSHOT_INTERVAL = float(os.environ.get('SNAPSHOT_INTERVAL', 5))
+SNAPSHOT_HISTORY = float(os.environ.get('SNAPSHOT_HISTORY', 300))
+
+# JPEG quality tiers: name -> (jpeg quality, max width or None for native)
+QUALITY_TIERS = {
+    'low': (50, 320),
+    'mid': (65, 480),
+    'high': (80, None),
+}
+DEFAULT_QUALITY_TIER = 'high'
+
+# Parallel encoding: with ENCODE_WORKERS > 0 the default tier is encoded by
+# a pool of ENCODE_POOL workers ('thread', or 'process' to hand frames over
+# through shared memory) instead of on the capture thread. Frames are still
+# published in capture order; when every slot is busy a frame is dropped.
+ENCODE_WORKERS = int(os.environ.get('ENCODE_WORKERS', 0))
+ENCODE_POOL = os.environ.get('ENCODE_POOL', 'thread')
+
+# Adaptive bitrate: each MJPEG viewer steps down in quality, size and frame
+# rate from the tier it asked for when its link cannot deliver frames within
+# ADAPTIVE_TARGET_LATENCY seconds (?adaptive=0 opts a viewer out). Where the
+# server exposes the socket its send buffer follows the link's throughput,
+# up to ADAPTIVE_SEND_BUFFER bytes, so frames cannot queue up unseen in the
+# kernel (0 leaves the buffer alone).
+ADAPTIVE_BITRATE = os.environ.get('ADAPTIVE_BITRATE', '1') == '1'
+ADAPTIVE_TARGET_LATENCY = float(os.environ.get('ADAPTIVE_TARGET_LATENCY', 0.5))
+ADAPTIVE_SEND_BUFFER = int(os.environ.get('ADAPTIVE_SEND_BUFFER', 64 * 1024))
+
+# Signaling: trickled ICE candidates are coalesced for this many seconds
+# for clients that accept batches (0 relays each one immediately).
+# SIGNALING_SERIALIZER=msgpack switches SocketIO to binary packets; every
+# client and the cloud relay must then use the msgpack parser too.
+ICE_BATCH_WINDOW = float(os.environ.get('ICE_BATCH_WINDOW', 0.03))
+SIGNALING_SERIALIZER = os.environ.get('SIGNALING_SERIALIZER', '')
+
+# Running several workers: STATE_BACKEND shares registered devices between
+# them (memory://, sqlite:///file.db on one machine, redis://host/0), and
+# SIGNALING_MESSAGE_QUEUE (e.g. redis://host/0) lets a worker emit to sids
+# and rooms connected to another one. Set SESSION_SECRET as well so every
+# worker accepts the same tokens. Devices expire after DEVICE_TTL seconds
+# without a heartbeat.
+STATE_BACKEND = os.environ.get('STATE_BACKEND', '')
+SIGNALING_MESSAGE_QUEUE = os.environ.get('SIGNALING_MESSAGE_QUEUE', '')
+DEVICE_TTL = float(os.environ.get('DEVICE_TTL', 90))
 
 # Device info
 DEVICE_NAME = socket.gethostname()
@@ -53,75 +232,875 @@ app = Flask(__name__)
 app.config['SECRET_KEY'] = 'luohino-secret-key-2024'
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-# Let Flask-SocketIO auto-detect async_mode (works with PyInstaller)
-socketio = SocketIO(app, cors_allowed_origins="*", logger=False, engineio_logger=False)
+# MJPEG streams, SocketIO and REST share one event loop unless in threading mode
+serializer_options = {'serializer': SIGNALING_SERIALIZER} if SIGNALING_SERIALIZER else {}
+socketio_options = dict(serializer_options)
+if SIGNALING_MESSAGE_QUEUE:
+    socketio_options['message_queue'] = SIGNALING_MESSAGE_QUEUE
+socketio = SocketIO(app, async_mode=ASYNC_MODE, cors_allowed_origins="*", logger=False, engineio_logger=False,
+                    **socketio_options)
 
 # Global state
-connected_devices: Dict[str, dict] = {}  # device_id -> device_info
-active_sessions: Dict[str, dict] = {}  # session_id -> session_info
+state_backend = create_backend(STATE_BACKEND)
+device_presence = PresenceTracker(DEVICE_TTL)  # online devices, cached /api/devices body
+device_registry = DeviceRegistry(state_backend, DEVICE_TTL, device_presence)  # device_id -> device_info
 camera_active = False
 camera_thread = None
 stop_camera_event = threading.Event()
+active_viewers: Dict[str, 'ViewerStats'] = {}  # viewer_id -> delivery stats
+viewers_lock = threading.Lock()
+authenticated_sids: Set[str] = set()  # SocketIO sids that presented a valid token
+AUTHENTICATED_ROOM = '_authenticated'  # SocketIO room of authenticated sids, receives presence updates
+DEVICE_SIDS = 'device_sids'  # state namespace: device_id -> {'sid', 'features', 'worker'} of its connection
+WORKER_ID = f'{socket.gethostname()}:{os.getpid()}'  # which worker holds a device's connection
+local_devices: Dict[str, str] = {}  # device_id -> sid, devices connected to this worker
+sid_features: Dict[str, Set[str]] = {}  # sid -> protocol features it advertised
+session_tokens = TokenAuthority(SESSION_SECRET.encode() or None, ttl=SESSION_TTL)
+
+# Metrics (exposed on /metrics)
+FRAME_BYTES_BUCKETS = (4096, 16384, 32768, 65536, 131072, 262144, 524288, 1048576)
+CAPTURE_SECONDS = Histogram('webcam_capture_seconds', 'Time spent reading a frame from the source', ['camera'])
+ENCODE_SECONDS = Histogram('webcam_encode_seconds', 'Time spent encoding one JPEG tier', ['tier'])
+FRAME_BYTES = Histogram('webcam_frame_bytes', 'Encoded JPEG size', ['tier'], buckets=FRAME_BYTES_BUCKETS)
+FRAMES_CAPTURED = Counter('webcam_frames_captured_total', 'Frames read from the source', ['camera'])
+FRAMES_PUBLISHED = Counter('webcam_frames_published_total', 'Frames published to viewers', ['camera'])
+FRAMES_UNCHANGED = Counter('webcam_frames_unchanged_total', 'Frames skipped by motion detection', ['camera'])
+READ_FAILURES = Counter('webcam_read_failures_total', 'Failed source reads', ['camera'])
+ENCODE_DROPPED = Counter('webcam_encode_dropped_total', 'Frames dropped because the encode pool was full', ['camera'])
+MJPEG_VIEWERS = Gauge('mjpeg_active_viewers', 'Connected MJPEG viewers', function=lambda: len(active_viewers))
+MJPEG_FRAMES_SENT = Counter('mjpeg_frames_sent_total', 'Frames sent to MJPEG viewers')
+MJPEG_FRAMES_DROPPED = Counter('mjpeg_frames_dropped_total', 'Frames skipped because a viewer was still writing')
+MJPEG_FRAME_AGE = Histogram('mjpeg_frame_age_seconds', 'Capture-to-send lag per MJPEG frame')
+SIGNALING_MESSAGES = Counter('signaling_messages_total', 'SocketIO signaling messages handled', ['event'])
+SIGNALING_SECONDS = Histogram('signaling_handler_seconds', 'SocketIO signaling handler latency', ['event'])
+SIGNALING_RELAYED = Counter('signaling_messages_relayed_total', 'SocketIO signaling messages sent on', ['event'])
+
+
+def instrument_signaling(event: str):
+    """Count and time a SocketIO signaling handler"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                SIGNALING_SECONDS.observe(time.perf_counter() - start, (event,))
+                SIGNALING_MESSAGES.inc(1, (event,))
+        return wrapper
+    return decorator
+
+
+def require_authentication(event: str):
+    """Reject a SocketIO handler unless the sid presented a token or password"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.sid not in authenticated_sids:
+                logger.warning(f"Rejected unauthenticated {event} from {request.sid}")
+                emit('unauthorized', {'event': event, 'message': 'Authentication required'})
+                return None
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class CachedFrame:
+    """
+    A captured frame plus its JPEG encodings, each made at most once.
+    
+    Frames from a passthrough camera arrive as JPEG: those bytes are seeded
+    as the native encoding and the pixels are only decoded if a viewer asks
+    for another tier.
+    """
+    
+    def __init__(self, seq: int, image: Optional[np.ndarray], timestamp: float,
+                 jpeg: Optional[bytes] = None, jpeg_key: Optional[Tuple[int, Optional[int]]] = None,
+                 width: int = 0):
+        self.seq = seq
+        self._image = image
+        self.timestamp = timestamp
+        self.width = image.shape[1] if image is not None else width
+        self.encoded: Dict[Tuple[int, Optional[int]], bytes] = {}
+        self.part_headers: Dict[int, bytes] = {}  # JPEG length -> MJPEG part header
+        self.derived: Dict[tuple, 'CachedFrame'] = {}  # viewer pipeline key -> transformed frame
+        self.lock = threading.RLock()
+        
+        if jpeg is not None:
+            self.encoded[jpeg_key] = jpeg
+        self.jpeg = jpeg
+    
+    @property
+    def image(self) -> Optional[np.ndarray]:
+        """BGR pixels, decoded on first access for passthrough frames"""
+        if self._image is None and self.jpeg is not None:
+            with self.lock:
+                if self._image is None:
+                    self._image = offload(cv2.imdecode, np.frombuffer(self.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return self._image
+    
+    def encode(self, quality: int, width: Optional[int] = None) -> Optional[bytes]:
+        """Return this frame as JPEG, encoding it on first request only"""
+        if width and width >= self.width:
+            width = None  # Upscaling is pointless, share the native entry
+        key = (quality, width)
+        data = self.encoded.get(key)
+        if data is not None:
+            return data
+        
+        with self.lock:
+            # Another viewer may have encoded it while we waited
+            data = self.encoded.get(key)
+            if data is not None:
+                return data
+            
+            image = self.image
+            if width:
+                height = max(1, round(image.shape[0] * width / image.shape[1]))
+                image = offload(cv2.resize, image, (width, height), None, 0, 0, cv2.INTER_AREA)
+            
+            start = time.perf_counter()
+            ok, buffer = offload(cv2.imencode, '.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+            if not ok:
+                return None
+            data = buffer.tobytes()
+            self.encoded[key] = data
+            
+            tier = (f'q{quality}_w{width or "native"}',)
+            ENCODE_SECONDS.observe(time.perf_counter() - start, tier)
+            FRAME_BYTES.observe(len(data), tier)
+            return data
+    
+    def transformed(self, pipeline: TransformPipeline) -> Optional['CachedFrame']:
+        """
+        This frame run through a viewer-level pipeline, done once per
+        pipeline config and shared (with its encodings) by every viewer
+        using the same one.
+        """
+        derived = self.derived.get(pipeline.key)
+        if derived is not None:
+            return derived
+        
+        with self.lock:
+            derived = self.derived.get(pipeline.key)
+            if derived is not None:
+                return derived
+            image = self.image
+            if image is None:
+                return None
+            derived = CachedFrame(self.seq, offload(pipeline.apply, image, self.timestamp), self.timestamp)
+            self.derived[pipeline.key] = derived
+            return derived
+    
+    def mjpeg_part(self, quality: int, width: Optional[int] = None) -> Optional[Tuple[bytes, bytes]]:
+        """
+        (multipart header, JPEG) for MJPEG delivery.
+        
+        Both are built once per frame and tier and shared by every viewer;
+        the header only depends on the payload length and capture time.
+        """
+        data = self.encode(quality, width)
+        if data is None:
+            return None
+        header = self.part_headers.get(len(data))
+        if header is None:
+            # X-Timestamp is the capture time, used to measure frame age
+            header = (f'--frame\r\nContent-Type: image/jpeg\r\n'
+                      f'Content-Length: {len(data)}\r\n'
+                      f'X-Timestamp: {self.timestamp:.6f}\r\n\r\n').encode()
+            self.part_headers[len(data)] = header
+        return header, data
+
+
+def parse_quality_args(args) -> Tuple[int, Optional[int]]:
+    """
+    Map ?q=low|mid|high and ?width=N query args to an encode key.
+    
+    Widths are clamped and rounded down to a multiple of 16 so arbitrary
+    client values collapse onto a small number of cache entries.
+    
+    Returns:
+        (jpeg quality, max width or None for native resolution)
+    """
+    tier = args.get('q', DEFAULT_QUALITY_TIER)
+    quality, width = QUALITY_TIERS.get(tier, QUALITY_TIERS[DEFAULT_QUALITY_TIER])
+    
+    requested_width = args.get('width', type=int)
+    if requested_width:
+        width = max(64, min(requested_width, 4096)) // 16 * 16
+    
+    return quality, width
+
+
+# Viewer crops, one pipeline per distinct crop (bounded)
+viewer_pipelines: Dict[tuple, TransformPipeline] = {}
+MAX_VIEWER_PIPELINES = 32
+
+
+def parse_view_args(args) -> Optional[TransformPipeline]:
+    """
+    Map ?crop=x,y,w,h to a shared viewer pipeline, None without a crop.
+    
+    The rectangle is snapped outwards to a 16 px grid so nearby client
+    values collapse onto the same pipeline and its cached output.
+    """
+    crop = parse_rect(args.get('crop', ''))
+    if crop is None:
+        return None
+    x, y, w, h = crop
+    x0, y0 = x // 16 * 16, y // 16 * 16
+    crop = (x0, y0, -(-(x + w - x0) // 16) * 16, -(-(y + h - y0) // 16) * 16)
+    
+    pipeline = viewer_pipelines.get(crop)
+    if pipeline is None:
+        pipeline = TransformPipeline(crop=crop)
+        if len(viewer_pipelines) < MAX_VIEWER_PIPELINES:
+            viewer_pipelines[crop] = pipeline
+    return pipeline
+
+
+def camera_source_config(index: int) -> dict:
+    """Frame source config for one camera index from the CAMERA_* settings"""
+    return {
+        'kind': FRAME_SOURCE,
+        'index': index,
+        'path': FRAME_SOURCE_PATH,
+        'width': CAMERA_WIDTH,
+        'height': CAMERA_HEIGHT,
+        'fps': CAMERA_FPS,
+        'pixel_format': CAMERA_PIXEL_FORMAT,
+        # Transforms need pixels, not the camera's JPEG
+        'passthrough': CAMERA_PASSTHROUGH and not TRANSFORMS_ENABLED
+    }
 
 
 class WebcamStreamer:
-    """Handles webcam capture and streaming"""
+    """Handles webcam capture and streaming
+
+    A single capture thread owns the camera: it grabs each frame once and
+    publishes it into a shared latest-frame slot. Viewers never touch the
+    device, they read the slot (or wait for the next sequence number) and
+    ask the CachedFrame for the quality tier they want, so encode cost
+    scales with the number of distinct tiers rather than viewers.
+    
+    Each instance has its own thread, lock and condition, so several
+    cameras capture and encode in parallel without serializing.
+    
+    Consumers (MJPEG viewers, WebRTC tracks, frame pollers, explicit
+    starts) register with acquire()/touch() and leave with release(). The
+    device is opened for the first consumer and closed by the capture
+    thread once it has had none for CAMERA_IDLE_TIMEOUT seconds.
+    """
     
-    def __init__(self):
-        self.camera = None
+    def __init__(self, camera_id: str = 'cam0', source_config: Optional[dict] = None):
+        self.camera_id = camera_id
+        self.metric_labels = (camera_id,)
+        self.source_config = source_config or camera_source_config(CAMERA_INDEX)
+        self.camera = None  # FrameSource while streaming
         self.is_streaming = False
-        self.frame_queue = []
-        self.max_queue_size = 30
+        self.capture_thread = None
         
+        # consumer_id -> lease expiry (monotonic), or None until released
+        self.consumers: Dict[str, Optional[float]] = {}
+        self.idle_since: Optional[float] = None
+        self.lifecycle_lock = threading.Lock()
+        
+        self.default_quality = QUALITY_TIERS[DEFAULT_QUALITY_TIER]
+        self.motion = MotionDetector(
+            threshold=MOTION_THRESHOLD,
+            keyframe_interval=MOTION_KEYFRAME_INTERVAL
+        ) if MOTION_DETECTION else None
+        self.recorder: Optional[Recorder] = None
+        self.transforms = TransformPipeline(
+            TRANSFORM_CROP, TRANSFORM_WIDTH, TRANSFORM_MASKS, TRANSFORM_TIMESTAMP
+        ) if TRANSFORMS_ENABLED else None
+        self.encoder = encode_pool.stream() if encode_pool else None
+        if self.encoder:
+            self.encoder.on_encoded = self._publish_encoded
+        low_quality, low_width = QUALITY_TIERS['low']
+        self.snapshots = SnapshotCache(camera_id, low_quality, low_width,
+                                       SNAPSHOT_INTERVAL, SNAPSHOT_HISTORY)
+        
+        # Latest-frame slot, guarded by frame_ready. Older frames (and
+        # their encodings) are evicted simply by being replaced here.
+        self.frame_ready = threading.Condition()
+        self.frame_seq = 0
+        self.latest_frame: Optional[CachedFrame] = None
+        
+    def acquire(self, consumer_id: str, lease: Optional[float] = None) -> bool:
+        """
+        Register a consumer, opening the camera if it is the first one.
+        
+        Args:
+            consumer_id: Unique id of the viewer/track/client
+            lease: Seconds the registration lasts unless renewed, or None
+                to hold it until release()
+        
+        Returns:
+            bool: False if the camera could not be opened
+        """
+        with self.lifecycle_lock:
+            self.consumers[consumer_id] = time.monotonic() + lease if lease else None
+            self.idle_since = None
+            if self.is_streaming:
+                return True
+            
+            started = self._start_locked()
+            if not started:
+                self.consumers.pop(consumer_id, None)
+            return started
+    
+    def touch(self, consumer_id: str, lease: float = FRAME_POLL_LEASE) -> bool:
+        """Register or renew a leased consumer (e.g. a frame poller)"""
+        return self.acquire(consumer_id, lease)
+    
+    def release(self, consumer_id: str):
+        """Drop a consumer; the camera closes once it has been idle long enough"""
+        with self.lifecycle_lock:
+            self.consumers.pop(consumer_id, None)
+    
+    def consumer_count(self) -> int:
+        now = time.monotonic()
+        return sum(1 for expiry in list(self.consumers.values()) if expiry is None or expiry > now)
+    
+    def _check_idle(self):
+        """Called from the capture thread: close the camera if nobody is watching"""
+        if CAMERA_IDLE_TIMEOUT <= 0:
+            return
+        # Never block here, stop_camera() may hold the lock while joining us
+        if not self.lifecycle_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.monotonic()
+            for consumer_id, expiry in list(self.consumers.items()):
+                if expiry is not None and expiry <= now:
+                    del self.consumers[consumer_id]
+            
+            if self.consumers:
+                self.idle_since = None
+            elif self.idle_since is None:
+                self.idle_since = now
+            elif now - self.idle_since >= CAMERA_IDLE_TIMEOUT:
+                logger.info(f"Camera {self.camera_id} idle for {CAMERA_IDLE_TIMEOUT:g}s, closing")
+                self._stop_locked()
+        finally:
+            self.lifecycle_lock.release()
+    
     def start_camera(self):
         """Initialize and start camera"""
+        with self.lifecycle_lock:
+            return self._start_locked()
+    
+    def _start_locked(self):
+        if self.is_streaming:
+            return True
+            
         try:
-            self.camera = cv2.VideoCapture(0, cv2.CAP_DSHOW)
-            self.camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-            self.camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-            self.camera.set(cv2.CAP_PROP_FPS, 30)
+            config = dict(self.source_config)
+            self.camera = create_frame_source(config.pop('kind'), **config)
             
-            if not self.camera.isOpened():
+            # Opening a device can take seconds (DirectShow/V4L2 negotiation)
+            if not offload(self.camera.open):
                 logger.error("Failed to open camera")
+                self.camera = None
                 return False
                 
+            if self.motion:
+                self.motion.reset()
             self.is_streaming = True
-            logger.info("Camera started successfully")
+            self.capture_thread = threading.Thread(target=self._capture_loop, daemon=True)
+            self.capture_thread.start()
+            logger.info(f"Camera {self.camera_id} started successfully: {self.camera.describe()}")
             return True
         except Exception as e:
             logger.error(f"Error starting camera: {e}")
             return False
     
     def stop_camera(self):
-        """Stop and release camera"""
+        """Stop and release camera regardless of consumers"""
+        with self.lifecycle_lock:
+            self.consumers.clear()
+            self._stop_locked()
+    
+    def _stop_locked(self):
         self.is_streaming = False
+        self.idle_since = None
+        
+        # Wake any viewers blocked on the next frame so they can exit
+        with self.frame_ready:
+            self.latest_frame = None
+            self.frame_ready.notify_all()
+            
+        if self.capture_thread and self.capture_thread is not threading.current_thread():
+            self.capture_thread.join(timeout=2)
+        self.capture_thread = None
+        
         if self.camera:
-            self.camera.release()
+            offload(self.camera.close)
             self.camera = None
-        logger.info("Camera stopped")
+        logger.info(f"Camera {self.camera_id} stopped")
+    
+    def _capture_loop(self):
+        """Capture thread: read once, publish to the shared slot"""
+        camera = self.camera
+        next_idle_check = 0.0
+        
+        # Compare against our own source: after an idle stop a new consumer
+        # may already have opened a fresh one with its own thread
+        while self.is_streaming and camera is not None and self.camera is camera:
+            try:
+                if time.monotonic() >= next_idle_check:
+                    next_idle_check = time.monotonic() + 1.0
+                    self._check_idle()
+                    if self.camera is not camera:
+                        break
+                
+                if camera.passthrough:
+                    # Camera already produced a JPEG: publish it as-is
+                    start = time.perf_counter()
+                    jpeg = offload(camera.read_jpeg)
+                    if jpeg is None:
+                        READ_FAILURES.inc(1, self.metric_labels)
+                        logger.warning("Failed to read frame")
+                        time.sleep(0.01)
+                        continue
+                    CAPTURE_SECONDS.observe(time.perf_counter() - start, self.metric_labels)
+                    FRAMES_CAPTURED.inc(1, self.metric_labels)
+                    if self.motion and not self.motion.should_publish(jpeg=jpeg):
+                        FRAMES_UNCHANGED.inc(1, self.metric_labels)
+                        continue
+                    FRAME_BYTES.observe(len(jpeg), ('passthrough',))
+                    self._publish(None, jpeg)
+                    continue
+                
+                start = time.perf_counter()
+                image = offload(camera.read)
+                captured = time.time()
+                if image is None:
+                    READ_FAILURES.inc(1, self.metric_labels)
+                    logger.warning("Failed to read frame")
+                    time.sleep(0.01)
+                    continue
+                CAPTURE_SECONDS.observe(time.perf_counter() - start, self.metric_labels)
+                FRAMES_CAPTURED.inc(1, self.metric_labels)
+                
+                # Unchanged scene: skip publish (and the encode) entirely
+                if self.motion and not self.motion.should_publish(image=image):
+                    FRAMES_UNCHANGED.inc(1, self.metric_labels)
+                    continue
+                
+                # After motion detection, so the ticking timestamp is not motion
+                if self.transforms:
+                    image = offload(self.transforms.apply, image, captured)
+                
+                if self.encoder:
+                    # Published from _publish_encoded once the pool is done
+                    if not self.encoder.submit(image, *self.default_quality, context=(image, captured)):
+                        ENCODE_DROPPED.inc(1, self.metric_labels)
+                    continue
+                
+                frame = self._publish(image, timestamp=captured)
+                # Most viewers use the default tier, so have it ready
+                frame.encode(*self.default_quality)
+            except Exception as e:
+                logger.error(f"Error capturing frame: {e}")
+                time.sleep(0.1)
     
-    def get_frame(self) -> Optional[bytes]:
-        """Capture and encode a single frame"""
-        if not self.camera or not self.is_streaming:
+    def _publish(self, image: Optional[np.ndarray], jpeg: Optional[bytes] = None,
+                 timestamp: Optional[float] = None) -> CachedFrame:
+        """Store a newly captured frame and wake all waiting viewers"""
+        with self.frame_ready:
+            self.frame_seq += 1
+            frame = CachedFrame(self.frame_seq, image, timestamp or time.time(), jpeg, self.default_quality,
+                                self.camera.width if self.camera else 0)
+            self.latest_frame = frame
+            self.frame_ready.notify_all()
+        FRAMES_PUBLISHED.inc(1, self.metric_labels)
+        self.snapshots.record(frame)
+        if self.recorder:
+            self.recorder.submit(frame)  # non-blocking, drops if the disk lags
+        return frame
+    
+    def _publish_encoded(self, context: Tuple[np.ndarray, float], jpeg: Optional[bytes], seconds: float):
+        """Encode pool callback, called in capture order with (image, capture time)"""
+        if jpeg is None or not self.is_streaming:
+            return
+        quality, width = self.default_quality
+        tier = (f'q{quality}_w{width or "native"}',)
+        ENCODE_SECONDS.observe(seconds, tier)
+        FRAME_BYTES.observe(len(jpeg), tier)
+        image, captured = context
+        # Stamped at capture, so frame age includes the time spent encoding
+        self._publish(image, jpeg, captured)
+    
+    def get_latest(self) -> Optional[CachedFrame]:
+        """Return the most recently captured frame without blocking"""
+        if not self.is_streaming:
             return None
-            
-        try:
-            ret, frame = self.camera.read()
-            if not ret:
-                logger.warning("Failed to read frame")
+        return self.latest_frame
+    
+    def get_frame(self, quality: Optional[int] = None, width: Optional[int] = None) -> Optional[bytes]:
+        """Return the latest frame encoded as JPEG at the given tier"""
+        frame = self.get_latest()
+        if frame is None:
+            return None
+        if quality is None:
+            quality, width = self.default_quality
+        return frame.encode(quality, width)
+    
+    def wait_for_frame(self, last_seq: int, timeout: float = 1.0) -> Optional[CachedFrame]:
+        """
+        Block until a frame newer than last_seq is published.
+        
+        Returns:
+            The newest CachedFrame, or None on timeout or when the camera
+            is stopped
+        """
+        with self.frame_ready:
+            self.frame_ready.wait_for(
+                lambda: self.frame_seq != last_seq or not self.is_streaming,
+                timeout=timeout
+            )
+            if not self.is_streaming or self.frame_seq == last_seq:
                 return None
-            
-            # Encode frame as JPEG
-            encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), 80]
-            _, buffer = cv2.imencode('.jpg', frame, encode_param)
-            return buffer.tobytes()
+            return self.latest_frame
+
+
+class CameraRegistry:
+    """Local cameras, each with its own capture pipeline"""
+    
+    def __init__(self, camera_configs: Dict[str, dict]):
+        self.cameras: Dict[str, WebcamStreamer] = {
+            camera_id: WebcamStreamer(camera_id, config)
+            for camera_id, config in camera_configs.items()
+        }
+        self.default_id = next(iter(self.cameras))
+    
+    def merge(self, camera_configs: Dict[str, dict]) -> List[WebcamStreamer]:
+        """
+        Add cameras found after startup.
+        
+        Cameras already known are kept (a probe cannot open one that is in
+        use). An unused default camera that the probe did not find gives
+        way to the first one it did.
+        
+        Returns:
+            The cameras that were added
+        """
+        merged = dict(self.cameras)
+        added = []
+        for camera_id, config in camera_configs.items():
+            if camera_id not in merged:
+                merged[camera_id] = WebcamStreamer(camera_id, config)
+                added.append(merged[camera_id])
+        default = merged[self.default_id]
+        if camera_configs and self.default_id not in camera_configs and not (
+                default.is_streaming or default.consumer_count()):
+            del merged[self.default_id]
+            self.default_id = next(iter(camera_configs))
+        # Swapped whole so concurrent iteration never sees a half-built dict
+        self.cameras = merged
+        return added
+    
+    def get(self, camera_id: Optional[str] = None) -> Optional[WebcamStreamer]:
+        """Camera by id, or the default camera when no id is given"""
+        return self.cameras.get(camera_id or self.default_id)
+    
+    def ids(self) -> List[str]:
+        return list(self.cameras)
+    
+    def __iter__(self):
+        return iter(list(self.cameras.values()))
+    
+    def stop_all(self):
+        for camera in self:
+            camera.stop_camera()
+    
+    def describe(self) -> List[dict]:
+        """Camera list for the API"""
+        return [{
+            'camera_id': camera.camera_id,
+            'streaming': camera.is_streaming,
+            'consumers': camera.consumer_count(),
+            'frame_seq': camera.frame_seq,
+            'recording': camera.recorder.status() if camera.recorder else None,
+            'transforms': camera.transforms.describe() if camera.transforms else None,
+            'source': camera.camera.describe() if camera.camera else {
+                'kind': camera.source_config.get('kind'),
+                'index': camera.source_config.get('index')
+            }
+        } for camera in self]
+
+
+def build_camera_configs() -> Dict[str, dict]:
+    """
+    camera_id -> source config for every camera selected by CAMERAS.
+    
+    CAMERAS=auto starts with CAMERA_INDEX only; discover_cameras() probes
+    for the others once the server is listening.
+    """
+    if CAMERAS and CAMERAS != 'auto':
+        indexes = [int(index) for index in CAMERAS.split(',')]
+    else:
+        indexes = [CAMERA_INDEX]
+    return {f'cam{index}': camera_source_config(index) for index in indexes}
+
+
+class ViewerStats:
+    """Per-client MJPEG delivery counters"""
+    
+    def __init__(self, viewer_id: str, camera_id: str, remote_addr: str, quality: int, width: Optional[int]):
+        self.viewer_id = viewer_id
+        self.camera_id = camera_id
+        self.remote_addr = remote_addr
+        self.quality = quality
+        self.width = width
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.last_frame_age = 0.0
+        self.bitrate: Optional[AdaptiveBitrate] = None
+    
+    def record(self, frame: CachedFrame, last_seq: int):
+        """Account for a frame about to be sent after last_seq"""
+        if last_seq:
+            # Frames published while this client was still writing are skipped
+            dropped = max(0, frame.seq - last_seq - 1)
+            if dropped:
+                self.frames_dropped += dropped
+                MJPEG_FRAMES_DROPPED.inc(dropped)
+        self.frames_sent += 1
+        self.last_frame_age = time.time() - frame.timestamp
+        MJPEG_FRAMES_SENT.inc()
+        MJPEG_FRAME_AGE.observe(self.last_frame_age)
+    
+    def to_dict(self) -> dict:
+        return {
+            'viewer_id': self.viewer_id,
+            'camera_id': self.camera_id,
+            'remote_addr': self.remote_addr,
+            'quality': self.quality,
+            'width': self.width,
+            'connected_seconds': round(time.time() - self.connected_at, 1),
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'last_frame_age_ms': round(self.last_frame_age * 1000, 1),
+            'adaptive': self.bitrate.describe() if self.bitrate else None
+        }
+
+
+# Local cameras
+# Workers start on the first submitted frame, so a process that imports
+# this module without capturing never starts a pool of its own
+encode_pool = EncodePool(ENCODE_WORKERS, ENCODE_POOL, run_blocking=offload) if ENCODE_WORKERS > 0 else None
+
+cameras = CameraRegistry(build_camera_configs())
+
+# Device-side WebRTC peers, created by the first offer (None until then and
+# when aiortc is not installed). aiortc runs its own asyncio loop on an OS
+# thread, which does not mix with monkey patched green threads, so it is
+# only enabled in threading mode.
+webrtc_peers = None
+webrtc_enabled = WEBRTC_AVAILABLE and ASYNC_MODE == 'threading'
+webrtc_lock = threading.Lock()
+if WEBRTC_AVAILABLE and not webrtc_enabled:
+    logger.warning(f"WebRTC disabled in {ASYNC_MODE} mode, set ASYNC_MODE=threading to enable it")
+
+
+def get_webrtc_peers():
+    """The WebRTC peer manager, importing aiortc on first use"""
+    global webrtc_peers, webrtc_enabled
+    if webrtc_peers is None and webrtc_enabled:
+        with webrtc_lock:
+            if webrtc_peers is None and webrtc_enabled:
+                if webrtc_helper.WEBRTC_AVAILABLE:
+                    webrtc_peers = webrtc_helper.WebRTCPeerManager(cameras.get().wait_for_frame)
+                else:
+                    logger.warning("WebRTC disabled: aiortc is installed but failed to import")
+                    webrtc_enabled = False
+    return webrtc_peers
+
+
+def notify_presence(device_id: str, online: bool, info: dict):
+    """Push device_online / device_offline to authenticated clients"""
+    # With a shared backend every worker sees the change and tells its own
+    # clients, so skip the message queue to avoid duplicates
+    socketio.emit('device_online' if online else 'device_offline', {
+        'device_id': device_id,
+        'device_name': info.get('device_name'),
+        'cameras': info.get('cameras', []),
+        'timestamp': datetime.utcnow().isoformat()
+    }, room=AUTHENTICATED_ROOM, ignore_queue=state_backend.shared)
+
+
+device_presence.on_change = notify_presence
+
+
+def presence_loop():
+    """Expire silent devices; with a shared backend, follow other workers' registrations"""
+    while True:
+        try:
+            if state_backend.shared:
+                device_presence.sync(device_registry.list())
+            device_presence.expire()
         except Exception as e:
-            logger.error(f"Error capturing frame: {e}")
-            return None
+            logger.error(f"Presence sweep error: {e}")
+        socketio.sleep(1)
+
+
+def notify_motion(camera_id: str, active: bool, score: float):
+    """Push motion start/stop to clients watching this device"""
+    socketio.emit('motion', {
+        'device_id': DEVICE_ID,
+        'camera_id': camera_id,
+        'active': active,
+        'score': round(float(score), 4),
+        'timestamp': datetime.utcnow().isoformat()
+    }, room=DEVICE_ID)
+
+
+def handle_motion_change(camera: WebcamStreamer, active: bool, score: float):
+    """Motion start/stop: notify clients and extend a triggered recording"""
+    notify_motion(camera.camera_id, active, score)
+    if camera.recorder:
+        # Called on start and on stop, so post-roll counts from the last motion
+        camera.recorder.trigger()
+
+
+def attach_camera_handlers(camera: WebcamStreamer):
+    if camera.motion:
+        camera.motion.on_change = functools.partial(handle_motion_change, camera)
+
+
+for camera in cameras:
+    attach_camera_handlers(camera)
+
+
+def discover_cameras():
+    """CAMERAS=auto: probe the camera indexes (opening each takes a while)"""
+    if CAMERAS != 'auto':
+        return
+    found = offload(probe_cameras, FRAME_SOURCE, MAX_CAMERAS)
+    added = cameras.merge({f'cam{index}': camera_source_config(index) for index in found})
+    for camera in added:
+        attach_camera_handlers(camera)
+    if added:
+        logger.info(f"Cameras: {cameras.ids()}")
+        device_registry.register(DEVICE_ID, DEVICE_NAME, get_local_ip(), cameras=cameras.ids())
+
+
+# Connection to the cloud relay (None in local-only mode)
+signaling_client: Optional[SignalingClient] = None
+
+# Segment catalogue for /api/recordings (None when there are no recordings)
+recording_index: Optional[RecordingIndex] = None
+
+
+def start_recorders():
+    """Attach a recorder to every camera and keep the cameras open for it"""
+    global recording_index
+    recording = RECORDING in ('continuous', 'motion')
+    if not recording and not os.path.isdir(RECORDINGS_DIR):
+        return
+    
+    # Also opened with recording off so earlier footage stays browsable
+    os.makedirs(RECORDINGS_DIR, exist_ok=True)
+    recording_index = RecordingIndex(os.path.join(RECORDINGS_DIR, 'index.sqlite3'))
+    # Pick up segments left by a previous run before new ones are written
+    recording_index.rebuild(RECORDINGS_DIR)
+    if not recording:
+        return
+    
+    retention = RetentionPolicy(RECORDINGS_DIR, RECORDINGS_MAX_BYTES, RECORDINGS_MAX_AGE)
+    retention.on_delete = recording_index.remove
+    for camera in cameras:
+        camera.recorder = Recorder(
+            camera.camera_id, RECORDINGS_DIR, retention,
+            continuous=RECORDING == 'continuous',
+            segment_seconds=RECORDING_SEGMENT_SECONDS,
+            pre_roll=RECORDING_PRE_ROLL,
+            post_roll=RECORDING_POST_ROLL,
+            fps=camera.source_config.get('fps') or CAMERA_FPS,
+            quality=camera.default_quality[0]
+        )
+        camera.recorder.on_segment_closed = functools.partial(recording_index.add_segment, camera.camera_id)
+        camera.recorder.start()
+        if not camera.acquire(f'recorder:{camera.camera_id}'):
+            logger.error(f"Recorder could not open camera {camera.camera_id}")
+
+
+def start_cameras():
+    """Find the cameras, then attach the recorders to all of them"""
+    try:
+        discover_cameras()
+    except Exception as e:
+        logger.error(f"Camera probe failed: {e}")
+    start_recorders()
+
+
+def stop_recorders():
+    for camera in cameras:
+        if camera.recorder:
+            camera.recorder.stop()
+
+
+def answer_webrtc_offer(peer_id: str, offer: dict, camera_id: Optional[str] = None) -> Optional[dict]:
+    """Answer a WebRTC offer with a local camera track, or None if we can't"""
+    camera = cameras.get(camera_id)
+    if not offer or camera is None:
+        return None
+    webrtc_peers = get_webrtc_peers()
+    if not webrtc_peers:
+        return None
+    
+    # A re-offer replaces the peer's connection. Close the old one first so
+    # its on_close does not release the consumer acquired below
+    webrtc_peers.close_peer(peer_id)
+    
+    # The track holds the camera open until its peer connection closes
+    consumer_id = f'webrtc:{peer_id}'
+    if not camera.acquire(consumer_id):
+        return None
+    
+    try:
+        answer = webrtc_peers.handle_offer(peer_id, offer, camera.wait_for_frame,
+                                           on_close=lambda: camera.release(consumer_id))
+        logger.info(f"Answered WebRTC offer from {peer_id}")
+        return answer
+    except Exception as e:
+        camera.release(consumer_id)
+        logger.error(f"Error answering WebRTC offer: {e}")
+        return None
+
+
+def check_password(password: str) -> bool:
+    """Constant-time password check, only needed at login"""
+    password_hash = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(password_hash, PASSWORD_HASH)
+
+
+def is_authorized() -> bool:
+    """Valid session token, or the legacy password in the JSON body"""
+    if session_tokens.verify(extract_token(request)):
+        return True
+    data = request.get_json(silent=True)
+    return isinstance(data, dict) and 'password' in data and check_password(data['password'])
+
+
+def client_key() -> str:
+    """Stable id for the requesting client: its token id, else its address"""
+    token = extract_token(request)
+    return token.split('.', 1)[0] if token else request.remote_addr
 
 
-# Global webcam streamer instance
-streamer = WebcamStreamer()
+def require_auth(func):
+    """Reject requests without a valid session token (or password)"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_authorized():
+            return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+        return func(*args, **kwargs)
+    return wrapper
 
 
 # ============================================================================
@@ -135,22 +1114,24 @@ def health_check():
         'status': 'online',
         'device_name': DEVICE_NAME,
         'device_id': DEVICE_ID,
+        'cameras': cameras.ids(),
         'timestamp': datetime.utcnow().isoformat()
     })
 
 
 @app.route('/api/authenticate', methods=['POST'])
 def authenticate():
-    """Authenticate client with password"""
-    data = request.get_json()
+    """Authenticate client with password and issue a session token"""
+    data = request.get_json(silent=True) or {}
     password = data.get('password', '')
     
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    
-    if password_hash == PASSWORD_HASH:
+    if check_password(password):
+        token, expires_at = session_tokens.issue()
         return jsonify({
             'success': True,
-            'message': 'Authentication successful'
+            'message': 'Authentication successful',
+            'token': token,
+            'expires_at': expires_at
         })
     else:
         return jsonify({
@@ -159,31 +1140,49 @@ def authenticate():
         }), 401
 
 
-@app.route('/api/devices', methods=['POST'])
-def list_devices():
-    """List all registered devices (requires authentication)"""
-    data = request.get_json()
-    password = data.get('password', '')
-    
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
+@app.route('/api/logout', methods=['POST'])
+@require_auth
+def logout():
+    """Revoke the presented session token, or every token with {"all": true}"""
+    data = request.get_json(silent=True) or {}
     
-    if password_hash != PASSWORD_HASH:
-        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
+    if data.get('all'):
+        session_tokens.revoke_all()
+        logger.info("All session tokens revoked")
+    else:
+        token = extract_token(request)
+        if token:
+            session_tokens.revoke(token)
     
-    # Return list of connected devices
-    devices = []
-    for device_id, info in connected_devices.items():
-        devices.append({
-            'device_id': device_id,
+    return jsonify({'success': True})
+
+
+def render_device_list(devices: List[dict]) -> dict:
+    """/api/devices body for the online devices"""
+    return {
+        'success': True,
+        'devices': [{
+            'device_id': info['device_id'],
             'device_name': info['device_name'],
             'last_seen': info['last_seen'],
+            'cameras': info.get('cameras', []),
             'status': 'online'
-        })
+        } for info in sorted(devices, key=lambda info: info['device_id'])]
+    }
+
+
+@app.route('/api/devices', methods=['POST'])
+@require_auth
+def list_devices():
+    """
+    List online devices (requires authentication)
     
-    return jsonify({
-        'success': True,
-        'devices': devices
-    })
+    The body is cached and only rebuilt when a device comes online, goes
+    offline or changes its details, so last_seen is as of that change
+    rather than the latest heartbeat.
+    """
+    from flask import Response
+    return Response(device_presence.listing(render_device_list), mimetype='application/json')
 
 
 @app.route('/api/register', methods=['POST'])
@@ -194,12 +1193,8 @@ def register_device():
     device_id = data.get('device_id', DEVICE_ID)
     device_name = data.get('device_name', DEVICE_NAME)
     
-    connected_devices[device_id] = {
-        'device_id': device_id,
-        'device_name': device_name,
-        'last_seen': datetime.utcnow().isoformat(),
-        'ip': request.remote_addr
-    }
+    device_registry.register(device_id, device_name, request.remote_addr,
+                             cameras=data.get('cameras', []))
     
     logger.info(f"Device registered: {device_name} ({device_id})")
     
@@ -210,24 +1205,23 @@ def register_device():
 
 
 @app.route('/api/stream/start', methods=['POST'])
+@require_auth
 def start_stream():
     """Start streaming from a device"""
-    data = request.get_json()
-    password = data.get('password', '')
+    data = request.get_json(silent=True) or {}
     device_id = data.get('device_id', '')
+    camera = cameras.get(data.get('camera_id'))
     
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    
-    if password_hash != PASSWORD_HASH:
-        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
-    
-    if device_id == DEVICE_ID:
-        # Start local camera
-        if streamer.start_camera():
+    if device_id == DEVICE_ID and camera is not None:
+        # Hold the local camera open for this client (renewed by its polls)
+        if camera.touch(f'api:{client_key()}', STREAM_START_LEASE):
+            base_url = f'http://{get_local_ip()}:{HTTP_PORT}/api/stream/{camera.camera_id}'
             return jsonify({
                 'success': True,
                 'message': 'Camera started',
-                'stream_url': f'http://{get_local_ip()}:{HTTP_PORT}/api/stream/frame'
+                'camera_id': camera.camera_id,
+                'stream_url': f'{base_url}/frame',
+                'mjpeg_url': f'{base_url}/mjpeg'
             })
         else:
             return jsonify({
@@ -242,22 +1236,23 @@ def start_stream():
 
 
 @app.route('/api/stream/stop', methods=['POST'])
+@require_auth
 def stop_stream():
     """Stop streaming from a device"""
-    data = request.get_json()
-    password = data.get('password', '')
+    data = request.get_json(silent=True) or {}
     device_id = data.get('device_id', '')
+    camera = cameras.get(data.get('camera_id'))
     
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    
-    if password_hash != PASSWORD_HASH:
-        return jsonify({'success': False, 'message': 'Unauthorized'}), 401
-    
-    if device_id == DEVICE_ID:
-        streamer.stop_camera()
+    if device_id == DEVICE_ID and camera is not None:
+        # Only drop this client's hold; other viewers keep streaming and
+        # the camera closes by itself once nobody is left
+        key = client_key()
+        camera.release(f'api:{key}')
+        camera.release(f'poll:{key}')
         return jsonify({
             'success': True,
-            'message': 'Camera stopped'
+            'message': 'Camera stopped',
+            'active_consumers': camera.consumer_count()
         })
     else:
         return jsonify({
@@ -266,65 +1261,485 @@ def stop_stream():
         }), 404
 
 
+@app.route('/api/cameras', methods=['GET'])
+@require_auth
+def list_cameras():
+    """List local cameras and their capture state"""
+    return jsonify({
+        'success': True,
+        'device_id': DEVICE_ID,
+        'default_camera': cameras.default_id,
+        'cameras': cameras.describe()
+    })
+
+
 @app.route('/api/stream/frame', methods=['GET'])
-def get_frame():
-    """Get a single frame from the camera"""
-    frame = streamer.get_frame()
+@app.route('/api/stream/<camera_id>/frame', methods=['GET'])
+@require_auth
+def get_frame(camera_id=None):
+    """Get the latest frame from the shared capture buffer"""
+    camera = cameras.get(camera_id)
+    if camera is None:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    # Pollers keep the camera open through a lease renewed on every poll
+    if not camera.touch(f'poll:{client_key()}', FRAME_POLL_LEASE):
+        return jsonify({'error': 'Camera unavailable'}), 503
+    
+    quality, width = parse_quality_args(request.args)
+    view = parse_view_args(request.args)
+    cached = camera.get_latest() or camera.wait_for_frame(camera.frame_seq, timeout=2.0)
+    if cached and view:
+        cached = cached.transformed(view)
+    frame = cached.encode(quality, width) if cached else None
     if frame:
         from flask import Response
-        return Response(frame, mimetype='image/jpeg')
+        response = Response(frame, mimetype='image/jpeg')
+        response.headers['X-Timestamp'] = f'{cached.timestamp:.6f}'
+        return response
     else:
         return jsonify({'error': 'No frame available'}), 404
 
 
+@app.route('/api/snapshot', methods=['GET'])
+@app.route('/api/snapshot/<camera_id>', methods=['GET'])
+@require_auth
+def get_snapshot(camera_id=None):
+    """
+    Cached thumbnail of the camera, latest or at ?t=<unix time>
+    
+    Served from the snapshot cache only, so polling never opens or keeps
+    the camera open. Sends an ETag; If-None-Match gets a 304 while the
+    thumbnail is unchanged.
+    """
+    camera = cameras.get(camera_id)
+    if camera is None:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    timestamp = request.args.get('t', type=float)
+    if timestamp is None:
+        snapshot = camera.snapshots.current(camera.get_latest())
+    else:
+        snapshot = camera.snapshots.at(timestamp)
+    if snapshot is None:
+        return jsonify({'error': 'No snapshot available'}), 404
+    
+    from flask import Response
+    response = Response(snapshot.jpeg, mimetype='image/jpeg')
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.headers['X-Timestamp'] = f'{snapshot.timestamp:.6f}'
+    return response.make_conditional(request)
+
+
+@app.route('/api/snapshots', methods=['GET'])
+@require_auth
+def list_snapshots():
+    """Latest thumbnail and history timestamps of every camera"""
+    result = []
+    for camera in cameras:
+        latest = camera.snapshots.current(camera.get_latest())
+        result.append({
+            'camera_id': camera.camera_id,
+            'url': f'/api/snapshot/{camera.camera_id}',
+            'etag': latest.etag if latest else None,
+            'timestamp': latest.timestamp if latest else None,
+            'history': camera.snapshots.timestamps()
+        })
+    return jsonify({'success': True, 'snapshots': result})
+
+
+MJPEG_TRAILER = b'\r\n'
+
+
 @app.route('/api/stream/mjpeg', methods=['GET'])
-def stream_mjpeg():
-    """Stream MJPEG video"""
+@app.route('/api/stream/<camera_id>/mjpeg', methods=['GET'])
+@require_auth
+def stream_mjpeg(camera_id=None):
+    """
+    Stream MJPEG video
+    
+    Delivery is driven by frame arrival rather than a fixed sleep. The
+    generator only resumes once the previous part has been written, and it
+    then always picks up the newest frame, so a slow client skips stale
+    frames (counted as dropped) instead of building up a queue.
+    
+    Part header, JPEG and trailer are yielded as separate writes. The JPEG
+    is the frame's cached bytes object, shared with every other viewer of
+    the tier, so no per-viewer copy of the payload is made.
+    
+    With adaptive bitrate the time those writes take feeds the viewer's
+    AdaptiveBitrate, which picks the tier and frame rate of the next part.
+    """
+    camera = cameras.get(camera_id)
+    if camera is None:
+        return jsonify({'error': 'Camera not found'}), 404
+    
+    quality, width = parse_quality_args(request.args)
+    view = parse_view_args(request.args)
+    stats = ViewerStats(os.urandom(4).hex(), camera.camera_id, request.remote_addr, quality, width)
+    consumer_id = f'mjpeg:{stats.viewer_id}'
+    if not camera.acquire(consumer_id):
+        return jsonify({'error': 'Camera unavailable'}), 503
+    
+    sock = None
+    if ADAPTIVE_BITRATE and request.args.get('adaptive', '1') != '0':
+        stats.bitrate = AdaptiveBitrate(quality, width, ADAPTIVE_TARGET_LATENCY,
+                                        max_send_buffer=ADAPTIVE_SEND_BUFFER or 64 * 1024)
+        if ADAPTIVE_SEND_BUFFER:
+            sock = request.environ.get('werkzeug.socket')  # threading mode only
+    bitrate = stats.bitrate
+    send_buffer = [0]  # size last applied to sock
+    
+    def resize_send_buffer():
+        """Keep the send buffer at what the link drains within the target"""
+        size = bitrate.send_buffer()
+        if abs(size - send_buffer[0]) > send_buffer[0] // 4:
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, size)
+                send_buffer[0] = size
+            except OSError:
+                pass
+    
     def generate():
-        while streamer.is_streaming:
-            frame = streamer.get_frame()
-            if frame:
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-            time.sleep(0.033)  # ~30 FPS
+        with viewers_lock:
+            active_viewers[stats.viewer_id] = stats
+        logger.info(f"MJPEG viewer {stats.viewer_id} connected to {camera.camera_id} from {stats.remote_addr}")
+        if sock is not None:
+            resize_send_buffer()
+        
+        last_seq = 0
+        try:
+            while camera.is_streaming:
+                # Shared capture thread publishes frames; just wait for the next one
+                cached = camera.wait_for_frame(last_seq)
+                if cached is None:
+                    continue
+                if view:
+                    # Keeps the camera frame's seq and timestamp
+                    cached = cached.transformed(view)
+                    if cached is None:
+                        continue
+                if bitrate:
+                    level = bitrate.level
+                    part = cached.mjpeg_part(level.quality, level.width)
+                else:
+                    part = cached.mjpeg_part(quality, width)
+                if not part:
+                    continue
+                header, frame = part
+                stats.record(cached, last_seq)
+                last_seq = cached.seq
+                # Resumes only once each write is done, so this times the send
+                sent = time.monotonic()
+                yield header
+                yield frame
+                yield MJPEG_TRAILER
+                if bitrate:
+                    bitrate.on_sent(len(header) + len(frame) + len(MJPEG_TRAILER),
+                                    time.monotonic() - sent, time.time() - cached.timestamp)
+                    if sock is not None:
+                        resize_send_buffer()
+                    delay = bitrate.delay()
+                    if delay:
+                        socketio.sleep(delay)  # Level's frame rate cap
+        finally:
+            with viewers_lock:
+                active_viewers.pop(stats.viewer_id, None)
+            logger.info(f"MJPEG viewer {stats.viewer_id} disconnected: "
+                        f"{stats.frames_sent} sent, {stats.frames_dropped} dropped")
     
     from flask import Response
-    return Response(
+    response = Response(
         generate(),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
+    # Runs even if the client goes away before the generator starts
+    response.call_on_close(lambda: camera.release(consumer_id))
+    return response
+
+
+@app.route('/api/recordings/trigger', methods=['POST'])
+@require_auth
+def trigger_recording():
+    """Save the pre-roll and record for {"duration": seconds} from now"""
+    data = request.get_json(silent=True) or {}
+    camera = cameras.get(data.get('camera_id'))
+    if camera is None:
+        return jsonify({'success': False, 'message': 'Camera not found'}), 404
+    if not camera.recorder:
+        return jsonify({'success': False, 'message': 'Recording disabled'}), 404
+    
+    duration = data.get('duration')
+    camera.recorder.trigger(float(duration) if duration is not None else None)
+    return jsonify({
+        'success': True,
+        'camera_id': camera.camera_id,
+        'recording': camera.recorder.status()
+    })
+
+
+def recording_urls(segment: dict) -> dict:
+    """Public view of an index entry: no file system path, but its URLs"""
+    segment = dict(segment)
+    segment.pop('path', None)
+    segment['url'] = f"/api/recordings/{segment['id']}"
+    return segment
+
+
+def read_recorded_frame(path: str, offset: int, length: int) -> bytes:
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return f.read(length)
+
+
+@app.route('/api/recordings', methods=['GET'])
+@require_auth
+def list_recordings():
+    """Recorded segments, newest first (?camera_id=&start=&end=&limit=)"""
+    if recording_index is None:
+        return jsonify({'success': False, 'message': 'Recording disabled'}), 404
+    
+    segments = recording_index.list(
+        request.args.get('camera_id'),
+        request.args.get('start', type=float),
+        request.args.get('end', type=float),
+        max(1, min(request.args.get('limit', 100, type=int), 1000))
+    )
+    return jsonify({
+        'success': True,
+        'recordings': [recording_urls(segment) for segment in segments]
+    })
+
+
+@app.route('/api/recordings/seek', methods=['GET'])
+@require_auth
+def seek_recording():
+    """
+    Find the recorded frame at ?t=<unix time> for ?camera_id=
+    
+    The response names the segment and the byte range of that frame in
+    it, so players can fetch the segment from there with a Range request,
+    or add ?format=jpeg to get the frame itself.
+    """
+    if recording_index is None:
+        return jsonify({'success': False, 'message': 'Recording disabled'}), 404
+    timestamp = request.args.get('t', type=float)
+    if timestamp is None:
+        return jsonify({'success': False, 'message': 't is required'}), 400
+    camera = cameras.get(request.args.get('camera_id'))
+    camera_id = camera.camera_id if camera else request.args.get('camera_id')
+    
+    position = recording_index.seek(camera_id, timestamp)
+    if position is None:
+        return jsonify({'success': False, 'message': 'No recording at that time'}), 404
+    
+    if request.args.get('format') == 'jpeg':
+        from flask import Response
+        frame = offload(read_recorded_frame, position['path'], position['offset'], position['length'])
+        response = Response(frame, mimetype='image/jpeg')
+        response.headers['X-Timestamp'] = f"{position['frame_time']:.6f}"
+        return response
+    
+    position = recording_urls(position)
+    position['range'] = f"bytes={position['offset']}-{position['offset'] + position['length'] - 1}"
+    return jsonify({'success': True, 'recording': position})
+
+
+@app.route('/api/recordings/<int:segment_id>', methods=['GET'])
+@require_auth
+def download_recording(segment_id):
+    """Serve a segment, with Range requests for seeking"""
+    segment = recording_index.get(segment_id) if recording_index else None
+    if segment is None or not os.path.exists(segment['path']):
+        return jsonify({'success': False, 'message': 'Recording not found'}), 404
+    
+    # conditional=True answers Range and If-None-Match; the body goes out
+    # through the server's file wrapper (sendfile where available)
+    from flask import send_file
+    return send_file(segment['path'], mimetype='video/x-msvideo', conditional=True)
+
+
+@app.route('/api/motion', methods=['GET'])
+@app.route('/api/motion/<camera_id>', methods=['GET'])
+@require_auth
+def get_motion(camera_id=None):
+    """Current motion signal for the camera"""
+    camera = cameras.get(camera_id)
+    if camera is None:
+        return jsonify({'success': False, 'message': 'Camera not found'}), 404
+    if not camera.motion:
+        return jsonify({'success': False, 'message': 'Motion detection disabled'}), 404
+    
+    return jsonify({
+        'success': True,
+        'camera_id': camera.camera_id,
+        'streaming': camera.is_streaming,
+        'motion': camera.motion.status()
+    })
+
+
+@app.route('/api/stream/viewers', methods=['GET'])
+@require_auth
+def list_viewers():
+    """Report per-client MJPEG delivery stats"""
+    with viewers_lock:
+        viewers = [stats.to_dict() for stats in active_viewers.values()]
+    
+    return jsonify({
+        'success': True,
+        'frame_seq': cameras.get().frame_seq,
+        'cameras': {camera.camera_id: camera.frame_seq for camera in cameras},
+        'encode_pool': encode_pool.describe() if encode_pool else None,
+        'viewers': viewers
+    })
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text format metrics"""
+    from flask import Response
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 
 # ============================================================================
 # SOCKETIO EVENTS (WebRTC Signaling)
 # ============================================================================
 
+def relay(event: str, data: dict, to: str, skip_sid: Optional[str] = None):
+    """Emit a signaling message to a sid or room and count it"""
+    SIGNALING_RELAYED.inc(1, (event,))
+    socketio.emit(event, data, room=to, skip_sid=skip_sid)
+
+
+def send_candidate_batch(sender: str, recipient: str, candidates: List[dict], done: bool):
+    relay('ice_candidates', {'candidates': candidates, 'done': done, 'from': sender}, recipient)
+
+
+ice_batcher = CandidateBatcher(send_candidate_batch, ICE_BATCH_WINDOW, socketio.sleep)
+
+
+def relay_candidates(sender: str, recipient: str, candidates: List[Optional[dict]], done: bool = False,
+                     features=()):
+    """Pass ICE candidates to one sid, batched if it understands batches"""
+    if ICE_BATCH_WINDOW > 0 and ICE_BATCH_FEATURE in features:
+        ice_batcher.add_many(sender, recipient, candidates, done)
+        return
+    
+    for candidate in candidates:
+        relay('ice_candidate', {'candidate': candidate, 'from': sender}, recipient)
+    if done and not any(is_end_of_candidates(candidate) for candidate in candidates):
+        relay('ice_candidate', {'candidate': None, 'from': sender}, recipient)
+
+
+def device_connection(device_id: str) -> Optional[dict]:
+    """{'sid', 'features', 'worker'} of a device's signaling connection on any worker"""
+    return state_backend.get(DEVICE_SIDS, device_id) if device_id else None
+
+
+def can_reach(connection: dict) -> bool:
+    """
+    Whether an emit from this worker reaches the connection's sid.
+    
+    Without SIGNALING_MESSAGE_QUEUE, rooms and sids are local to each
+    worker; the emit would be dropped without any error.
+    """
+    return bool(SIGNALING_MESSAGE_QUEUE) or connection.get('worker', WORKER_ID) == WORKER_ID
+
+
+def reject_unreachable(event: str, device_id: str):
+    """Tell the sender its message cannot be delivered from this worker"""
+    logger.error(f"Cannot relay {event} to device {device_id}: it is connected to another worker "
+                 f"and SIGNALING_MESSAGE_QUEUE is not set")
+    emit('signaling_error', {'event': event, 'device_id': device_id,
+                             'message': 'Device is connected to another worker'})
+
+
+def authenticate_sid():
+    """Mark the current SocketIO client as authenticated"""
+    authenticated_sids.add(request.sid)
+    join_room(AUTHENTICATED_ROOM)
+
+
 @socketio.on('connect')
-def handle_connect():
-    """Handle client connection"""
+def handle_connect(auth=None):
+    """Handle client connection, accepting a session token in the handshake"""
+    token = auth.get('token') if isinstance(auth, dict) else request.args.get('token')
+    if token:
+        if not session_tokens.verify(token):
+            logger.warning(f"Rejected connection with invalid token: {request.sid}")
+            return False
+        authenticate_sid()
+    if isinstance(auth, dict) and auth.get('features'):
+        sid_features[request.sid] = set(auth['features'])
+    
     logger.info(f"Client connected: {request.sid}")
-    emit('connected', {'sid': request.sid})
+    emit('connected', {'sid': request.sid, 'authenticated': bool(token)})
 
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
     logger.info(f"Client disconnected: {request.sid}")
+    authenticated_sids.discard(request.sid)
+    sid_features.pop(request.sid, None)
+    ice_batcher.discard(request.sid)
+    for device_id in [device_id for device_id, sid in local_devices.items() if sid == request.sid]:
+        del local_devices[device_id]
+        state_backend.delete(DEVICE_SIDS, device_id)
+        device_registry.unregister(device_id)
+    if webrtc_peers:
+        webrtc_peers.close_peer(request.sid)
 
 
 @socketio.on('authenticate')
 def handle_authenticate(data):
-    """Authenticate WebSocket connection"""
-    password = data.get('password', '')
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    
-    if password_hash == PASSWORD_HASH:
+    """Authenticate WebSocket connection with a session token or password"""
+    if session_tokens.verify(data.get('token')):
+        authenticate_sid()
         emit('authenticated', {'success': True})
+    elif check_password(data.get('password', '')):
+        authenticate_sid()
+        token, expires_at = session_tokens.issue()
+        emit('authenticated', {'success': True, 'token': token, 'expires_at': expires_at})
     else:
         emit('authenticated', {'success': False, 'message': 'Invalid password'})
 
 
+@socketio.on('device_register')
+@instrument_signaling('device_register')
+def handle_device_register(data):
+    """A remote device announcing itself; offers for it go to this sid"""
+    if request.sid not in authenticated_sids and not (
+            session_tokens.verify(data.get('token')) or check_password(data.get('password', ''))):
+        emit('device_registered', {'success': False, 'message': 'Invalid password'})
+        return
+    
+    device_id = data.get('device_id', '')
+    if not device_id:
+        emit('device_registered', {'success': False, 'message': 'device_id is required'})
+        return
+    
+    if data.get('features'):
+        sid_features.setdefault(request.sid, set()).update(data['features'])
+    local_devices[device_id] = request.sid
+    state_backend.put(DEVICE_SIDS, device_id, {
+        'sid': request.sid,
+        'features': sorted(sid_features.get(request.sid, ())),
+        'worker': WORKER_ID
+    }, DEVICE_TTL)
+    # A registered device relays answers and candidates for its viewers
+    authenticate_sid()
+    join_room(device_id)
+    device_registry.register(device_id, data.get('device_name', device_id), request.remote_addr,
+                             cameras=data.get('cameras', []),
+                             connection_url=data.get('connection_url'))
+    logger.info(f"Device {device_id} registered on sid {request.sid}")
+    emit('device_registered', {'success': True, 'device_id': device_id})
+
+
 @socketio.on('join_device')
+@require_authentication('join_device')
 def handle_join_device(data):
     """Join a device room for signaling"""
     device_id = data.get('device_id', '')
@@ -342,34 +1757,85 @@ def handle_leave_device(data):
 
 
 @socketio.on('offer')
+@instrument_signaling('offer')
+@require_authentication('offer')
 def handle_offer(data):
-    """Forward WebRTC offer to device"""
+    """Answer WebRTC offers for this device, forward others to their device"""
     device_id = data.get('device_id', '')
     offer = data.get('offer', {})
-    emit('offer', {'offer': offer, 'from': request.sid}, room=device_id, skip_sid=request.sid)
+    
+    if device_id == DEVICE_ID:
+        answer = answer_webrtc_offer(request.sid, offer, data.get('camera_id'))
+        if answer:
+            emit('answer', {'answer': answer, 'from': DEVICE_ID})
+            return
+    
+    message = {'offer': offer, 'from': request.sid, 'camera_id': data.get('camera_id')}
+    connection = device_connection(device_id)
+    if connection and not can_reach(connection):
+        reject_unreachable('offer', device_id)
+    elif connection:
+        # Straight to the device instead of everyone watching it
+        relay('offer', message, connection['sid'])
+    else:
+        relay('offer', message, device_id, skip_sid=request.sid)
 
 
 @socketio.on('answer')
+@instrument_signaling('answer')
+@require_authentication('answer')
 def handle_answer(data):
     """Forward WebRTC answer to client"""
     to_sid = data.get('to', '')
     answer = data.get('answer', {})
-    emit('answer', {'answer': answer, 'from': request.sid}, room=to_sid)
+    relay('answer', {'answer': answer, 'from': request.sid}, to_sid)
+
+
+def relay_ice(data: dict, candidates: list, done: bool = False):
+    """Deliver candidates from request.sid to their peer"""
+    if not data.get('to') and data.get('device_id') == DEVICE_ID:
+        # Candidates for our own peer connection
+        if webrtc_peers:
+            for candidate in candidates:
+                if not is_end_of_candidates(candidate):
+                    webrtc_peers.add_ice_candidate(request.sid, candidate)
+        return
+    
+    to = data.get('to')
+    if to:
+        relay_candidates(request.sid, to, candidates, done, sid_features.get(to, ()))
+        return
+    
+    connection = device_connection(data.get('device_id', ''))
+    if connection and not can_reach(connection):
+        reject_unreachable('ice_candidate', data.get('device_id', ''))
+        return
+    if connection:
+        relay_candidates(request.sid, connection['sid'], candidates, done, connection.get('features', ()))
+        return
+    
+    # Unregistered device: broadcast to its room one by one, as before
+    device_id = data.get('device_id', '')
+    for candidate in candidates:
+        relay('ice_candidate', {'candidate': candidate, 'from': request.sid},
+              device_id, skip_sid=request.sid)
 
 
 @socketio.on('ice_candidate')
+@instrument_signaling('ice_candidate')
+@require_authentication('ice_candidate')
 def handle_ice_candidate(data):
     """Forward ICE candidate"""
-    to = data.get('to', '')
     candidate = data.get('candidate', {})
-    
-    if to:
-        emit('ice_candidate', {'candidate': candidate, 'from': request.sid}, room=to)
-    else:
-        # Broadcast to device room
-        device_id = data.get('device_id', '')
-        emit('ice_candidate', {'candidate': candidate, 'from': request.sid}, 
-             room=device_id, skip_sid=request.sid)
+    relay_ice(data, [candidate])
+
+
+@socketio.on('ice_candidates')
+@instrument_signaling('ice_candidates')
+@require_authentication('ice_candidates')
+def handle_ice_candidates(data):
+    """Forward a batch of ICE candidates ({'candidates': [...], 'done': bool})"""
+    relay_ice(data, data.get('candidates') or [], bool(data.get('done')))
 
 
 def get_local_ip():
@@ -384,61 +1850,81 @@ def get_local_ip():
         return "127.0.0.1"
 
 
-def get_public_ip():
-    """Get public IP address"""
-    try:
-        response = requests.get('https://api.ipify.org?format=json', timeout=5)
-        return response.json()['ip']
-    except:
-        return None
-
-
 def heartbeat_loop():
     """Send periodic heartbeat to maintain registration"""
     while True:
         try:
             # Update device registration
-            connected_devices[DEVICE_ID] = {
-                'device_id': DEVICE_ID,
-                'device_name': DEVICE_NAME,
-                'last_seen': datetime.utcnow().isoformat(),
-                'ip': get_local_ip()
-            }
+            device_registry.register(DEVICE_ID, DEVICE_NAME, get_local_ip(), cameras=cameras.ids())
+            # Devices signaling through this worker stay registered while connected
+            for device_id, sid in list(local_devices.items()):
+                device_registry.touch(device_id)
+                connection = device_connection(device_id) or {'sid': sid, 'features': [], 'worker': WORKER_ID}
+                state_backend.put(DEVICE_SIDS, device_id, connection, DEVICE_TTL)
             logger.debug(f"Heartbeat: {DEVICE_NAME} is online")
         except Exception as e:
             logger.error(f"Heartbeat error: {e}")
         
-        time.sleep(30)  # Heartbeat every 30 seconds
+        time.sleep(min(30, DEVICE_TTL / 3))  # Several heartbeats per device TTL
+
+
+def device_registration() -> List[Tuple[str, dict]]:
+    """Messages that put this device on the relay, built from current state"""
+    # Cached lookups; picks up a tunnel that came up after startup
+    connection_url = network_info.connection_url(HTTP_PORT)
+    # Extract IP from URL for backwards compatibility
+    public_ip = connection_url.replace('http://', '').replace('https://', '').split(':')[0]
+    return [
+        ('device_register', {
+            'password': FIXED_PASSWORD,
+            'device_id': DEVICE_ID,
+            'device_name': DEVICE_NAME,
+            'public_ip': public_ip,
+            'port': HTTP_PORT,
+            'connection_url': connection_url,  # Send full ngrok URL
+            'cameras': cameras.ids(),
+            'features': [ICE_BATCH_FEATURE]
+        }),
+        # Receive offers relayed to this device's room
+        ('join_device', {'device_id': DEVICE_ID})
+    ]
 
 
 def register_with_signaling_server():
-    """Register this device with cloud signaling server"""
+    """Register this device with cloud signaling server and keep it registered"""
+    global signaling_client
     try:
-        # Try to get ngrok URL first, fallback to public IP
-        from ngrok_helper import get_connection_url
-        connection_url = get_connection_url()
+        # Ngrok URL if a tunnel is up, else public IP; the lookups started
+        # in the background at startup, give them a moment to finish
+        connection_url = network_info.connection_url(HTTP_PORT, wait=10)
+        logger.info(f"Connection URL: {connection_url}")
         
-        # Extract IP and port from URL for backwards compatibility
-        public_ip = connection_url.replace('http://', '').replace('https://', '').split(':')[0]
-        port = HTTP_PORT
+        # Reconnects are handled by SignalingClient (jittered backoff, state
+        # replay), not by the SocketIO client itself
+        sio = client_socketio.Client(reconnection=False, http_session=http_client.session(),
+                                     **serializer_options)
+        signaling_client = SignalingClient(
+            SIGNALING_SERVER_URL, sio, device_registration,
+            Backoff(SIGNALING_RECONNECT_MIN, SIGNALING_RECONNECT_MAX)
+        )
         
-        logger.info(f"Connection URL: {connection_url}")
+        @sio.on('offer')
+        def on_offer(data):
+            peer_id = data.get('from', '')
+            answer = answer_webrtc_offer(peer_id, data.get('offer', {}), data.get('camera_id'))
+            if answer:
+                signaling_client.emit('answer', {'to': peer_id, 'answer': answer})
         
-        # Connect to signaling server
-        sio = client_socketio.Client(reconnection=True, reconnection_attempts=0)
+        @sio.on('ice_candidate')
+        def on_ice_candidate(data):
+            if webrtc_peers and not is_end_of_candidates(data.get('candidate')):
+                webrtc_peers.add_ice_candidate(data.get('from', ''), data.get('candidate', {}))
         
-        @sio.on('connect')
-        def on_connect():
-            logger.info(f"Connected to signaling server: {SIGNALING_SERVER_URL}")
-            # Register as device with full connection URL
-            sio.emit('device_register', {
-                'password': FIXED_PASSWORD,
-                'device_id': DEVICE_ID,
-                'device_name': DEVICE_NAME,
-                'public_ip': public_ip,
-                'port': port,
-                'connection_url': connection_url  # Send full ngrok URL
-            })
+        @sio.on('ice_candidates')
+        def on_ice_candidates(data):
+            if webrtc_peers:
+                for candidate in data.get('candidates', []):
+                    webrtc_peers.add_ice_candidate(data.get('from', ''), candidate)
         
         @sio.on('device_registered')
         def on_registered(data):
@@ -446,34 +1932,14 @@ def register_with_signaling_server():
                 logger.info(f"✅ Registered with signaling server!")
                 logger.info(f"   Device ID: {DEVICE_ID}")
                 logger.info(f"   Device Name: {DEVICE_NAME}")
-                logger.info(f"   Public IP: {public_ip}:{HTTP_PORT}")
-        
-        @sio.on('disconnect')
-        def on_disconnect():
-            logger.warning("Disconnected from signaling server, will reconnect...")
+                logger.info(f"   Connection URL: {network_info.connection_url(HTTP_PORT)}")
         
         @sio.on('error')
         def on_error(data):
             logger.error(f"Signaling server error: {data}")
         
-        # Connect
-        logger.info(f"Connecting to signaling server: {SIGNALING_SERVER_URL}")
-        sio.connect(SIGNALING_SERVER_URL, transports=['websocket', 'polling'])
-        
-        # Keep connection alive in background
-        def keep_alive():
-            while True:
-                time.sleep(30)
-                if sio.connected:
-                    logger.debug("Signaling server connection alive")
-                else:
-                    logger.warning("Lost connection to signaling server")
-                    try:
-                        sio.connect(SIGNALING_SERVER_URL)
-                    except:
-                        pass
-        
-        threading.Thread(target=keep_alive, daemon=True).start()
+        # Blocks for the life of the process (this runs on its own thread)
+        signaling_client.run()
         
     except Exception as e:
         logger.error(f"Failed to connect to signaling server: {e}")
@@ -485,28 +1951,43 @@ def start_signaling_server():
     logger.info(f"Starting local server on port {HTTP_PORT}")
     logger.info(f"Device: {DEVICE_NAME} (ID: {DEVICE_ID})")
     logger.info(f"Local IP: {get_local_ip()}")
+    logger.info(f"State backend: {state_backend.describe()}")
+    if state_backend.shared and not SESSION_SECRET:
+        logger.warning("Shared state backend without SESSION_SECRET: "
+                       "tokens from one worker will be rejected by the others")
+    if state_backend.shared and not SIGNALING_MESSAGE_QUEUE:
+        logger.error("Shared state backend without SIGNALING_MESSAGE_QUEUE: offers and candidates "
+                     "for devices connected to another worker will be refused")
+    
+    # Public IP and ngrok lookups run in the background (and in parallel)
+    # so the port is bound without waiting on the network
+    network_info.start()
     
-    public_ip = get_public_ip()
-    if public_ip:
-        logger.info(f"Public IP: {public_ip}")
+    # Register with cloud signaling server (SIGNALING_SERVER='' for local only)
+    if SIGNALING_SERVER_URL:
+        threading.Thread(target=register_with_signaling_server, daemon=True).start()
     
-    # Register with cloud signaling server
-    threading.Thread(target=register_with_signaling_server, daemon=True).start()
+    if ICE_BATCH_WINDOW > 0:
+        socketio.start_background_task(ice_batcher.run)
+    socketio.start_background_task(presence_loop)
     
     # Start heartbeat thread
     heartbeat_thread = threading.Thread(target=heartbeat_loop, daemon=True)
     heartbeat_thread.start()
     
     # Register self locally
-    connected_devices[DEVICE_ID] = {
-        'device_id': DEVICE_ID,
-        'device_name': DEVICE_NAME,
-        'last_seen': datetime.utcnow().isoformat(),
-        'ip': get_local_ip()
-    }
+    device_registry.register(DEVICE_ID, DEVICE_NAME, get_local_ip(), cameras=cameras.ids())
+    
+    # Probing cameras, rebuilding the recording index and opening cameras
+    # for the recorders can take a while; /health answers in the meantime
+    socketio.start_background_task(start_cameras)
     
     # Run Flask-SocketIO server
-    socketio.run(app, host='0.0.0.0', port=HTTP_PORT, debug=False, allow_unsafe_werkzeug=True)
+    logger.info(f"Async mode: {ASYNC_MODE}")
+    if ASYNC_MODE == 'threading':
+        socketio.run(app, host='0.0.0.0', port=HTTP_PORT, debug=False, allow_unsafe_werkzeug=True)
+    else:
+        socketio.run(app, host='0.0.0.0', port=HTTP_PORT, debug=False)
 
 
 def main():
@@ -519,7 +2000,12 @@ def main():
         start_signaling_server()
     except KeyboardInterrupt:
         logger.info("Shutting down...")
-        streamer.stop_camera()
+        if signaling_client:
+            signaling_client.stop()
+        stop_recorders()
+        cameras.stop_all()
+        if encode_pool:
+            encode_pool.close()
         sys.exit(0)
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
@@ -0,0 +1,247 @@
+"""
+Metrics - Minimal Prometheus-style counters, gauges and histograms
+
+Updates on the hot path never take a lock: every thread accumulates into
+its own shard (a plain dict reached through threading.local), and shards
+are only summed when /metrics is scraped. Shards of finished threads are
+folded into a retired total whenever a new thread registers its shard, so
+short-lived request threads don't pile up even if nobody ever scrapes.
+
+Under eventlet/gevent monkey patching every green thread would get its
+own threading.local shard, and finished green threads still report
+is_alive(). Shards are then keyed by the real OS thread instead: green
+threads on one OS thread never preempt each other inside an update, and
+the number of OS threads (hub plus thread pool) is bounded.
+"""
+
+import bisect
+import math
+import sys
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+
+# Default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+class Registry:
+    """Collection of metrics rendered together in text exposition format"""
+
+    def __init__(self):
+        self.metrics: List['Metric'] = []
+        self.lock = threading.Lock()
+
+    def register(self, metric: 'Metric'):
+        with self.lock:
+            self.metrics.append(metric)
+
+    def render(self) -> str:
+        """All metrics in Prometheus text format (version 0.0.4)"""
+        with self.lock:
+            metrics = list(self.metrics)
+        lines = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def os_thread_primitives() -> Optional[Tuple[Callable[[], int], Callable[[], object]]]:
+    """(get_ident, allocate_lock) of real OS threads when threading is monkey patched, else None"""
+    patcher = sys.modules.get('eventlet.patcher')
+    if patcher is not None and patcher.is_monkey_patched('thread'):
+        original = patcher.original('_thread')
+        return original.get_ident, original.allocate_lock
+    monkey = sys.modules.get('gevent.monkey')
+    if monkey is not None and monkey.is_module_patched('threading'):
+        return monkey.get_original('_thread', 'get_ident'), monkey.get_original('_thread', 'allocate_lock')
+    return None
+
+
+def format_labels(names: Sequence[str], values: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    """Render {name="value",...} (empty string without labels)"""
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def format_value(value: float) -> str:
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """Base class handling per-thread shards"""
+
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.local = threading.local()
+        self.shards: List[Tuple[Optional[threading.Thread], dict]] = []  # thread None: OS thread shard
+        self.retired: dict = {}
+        primitives = os_thread_primitives()
+        if primitives is None:
+            self.os_ident = None
+            self.lock = threading.Lock()
+        else:
+            # A real lock: thread pool (tpool) threads update metrics too
+            self.os_ident, allocate_lock = primitives
+            self.lock = allocate_lock()
+        self.os_shards: Dict[int, dict] = {}
+        registry.register(self)
+
+    def _shard(self) -> dict:
+        """This thread's private accumulator, created on first use"""
+        if self.os_ident is not None:
+            return self._os_shard()
+        shard = getattr(self.local, 'shard', None)
+        if shard is None:
+            shard = {}
+            self.local.shard = shard
+            with self.lock:
+                self._retire_dead()
+                self.shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _os_shard(self) -> dict:
+        """Monkey patched: the shard of the OS thread running this green thread"""
+        ident = self.os_ident()
+        shard = self.os_shards.get(ident)
+        if shard is None:
+            with self.lock:
+                shard = self.os_shards.get(ident)
+                if shard is None:
+                    shard = self.os_shards[ident] = {}
+                    self.shards.append((None, shard))
+        return shard
+
+    def _retire_dead(self):
+        """Fold shards of finished threads into retired (lock held)"""
+        live = []
+        for thread, shard in self.shards:
+            if thread is None or thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._merge(self.retired, shard.copy())
+        self.shards = live
+
+    def _merge(self, total: dict, shard: dict):
+        raise NotImplementedError
+
+    def _collect(self) -> dict:
+        """Sum all shards, folding those of dead threads into retired"""
+        with self.lock:
+            self._retire_dead()
+
+            total: dict = {}
+            self._merge(total, self.retired)
+            for _, shard in self.shards:
+                # dict.copy() is atomic under the GIL, the owner may keep writing
+                self._merge(total, shard.copy())
+        return total
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    type = 'counter'
+
+    def inc(self, amount: float = 1, labels: Labels = ()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def _merge(self, total: dict, shard: dict):
+        for labels, value in shard.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        return [f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}'
+                for labels, value in sorted(self._collect().items())]
+
+
+class Gauge(Metric):
+    """Value that goes up and down, or is read from a callback at scrape time"""
+
+    type = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = REGISTRY, function: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames, registry)
+        self.function = function
+
+    def inc(self, amount: float = 1, labels: Labels = ()):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def dec(self, amount: float = 1, labels: Labels = ()):
+        self.inc(-amount, labels)
+
+    def _merge(self, total: dict, shard: dict):
+        for labels, value in shard.items():
+            total[labels] = total.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        if self.function is not None:
+            return [f'{self.name} {format_value(self.function())}']
+        return [f'{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}'
+                for labels, value in sorted(self._collect().items())]
+
+
+class Histogram(Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = REGISTRY, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, labels: Labels = ()):
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            # One slot per bucket plus +Inf, then sum and count
+            state = shard[labels] = [0] * (len(self.buckets) + 3)
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def _merge(self, total: dict, shard: dict):
+        for labels, state in shard.items():
+            merged = total.setdefault(labels, [0] * (len(self.buckets) + 3))
+            for i, value in enumerate(list(state)):
+                merged[i] += value
+
+    def render(self) -> List[str]:
+        lines = []
+        for labels, state in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), state):
+                cumulative += count
+                le = ('le', format_value(bound))
+                lines.append(f'{self.name}_bucket{format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_text = format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {format_value(state[-2])}')
+            lines.append(f'{self.name}_count{label_text} {state[-1]}')
+        return lines
@@ -0,0 +1,139 @@
+"""
+Motion Detector - Cheap scene-change detection on downscaled grayscale frames
+
+Each frame is reduced to a small grayscale thumbnail and compared with the
+last frame that was actually published. Frames that do not differ enough
+are skipped, except for a keyframe every few seconds so viewers still see
+a live image of a static scene.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+import numpy as np
+
+from lazy_import import LazyModule
+
+cv2 = LazyModule('cv2')
+
+logger = logging.getLogger(__name__)
+
+
+class MotionDetector:
+    """Frame-difference change detector with a keyframe floor"""
+
+    def __init__(self, threshold: float = 0.01, pixel_delta: int = 20,
+                 keyframe_interval: float = 5.0, hold_time: float = 2.0,
+                 size=(64, 48)):
+        """
+        Args:
+            threshold: Fraction of thumbnail pixels that must change
+            pixel_delta: Per-pixel gray level difference counted as a change
+            keyframe_interval: Publish at least one frame this often (seconds)
+            hold_time: Motion stays active this long after the last change
+            size: Thumbnail (width, height) used for the comparison
+        """
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.keyframe_interval = keyframe_interval
+        self.hold_time = hold_time
+        self.size = size
+
+        # Preallocated comparison buffers
+        self.reference = None
+        self.diff = np.empty((size[1], size[0]), dtype=np.int16)
+
+        self.last_publish = 0.0
+        self.last_motion = 0.0
+        self.score = 0.0
+        self.active = False
+        self.frames_analysed = 0
+        self.frames_skipped = 0
+        self.on_change: Optional[Callable[[bool, float], None]] = None
+        self.lock = threading.Lock()
+
+    def _thumbnail(self, image: Optional[np.ndarray], jpeg: Optional[bytes]) -> Optional[np.ndarray]:
+        """Small grayscale version of the frame"""
+        if jpeg is not None:
+            # libjpeg can decode straight to 1/8 scale grayscale, much cheaper
+            # than a full decode
+            gray = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+        elif image is not None:
+            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        else:
+            return None
+        if gray is None:
+            return None
+        return cv2.resize(gray, self.size, interpolation=cv2.INTER_AREA)
+
+    def should_publish(self, image: Optional[np.ndarray] = None, jpeg: Optional[bytes] = None) -> bool:
+        """
+        Analyse a captured frame.
+
+        Returns:
+            bool: True if the frame differs from the last published one or
+            a keyframe is due
+        """
+        thumbnail = self._thumbnail(image, jpeg)
+        if thumbnail is None:
+            return True
+
+        now = time.monotonic()
+        with self.lock:
+            self.frames_analysed += 1
+
+            if self.reference is None:
+                changed = True
+                self.score = 0.0
+            else:
+                np.subtract(thumbnail, self.reference, out=self.diff, dtype=np.int16)
+                np.abs(self.diff, out=self.diff)
+                self.score = np.count_nonzero(self.diff > self.pixel_delta) / self.diff.size
+                changed = self.score >= self.threshold
+
+            if changed:
+                self.last_motion = now
+            self._update_state(now)
+
+            if changed or now - self.last_publish >= self.keyframe_interval:
+                self.reference = thumbnail
+                self.last_publish = now
+                return True
+
+            self.frames_skipped += 1
+            return False
+
+    def _update_state(self, now: float):
+        """Track motion start/stop and notify on transitions"""
+        active = self.last_motion > 0 and now - self.last_motion < self.hold_time
+        if active == self.active:
+            return
+
+        self.active = active
+        logger.info(f"Motion {'started' if active else 'stopped'} (score {self.score:.3f})")
+        if self.on_change:
+            try:
+                self.on_change(active, self.score)
+            except Exception as e:
+                logger.error(f"Motion callback error: {e}")
+
+    def reset(self):
+        """Forget the reference frame, e.g. when the camera restarts"""
+        with self.lock:
+            self.reference = None
+            self.last_publish = 0.0
+
+    def status(self) -> dict:
+        """Current motion signal"""
+        with self.lock:
+            return {
+                'active': self.active,
+                'score': round(float(self.score), 4),
+                'seconds_since_motion': round(time.monotonic() - self.last_motion, 1) if self.last_motion else None,
+                'frames_analysed': self.frames_analysed,
+                'frames_skipped': self.frames_skipped,
+                'threshold': self.threshold,
+                'keyframe_interval': self.keyframe_interval
+            }
@@ -0,0 +1,117 @@
+"""
+Network Info - Background discovery of public IP and ngrok URL
+
+Both lookups go over the network (ipify, the local ngrok API with retries)
+and used to run one after the other before the server bound its port.
+Each is now a CachedProbe: started in the background at startup, run
+concurrently, and cached for a TTL. Callers that need a value can wait
+for it with a timeout, and a stale value is refreshed in the background
+while the old one is still returned.
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+PUBLIC_IP_URL = os.environ.get('PUBLIC_IP_URL', 'https://api.ipify.org?format=json')
+
+
+class CachedProbe:
+    """A value fetched in the background and cached for ttl seconds"""
+
+    def __init__(self, name: str, fetch: Callable[[], Optional[str]], ttl: float = 600,
+                 failure_ttl: float = 60):
+        """
+        Args:
+            name: For logging
+            fetch: Blocking lookup, returns None when unavailable
+            ttl: Seconds a found value stays fresh
+            failure_ttl: Seconds before retrying after a failed lookup
+        """
+        self.name = name
+        self.fetch = fetch
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.value: Optional[str] = None
+        self.expires = 0.0  # monotonic
+        self.fetched = threading.Event()  # set after the first lookup finished
+        self.running = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Begin a lookup in the background unless one is running"""
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        threading.Thread(target=self._run, daemon=True, name=f'probe-{self.name}').start()
+
+    def _run(self):
+        try:
+            value = self.fetch()
+        except Exception as e:
+            logger.debug(f"{self.name} lookup failed: {e}")
+            value = None
+
+        with self.lock:
+            if value is not None:
+                if value != self.value:
+                    logger.info(f"{self.name}: {value}")
+                self.value = value
+            self.expires = time.monotonic() + (self.ttl if value is not None else self.failure_ttl)
+            self.running = False
+        self.fetched.set()
+
+    def get(self, wait: float = 0) -> Optional[str]:
+        """
+        Cached value, refreshed in the background once stale.
+
+        Args:
+            wait: Seconds to wait if the first lookup has not finished
+        """
+        if time.monotonic() >= self.expires:
+            self.start()
+        if wait and not self.fetched.is_set():
+            self.fetched.wait(wait)
+        return self.value
+
+
+def fetch_public_ip() -> Optional[str]:
+    import http_client
+    response = http_client.get(PUBLIC_IP_URL, timeout=5)
+    return response.json()['ip']
+
+
+def fetch_ngrok_url() -> Optional[str]:
+    from ngrok_helper import get_ngrok_url
+    return get_ngrok_url(max_retries=3, retry_delay=1)
+
+
+public_ip = CachedProbe('Public IP', fetch_public_ip)
+ngrok_url = CachedProbe('Ngrok URL', fetch_ngrok_url, ttl=300, failure_ttl=30)
+
+
+def start():
+    """Kick off all lookups at once"""
+    public_ip.start()
+    ngrok_url.start()
+
+
+def connection_url(port: int, wait: float = 0) -> str:
+    """
+    URL other machines should use: the ngrok tunnel, else the public IP.
+
+    Args:
+        port: Local HTTP port, used with the public IP
+        wait: Seconds to wait for lookups still running (in parallel)
+    """
+    deadline = time.monotonic() + wait
+    url = ngrok_url.get(wait)
+    if url:
+        return url
+    ip = public_ip.get(max(0.0, deadline - time.monotonic()))
+    return f"http://{ip}:{port}" if ip else f"http://localhost:{port}"
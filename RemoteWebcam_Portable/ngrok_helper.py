@@ -7,8 +7,12 @@ import time
 import logging
 import os
 
+import http_client
+
 logger = logging.getLogger(__name__)
 
+NGROK_API_URL = os.environ.get('NGROK_API_URL', 'http://localhost:4040/api/tunnels')
+
 
 def get_ngrok_url(max_retries=10, retry_delay=2):
     """
@@ -24,7 +28,8 @@ def get_ngrok_url(max_retries=10, retry_delay=2):
     for attempt in range(max_retries):
         try:
             # Try to get URL from ngrok API
-            response = requests.get('http://localhost:4040/api/tunnels', timeout=2)
+            # Shared session: polling the local API reuses one connection
+            response = http_client.get(NGROK_API_URL, timeout=2)
             if response.status_code == 200:
                 data = response.json()
                 tunnels = data.get('tunnels', [])
@@ -109,7 +114,7 @@ def get_connection_url():
     
     # Fallback to public IP
     try:
-        response = requests.get('https://api.ipify.org?format=json', timeout=5)
+        response = http_client.get('https://api.ipify.org?format=json', timeout=5)
         public_ip = response.json()['ip']
         return f"http://{public_ip}:5000"
     except:
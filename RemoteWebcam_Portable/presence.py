@@ -0,0 +1,143 @@
+"""
+Presence - Online/offline tracking for registered devices
+
+Liveness is kept on the monotonic clock and expiry goes through a min-heap
+with one entry per device. A heartbeat only moves the device's deadline
+(O(1)); when its heap entry surfaces in a sweep, a deadline that has moved
+on is pushed back instead of expiring, so sweeps only touch devices that
+are actually due.
+
+Listing devices is served from a JSON document that is rebuilt only when
+presence changes (a device comes, goes, or changes its details), not on
+every heartbeat.
+"""
+
+import heapq
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Fields that change on every heartbeat and are not a presence change
+VOLATILE_FIELDS = ('last_seen',)
+
+
+class PresenceTracker:
+    """Online set with TTL expiry and a cached listing"""
+
+    def __init__(self, ttl: float = 90.0):
+        """
+        Args:
+            ttl: Seconds without a heartbeat before a device goes offline
+        """
+        self.ttl = ttl
+        self.devices: Dict[str, dict] = {}  # device_id -> info, online only
+        self.deadlines: Dict[str, float] = {}  # device_id -> monotonic expiry
+        self.heap: List[Tuple[float, str]] = []  # (expiry at push time, device_id)
+        self.scheduled = set()  # device ids with an entry in the heap
+        self.on_change: Optional[Callable[[str, bool, dict], None]] = None
+        self.version = 0
+        self.cached: Optional[bytes] = None
+        self.cached_version = -1
+        self.lock = threading.Lock()
+
+    def seen(self, device_id: str, info: dict, ttl: Optional[float] = None):
+        """Heartbeat: mark online (or keep online) until now + ttl"""
+        expiry = time.monotonic() + (ttl or self.ttl)
+        with self.lock:
+            previous = self.devices.get(device_id)
+            self.deadlines[device_id] = expiry
+            if device_id not in self.scheduled:
+                heapq.heappush(self.heap, (expiry, device_id))
+                self.scheduled.add(device_id)
+            self.devices[device_id] = info
+
+            came_online = previous is None
+            if came_online or self._details(previous) != self._details(info):
+                self.version += 1
+        if came_online:
+            self._notify(device_id, True, info)
+
+    def remove(self, device_id: str):
+        """Explicit offline, e.g. the device disconnected"""
+        with self.lock:
+            info = self._drop(device_id)
+        if info is not None:
+            self._notify(device_id, False, info)
+
+    def expire(self) -> List[str]:
+        """Take devices whose deadline passed offline, returns their ids"""
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                _, device_id = heapq.heappop(self.heap)
+                self.scheduled.discard(device_id)
+                deadline = self.deadlines.get(device_id)
+                if deadline is None:
+                    continue  # Removed since it was scheduled
+                if deadline > now:
+                    # Heartbeats moved the deadline on, reschedule
+                    heapq.heappush(self.heap, (deadline, device_id))
+                    self.scheduled.add(device_id)
+                    continue
+                info = self._drop(device_id)
+                if info is not None:
+                    expired.append((device_id, info))
+        for device_id, info in expired:
+            logger.info(f"Device {device_id} went offline (no heartbeat for {self.ttl:g}s)")
+            self._notify(device_id, False, info)
+        return [device_id for device_id, _ in expired]
+
+    def sync(self, devices: List[dict]):
+        """Mirror a device list from a shared store: refresh those present, drop the rest"""
+        present = {info['device_id'] for info in devices}
+        for info in devices:
+            self.seen(info['device_id'], info)
+        for device_id in [device_id for device_id in list(self.devices) if device_id not in present]:
+            self.remove(device_id)
+
+    def _drop(self, device_id: str) -> Optional[dict]:
+        info = self.devices.pop(device_id, None)
+        self.deadlines.pop(device_id, None)
+        if info is not None:
+            self.version += 1
+        return info
+
+    @staticmethod
+    def _details(info: dict) -> dict:
+        return {key: value for key, value in info.items() if key not in VOLATILE_FIELDS}
+
+    def _notify(self, device_id: str, online: bool, info: dict):
+        if self.on_change:
+            try:
+                self.on_change(device_id, online, info)
+            except Exception as e:
+                logger.error(f"Presence callback error: {e}")
+
+    def is_online(self, device_id: str) -> bool:
+        return device_id in self.devices
+
+    def __len__(self) -> int:
+        return len(self.devices)
+
+    def listing(self, render: Callable[[List[dict]], dict]) -> bytes:
+        """
+        JSON document for the device list, rebuilt only after a change.
+
+        Args:
+            render: Turns the online device infos into the response object
+        """
+        with self.lock:
+            if self.cached is not None and self.cached_version == self.version:
+                return self.cached
+            version = self.version
+            devices = [dict(info) for info in self.devices.values()]
+        cached = json.dumps(render(devices)).encode()
+        with self.lock:
+            if self.version == version:
+                self.cached, self.cached_version = cached, version
+        return cached
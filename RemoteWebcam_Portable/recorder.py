@@ -0,0 +1,402 @@
+"""
+Recorder - Segmented MJPEG recordings fed by the shared capture pipeline
+
+The capture thread hands each published frame to submit(), which only does
+a non-blocking put on a bounded queue: when the disk falls behind, frames
+are dropped from the recording rather than delaying capture. A writer
+thread takes it from there. It keeps the last few seconds of JPEGs in a
+ring buffer (the pre-roll), and while recording it appends frames to AVI
+segments of a fixed length.
+
+Frames are already JPEG (camera passthrough or the shared default tier), so
+segments are written as MJPEG-in-AVI directly instead of going through
+cv2.VideoWriter, which would decode and re-encode every frame.
+
+AVI stores a single frame rate, but published frames are irregular: with
+motion detection on, an unchanged scene only publishes a keyframe every
+few seconds. Segments are therefore written at the nominal rate, each
+frame in the slot of its capture time, and slots without a new frame get
+an empty chunk, which players show as a repeat of the previous frame (as
+ffmpeg does when it fills timestamp gaps). Playback speed stays correct
+and a static scene costs 8 bytes per slot.
+"""
+
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+AVIF_HASINDEX = 0x10
+AVIIF_KEYFRAME = 0x10
+
+# Fixed size of everything before the first frame chunk (RIFF header, hdrl
+# list with avih/strh/strf, movi list header)
+AVI_HEADER_SIZE = 12 + 12 + 64 + 12 + 64 + 48 + 12
+MOVI_OFFSET = AVI_HEADER_SIZE - 4  # position of the 'movi' fourcc
+
+
+def jpeg_size(data: bytes) -> Tuple[int, int]:
+    """(width, height) from the SOF marker of a JPEG, (0, 0) if not found"""
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7 or marker == 0xFF:
+            i += 1 if marker == 0xFF else 2
+            continue
+        length = struct.unpack('>H', data[i + 2:i + 4])[0]
+        # SOF0..SOF15 except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return width, height
+        i += 2 + length
+    return 0, 0
+
+
+class AviSegment:
+    """One constant frame rate MJPEG-in-AVI file, finalized with an idx1 index on close"""
+
+    def __init__(self, path: str, width: int, height: int, fps: float):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.max_frame = 0
+        self.file = open(path, 'wb')
+        self.file.write(self._header(0, 0, fps, 0))
+        self.size = AVI_HEADER_SIZE
+        # Per slot: (slot time, absolute offset of the JPEG data, JPEG size);
+        # repeated slots point at the frame they repeat
+        self.frames: List[Tuple[float, int, int]] = []
+        # Per slot: (absolute offset of the chunk data, chunk size) for idx1,
+        # size 0 for a repeat
+        self.chunks: List[Tuple[int, int]] = []
+
+    @property
+    def start_time(self) -> float:
+        return self.frames[0][0] if self.frames else 0.0
+
+    @property
+    def end_time(self) -> float:
+        return self.frames[-1][0] if self.frames else 0.0
+
+    def _header(self, riff_size: int, movi_size: int, fps: float, frame_count: int) -> bytes:
+        rate = max(1, round(fps * 1000))
+        avih = struct.pack('<14I', round(1e6 / max(fps, 0.001)), self.max_frame * max(1, round(fps)),
+                           0, AVIF_HASINDEX, frame_count, 0, 1, self.max_frame,
+                           self.width, self.height, 0, 0, 0, 0)
+        strh = struct.pack('<4s4sIHHIIIIIIIIhhhh', b'vids', b'MJPG', 0, 0, 0, 0, 1000, rate, 0,
+                           frame_count, self.max_frame, 0xFFFFFFFF, 0, 0, 0, self.width, self.height)
+        strf = struct.pack('<IiiHH4sIiiII', 40, self.width, self.height, 1, 24, b'MJPG',
+                           self.width * self.height * 3, 0, 0, 0, 0)
+        strl = b'LIST' + struct.pack('<I', 4 + 8 + len(strh) + 8 + len(strf)) + b'strl' + \
+            b'strh' + struct.pack('<I', len(strh)) + strh + b'strf' + struct.pack('<I', len(strf)) + strf
+        hdrl = b'LIST' + struct.pack('<I', 4 + 8 + len(avih) + len(strl)) + b'hdrl' + \
+            b'avih' + struct.pack('<I', len(avih)) + avih + strl
+        return b'RIFF' + struct.pack('<I', riff_size) + b'AVI ' + hdrl + \
+            b'LIST' + struct.pack('<I', movi_size) + b'movi'
+
+    def _slot(self, timestamp: float) -> int:
+        return round((timestamp - self.start_time) * self.fps) if self.frames else 0
+
+    def pad(self, until: float):
+        """Repeat the last frame in every slot up to until"""
+        target = self._slot(until)
+        if not self.frames:
+            return
+        _, offset, size = self.frames[-1]
+        while len(self.frames) < target:
+            self.file.write(b'00dc' + struct.pack('<I', 0))
+            self.chunks.append((self.size + 8, 0))
+            self.frames.append((self.start_time + len(self.frames) / self.fps, offset, size))
+            self.size += 8
+
+    def write(self, jpeg: bytes, timestamp: float) -> bool:
+        """
+        Put one frame as a '00dc' chunk in the slot of its timestamp.
+
+        Returns:
+            bool: False if that slot is already taken (frames arriving
+            faster than the nominal rate) and the frame was skipped
+        """
+        self.pad(timestamp)
+        if self.frames and self._slot(timestamp) < len(self.frames):
+            return False
+        padding = b'\x00' if len(jpeg) % 2 else b''
+        self.file.write(b'00dc' + struct.pack('<I', len(jpeg)))
+        self.file.write(jpeg)
+        if padding:
+            self.file.write(padding)
+        slot_time = self.start_time + len(self.frames) / self.fps if self.frames else timestamp
+        self.chunks.append((self.size + 8, len(jpeg)))
+        self.frames.append((slot_time, self.size + 8, len(jpeg)))
+        self.size += 8 + len(jpeg) + len(padding)
+        self.max_frame = max(self.max_frame, len(jpeg))
+        return True
+
+    def close(self):
+        """Write idx1 and patch the header with the real frame count"""
+        movi_size = self.size - MOVI_OFFSET
+        index = b''.join(struct.pack('<4sIII', b'00dc', AVIIF_KEYFRAME if size else 0,
+                                     offset - 8 - MOVI_OFFSET, size)
+                         for offset, size in self.chunks)
+        self.file.write(b'idx1' + struct.pack('<I', len(index)) + index)
+        self.size += 8 + len(index)
+
+        self.file.seek(0)
+        self.file.write(self._header(self.size - 8, movi_size, self.fps, len(self.chunks)))
+        self.file.close()
+
+
+class RetentionPolicy:
+    """Deletes the oldest recordings once a directory exceeds its budget"""
+
+    def __init__(self, directory: str, max_bytes: int, max_age: float = 0):
+        """
+        Args:
+            directory: Recordings root (searched recursively)
+            max_bytes: Disk budget for all recordings, 0 for unlimited
+            max_age: Delete recordings older than this many seconds, 0 to keep
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.on_delete: Optional[Callable[[str], None]] = None
+        self.lock = threading.Lock()
+
+    def enforce(self) -> List[str]:
+        """Delete segments over budget, oldest first"""
+        with self.lock:
+            segments = []
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if name.endswith('.avi'):
+                        path = os.path.join(root, name)
+                        try:
+                            stat = os.stat(path)
+                        except OSError:
+                            continue
+                        segments.append((stat.st_mtime, stat.st_size, path))
+            segments.sort()
+
+            total = sum(size for _, size, _ in segments)
+            now = time.time()
+            deleted = []
+            for mtime, size, path in segments:
+                over_budget = self.max_bytes and total > self.max_bytes
+                too_old = self.max_age and now - mtime > self.max_age
+                if not (over_budget or too_old):
+                    break
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not delete recording {path}: {e}")
+                    continue
+                total -= size
+                deleted.append(path)
+                if self.on_delete:
+                    self.on_delete(path)
+
+        if deleted:
+            logger.info(f"Retention removed {len(deleted)} recording(s)")
+        return deleted
+
+
+class Recorder:
+    """Continuous or triggered recording for one camera"""
+
+    def __init__(self, camera_id: str, directory: str, retention: RetentionPolicy,
+                 continuous: bool = False, segment_seconds: float = 60,
+                 pre_roll: float = 10, post_roll: float = 15,
+                 fps: float = 30, quality: int = 80, queue_size: int = 64):
+        """
+        Args:
+            camera_id: Used for the sub-directory and file names
+            directory: Recordings root
+            retention: Shared disk budget, enforced after every segment
+            continuous: Record all the time instead of only after trigger()
+            segment_seconds: Length of each file
+            pre_roll: Seconds of footage before a trigger to keep in memory
+            post_roll: Seconds to keep recording after the last trigger
+            fps: Frame rate of the segments; gaps are filled with repeats
+            quality: JPEG quality used for frames that are not JPEG yet
+            queue_size: Frames buffered between capture and writer
+        """
+        self.camera_id = camera_id
+        self.directory = os.path.join(directory, camera_id)
+        self.retention = retention
+        self.continuous = continuous
+        self.segment_seconds = segment_seconds
+        self.pre_roll = pre_roll
+        self.post_roll = post_roll
+        self.fps = fps
+        self.quality = quality
+
+        self.queue: 'queue.Queue' = queue.Queue(maxsize=queue_size)
+        self.ring: deque = deque()  # (timestamp, jpeg), only touched by the writer
+        self.segment: Optional[AviSegment] = None
+        self.record_until = 0.0  # wall clock, for triggered recording
+        self.last_jpeg: Optional[bytes] = None  # last frame written, carried into the next segment
+        self.on_segment_closed: Optional[Callable[[AviSegment], None]] = None
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.bytes_written = 0
+        self.segments_closed = 0
+        self.running = False
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the writer thread"""
+        if self.running:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self.running = True
+        self.thread = threading.Thread(target=self._writer_loop, daemon=True,
+                                       name=f'recorder-{self.camera_id}')
+        self.thread.start()
+        logger.info(f"Recorder for {self.camera_id} started "
+                    f"({'continuous' if self.continuous else 'triggered'}) in {self.directory}")
+
+    def stop(self):
+        """Flush and close the current segment"""
+        if not self.running:
+            return
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.thread = None
+
+    def submit(self, frame):
+        """Hand a published CachedFrame to the writer; never blocks"""
+        if not self.running:
+            return
+        try:
+            self.queue.put_nowait(frame)
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def trigger(self, duration: Optional[float] = None):
+        """Record from pre-roll until duration (default post_roll) from now"""
+        until = time.time() + (duration if duration is not None else self.post_roll)
+        self.record_until = max(self.record_until, until)
+
+    @property
+    def recording(self) -> bool:
+        return self.continuous or time.time() < self.record_until
+
+    def _writer_loop(self):
+        while self.running:
+            try:
+                frame = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                if not self.recording:
+                    self._close_segment(self.record_until)
+                continue
+            if frame is None:
+                break
+
+            try:
+                jpeg = frame.jpeg or frame.encode(self.quality)
+                if not jpeg:
+                    continue
+                self._handle(jpeg, frame.timestamp)
+            except Exception as e:
+                logger.error(f"Recorder error: {e}")
+                self._close_segment()
+
+        self._close_segment(time.time() if self.continuous else min(time.time(), self.record_until))
+
+    def _handle(self, jpeg: bytes, timestamp: float):
+        if not self.recording:
+            self._close_segment(self.record_until)
+            if self.pre_roll > 0:
+                self.ring.append((timestamp, jpeg))
+                # Keep the newest frame from before the window: it is what
+                # the (unchanged) scene looked like when the window starts
+                while len(self.ring) > 1 and timestamp - self.ring[1][0] > self.pre_roll:
+                    self.ring.popleft()
+            return
+
+        # Just triggered: the pre-roll goes in first, starting with the
+        # newest frame from before the window (older ones would take its slot)
+        window_start = timestamp - self.pre_roll
+        while len(self.ring) > 1 and self.ring[1][0] <= window_start:
+            self.ring.popleft()
+        while self.ring:
+            ring_timestamp, ring_jpeg = self.ring.popleft()
+            self._write(ring_jpeg, max(ring_timestamp, window_start))
+        self._write(jpeg, timestamp)
+
+    def _write(self, jpeg: bytes, timestamp: float):
+        segment = self.segment
+        while segment is not None and timestamp - segment.start_time >= self.segment_seconds:
+            boundary = segment.start_time + self.segment_seconds
+            self._close_segment(boundary)
+            segment = None
+            if timestamp > boundary and self.last_jpeg is not None:
+                # Nothing new since the last frame: it opens the next segment
+                segment = self._open(self.last_jpeg, boundary)
+
+        if segment is None:
+            segment = self._open(jpeg, timestamp)
+        elif not segment.write(jpeg, timestamp):
+            return
+        self.last_jpeg = jpeg
+        self.frames_written += 1
+        self.bytes_written += len(jpeg)
+
+    def _open(self, jpeg: bytes, timestamp: float) -> AviSegment:
+        """Start a segment with jpeg as its first frame"""
+        width, height = jpeg_size(jpeg)
+        name = f"{self.camera_id}_{datetime.fromtimestamp(timestamp).strftime('%Y%m%d_%H%M%S_%f')[:-3]}.avi"
+        segment = self.segment = AviSegment(os.path.join(self.directory, name), width, height, self.fps)
+        logger.info(f"Recording {segment.path}")
+        segment.write(jpeg, timestamp)
+        return segment
+
+    def _close_segment(self, until: Optional[float] = None):
+        """Close the current segment, repeating its last frame up to until"""
+        segment, self.segment = self.segment, None
+        if segment is None:
+            return
+
+        if until is not None:
+            segment.pad(min(until, segment.start_time + self.segment_seconds))
+        segment.close()
+        self.segments_closed += 1
+        logger.info(f"Closed {segment.path}: {len(segment.frames)} frames, "
+                    f"{segment.end_time - segment.start_time:.1f}s")
+        if self.on_segment_closed:
+            try:
+                self.on_segment_closed(segment)
+            except Exception as e:
+                logger.error(f"Segment callback error: {e}")
+        self.retention.enforce()
+
+    def status(self) -> dict:
+        segment = self.segment
+        return {
+            'mode': 'continuous' if self.continuous else 'triggered',
+            'recording': self.recording,
+            'current_segment': os.path.basename(segment.path) if segment else None,
+            'pre_roll_frames': len(self.ring),
+            'queued': self.queue.qsize(),
+            'frames_written': self.frames_written,
+            'frames_dropped': self.frames_dropped,
+            'bytes_written': self.bytes_written,
+            'segments': self.segments_closed
+        }
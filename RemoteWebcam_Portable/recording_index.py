@@ -0,0 +1,301 @@
+"""
+Recording Index - SQLite catalogue of recorded segments for seeking
+
+One row per segment with its time range, plus a compact blob holding the
+capture timestamp, byte offset and size of every frame (all MJPEG frames
+are keyframes). Seeking to a timestamp is an indexed range query followed
+by a bisect in that blob; nothing has to open or scan the video files.
+
+Segments found on disk but missing from the index (e.g. after a crash or
+when the database was deleted) are rebuilt from the AVI idx1 chunk, or by
+walking the movi list when the file was never finalized.
+"""
+
+import bisect
+import logging
+import os
+import sqlite3
+import struct
+import threading
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from recorder import jpeg_size
+
+logger = logging.getLogger(__name__)
+
+FRAME_ENTRY = struct.Struct('<dQI')  # timestamp, absolute offset, size
+
+
+def pack_frames(frames: List[Tuple[float, int, int]]) -> bytes:
+    return b''.join(FRAME_ENTRY.pack(*frame) for frame in frames)
+
+
+def unpack_frames(blob: bytes) -> List[Tuple[float, int, int]]:
+    return list(FRAME_ENTRY.iter_unpack(blob))
+
+
+def segment_start_from_name(path: str) -> Optional[float]:
+    """Start time encoded in a recorder file name (<camera>_YYYYmmdd_HHMMSS_mmm.avi)"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    try:
+        date, clock, millis = stem.rsplit('_', 3)[-3:]
+        started = datetime.strptime(f'{date}_{clock}', '%Y%m%d_%H%M%S')
+        return started.timestamp() + int(millis) / 1000
+    except ValueError:
+        return None
+
+
+def read_avi_index(path: str) -> Tuple[List[Tuple[int, int]], float]:
+    """
+    Frame positions of an MJPEG AVI file.
+
+    Empty chunks repeat the previous frame and are reported as that frame,
+    so the list has one entry per frame interval.
+
+    Returns:
+        ([(absolute data offset, size), ...], frames per second)
+    """
+    frames = []
+    fps = 0.0
+    movi = None
+    with open(path, 'rb') as f:
+        if f.read(12)[8:12] != b'AVI ':
+            raise ValueError(f'{path} is not an AVI file')
+        file_size = os.fstat(f.fileno()).st_size
+
+        while f.tell() + 8 <= file_size:
+            position = f.tell()
+            fourcc, size = struct.unpack('<4sI', f.read(8))
+            if fourcc == b'LIST':
+                kind = f.read(4)
+                if kind == b'hdrl':
+                    header = f.read(size - 4)
+                    avih = header.find(b'avih')
+                    if avih >= 0:
+                        usec_per_frame = struct.unpack('<I', header[avih + 8:avih + 12])[0]
+                        fps = 1e6 / usec_per_frame if usec_per_frame else 0.0
+                    continue
+                if kind == b'movi':
+                    movi = position + 8
+                    if size == 0:
+                        # Never finalized: walk the chunks to the end of the file
+                        size = file_size - movi
+                    movi_end = movi + size
+                    if not frames:
+                        chunk = movi + 4
+                        while chunk + 8 <= movi_end:
+                            f.seek(chunk)
+                            chunk_id, chunk_size = struct.unpack('<4sI', f.read(8))
+                            if chunk_id == b'idx1' or chunk + 8 + chunk_size > file_size:
+                                break
+                            if chunk_id[2:] in (b'dc', b'db'):
+                                frames.append((chunk + 8, chunk_size))
+                            chunk += 8 + chunk_size + (chunk_size & 1)
+                    f.seek(movi_end + (size & 1))
+                    continue
+            elif fourcc == b'idx1' and movi is not None:
+                entries = f.read(size)
+                # Offsets are relative to the 'movi' fourcc, prefer them over the walk
+                indexed = [(movi + offset + 8, chunk_size)
+                           for chunk_id, _, offset, chunk_size in struct.iter_unpack('<4sIII', entries)
+                           if chunk_id[2:] in (b'dc', b'db')]
+                if indexed:
+                    frames = indexed
+            f.seek(position + 8 + size + (size & 1))
+
+    resolved = []
+    for offset, size in frames:
+        if size == 0:
+            if not resolved:
+                continue
+            offset, size = resolved[-1]
+        resolved.append((offset, size))
+    return resolved, fps
+
+
+class RecordingIndex:
+    """Thread-safe segment catalogue in a SQLite file"""
+
+    COLUMNS = 'id, camera_id, path, start_time, end_time, frame_count, size, width, height'
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                camera_id TEXT NOT NULL,
+                path TEXT NOT NULL UNIQUE,
+                start_time REAL NOT NULL,
+                end_time REAL NOT NULL,
+                frame_count INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                width INTEGER,
+                height INTEGER,
+                frames BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS segments_by_time ON segments (camera_id, start_time);
+        ''')
+        self.db.commit()
+
+    def add(self, camera_id: str, path: str, frames: List[Tuple[float, int, int]],
+            width: int = 0, height: int = 0) -> Optional[int]:
+        """Record a finished segment, returns its id"""
+        if not frames:
+            return None
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return None
+        with self.lock:
+            cursor = self.db.execute(
+                'INSERT OR REPLACE INTO segments '
+                '(camera_id, path, start_time, end_time, frame_count, size, width, height, frames) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (camera_id, os.path.abspath(path), frames[0][0], frames[-1][0], len(frames),
+                 size, width, height, pack_frames(frames))
+            )
+            self.db.commit()
+            return cursor.lastrowid
+
+    def add_segment(self, camera_id: str, segment) -> Optional[int]:
+        """Index a closed recorder.AviSegment"""
+        return self.add(camera_id, segment.path, segment.frames, segment.width, segment.height)
+
+    def remove(self, path: str):
+        with self.lock:
+            self.db.execute('DELETE FROM segments WHERE path = ?', (os.path.abspath(path),))
+            self.db.commit()
+
+    def rebuild(self, directory: str) -> int:
+        """
+        Sync the index with the files under directory.
+
+        Drops rows whose file is gone and indexes .avi files the database
+        does not know about. Frame timestamps of rebuilt segments come from
+        the start time in the file name plus the header frame rate.
+
+        Returns:
+            int: Number of segments added
+        """
+        with self.lock:
+            known = {row[0] for row in self.db.execute('SELECT path FROM segments')}
+        for path in known:
+            if not os.path.exists(path):
+                self.remove(path)
+
+        added = 0
+        for root, _, files in os.walk(directory):
+            for name in sorted(files):
+                path = os.path.abspath(os.path.join(root, name))
+                if not name.endswith('.avi') or path in known:
+                    continue
+                start = segment_start_from_name(path)
+                if start is None:
+                    continue
+                try:
+                    positions, fps = read_avi_index(path)
+                except (OSError, ValueError, struct.error) as e:
+                    logger.warning(f"Cannot index {path}: {e}")
+                    continue
+                if not positions:
+                    continue
+                interval = 1 / fps if fps else 0
+                frames = [(start + i * interval, offset, size) for i, (offset, size) in enumerate(positions)]
+                with open(path, 'rb') as f:
+                    f.seek(positions[0][0])
+                    width, height = jpeg_size(f.read(min(positions[0][1], 65536)))
+                camera_id = os.path.basename(root)
+                if self.add(camera_id, path, frames, width, height) is not None:
+                    added += 1
+
+        if added:
+            logger.info(f"Indexed {added} recording(s) found on disk")
+        return added
+
+    @staticmethod
+    def _row(row) -> dict:
+        segment_id, camera_id, path, start, end, count, size, width, height = row
+        return {
+            'id': segment_id,
+            'camera_id': camera_id,
+            'path': path,
+            'start_time': start,
+            'end_time': end,
+            'duration': round(end - start, 3),
+            'frames': count,
+            'size': size,
+            'width': width,
+            'height': height
+        }
+
+    def list(self, camera_id: Optional[str] = None, start: Optional[float] = None,
+             end: Optional[float] = None, limit: int = 100) -> List[dict]:
+        """Segments overlapping [start, end], newest first"""
+        query = f'SELECT {self.COLUMNS} FROM segments WHERE 1'
+        params: list = []
+        if camera_id:
+            query += ' AND camera_id = ?'
+            params.append(camera_id)
+        if start is not None:
+            query += ' AND end_time >= ?'
+            params.append(start)
+        if end is not None:
+            query += ' AND start_time <= ?'
+            params.append(end)
+        query += ' ORDER BY start_time DESC LIMIT ?'
+        params.append(limit)
+        with self.lock:
+            return [self._row(row) for row in self.db.execute(query, params)]
+
+    def get(self, segment_id: int) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute(f'SELECT {self.COLUMNS} FROM segments WHERE id = ?',
+                                  (segment_id,)).fetchone()
+        return self._row(row) if row else None
+
+    def seek(self, camera_id: str, timestamp: float) -> Optional[dict]:
+        """
+        Locate the frame shown at timestamp.
+
+        Falls forward to the first frame of the next segment when timestamp
+        lies in a gap between recordings.
+
+        Returns:
+            Segment dict plus frame_index, frame_time, offset and length of
+            the JPEG in the file, or None when nothing was recorded after it
+        """
+        with self.lock:
+            row = self.db.execute(
+                f'SELECT {self.COLUMNS}, frames FROM segments '
+                'WHERE camera_id = ? AND start_time <= ? ORDER BY start_time DESC LIMIT 1',
+                (camera_id, timestamp)
+            ).fetchone()
+            if row is None or row[4] < timestamp:
+                row = self.db.execute(
+                    f'SELECT {self.COLUMNS}, frames FROM segments '
+                    'WHERE camera_id = ? AND start_time > ? ORDER BY start_time LIMIT 1',
+                    (camera_id, timestamp)
+                ).fetchone()
+        if row is None:
+            return None
+
+        segment = self._row(row[:-1])
+        frames = unpack_frames(row[-1])
+        times = [frame[0] for frame in frames]
+        index = max(0, bisect.bisect_right(times, timestamp) - 1)
+        frame_time, offset, length = frames[index]
+        segment.update({
+            'frame_index': index,
+            'frame_time': frame_time,
+            'offset': offset,
+            'length': length
+        })
+        return segment
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,146 @@
+"""
+Session Auth - Signed, expiring session tokens with cached verification
+
+Tokens look like <id>.<issued ms>.<expires>.<signature> where the signature
+is an HMAC-SHA256 over the first three fields. Verification is constant time
+and recently verified tokens are kept in a small LRU, so checking a token
+on every frame poll costs a dict lookup. Tokens can be revoked one by one
+or all at once without restarting the service.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class TokenAuthority:
+    """Issues and verifies HMAC session tokens"""
+
+    def __init__(self, secret: Optional[bytes] = None, ttl: float = 12 * 3600, cache_size: int = 1024):
+        """
+        Args:
+            secret: HMAC key; a random one means tokens die with the process
+            ttl: Token lifetime in seconds
+            cache_size: Number of verified tokens kept in the LRU
+        """
+        self.secret = secret or os.urandom(32)
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.verified: 'OrderedDict[str, Tuple[str, int, int]]' = OrderedDict()  # token -> (id, issued, expires)
+        self.revoked = {}  # token id -> expires, kept until the token would expire anyway
+        self.not_before = 0  # tokens issued before this (ms) are revoked
+        self.lock = threading.Lock()
+
+    def _sign(self, message: str) -> str:
+        digest = hmac.new(self.secret, message.encode(), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b'=').decode()
+
+    def issue(self) -> Tuple[str, int]:
+        """
+        Create a new session token.
+
+        Returns:
+            (token, expires unix timestamp)
+        """
+        token_id = os.urandom(9).hex()
+        now = time.time()
+        with self.lock:
+            # Within the millisecond of a revoke_all, still count as after it
+            issued = max(int(now * 1000), self.not_before)
+        expires = int(now + self.ttl)
+        message = f'{token_id}.{issued}.{expires}'
+        return f'{message}.{self._sign(message)}', expires
+
+    def verify(self, token: Optional[str]) -> bool:
+        """Check signature, expiry and revocation, using the LRU when possible"""
+        if not token:
+            return False
+        now = time.time()
+
+        with self.lock:
+            entry = self.verified.get(token)
+            if entry is not None:
+                _, issued, expires = entry
+                if expires > now and issued >= self.not_before:
+                    self.verified.move_to_end(token)
+                    return True
+                del self.verified[token]
+                return False
+
+        parsed = self._parse(token)
+        if parsed is None:
+            return False
+        token_id, issued, expires = parsed
+        if expires <= now:
+            return False
+
+        with self.lock:
+            if token_id in self.revoked or issued < self.not_before:
+                return False
+            self.verified[token] = parsed
+            if len(self.verified) > self.cache_size:
+                self.verified.popitem(last=False)
+        return True
+
+    def _parse(self, token: str) -> Optional[Tuple[str, int, int]]:
+        """Split and check the signature of a token"""
+        try:
+            message, signature = token.rsplit('.', 1)
+            token_id, issued, expires = message.split('.')
+            if not hmac.compare_digest(signature, self._sign(message)):
+                return None
+            return token_id, int(issued), int(expires)
+        except ValueError:
+            return None
+
+    def revoke(self, token: str) -> bool:
+        """Revoke a single token, returns False if it was not valid"""
+        parsed = self._parse(token)
+        if parsed is None:
+            return False
+
+        token_id, _, expires = parsed
+        now = time.time()
+        with self.lock:
+            self.verified.pop(token, None)
+            self.revoked[token_id] = expires
+            # Forget revocations of tokens that have expired by now
+            for expired_id in [t for t, exp in self.revoked.items() if exp <= now]:
+                del self.revoked[expired_id]
+        return True
+
+    def revoke_all(self):
+        """Invalidate every token issued so far"""
+        with self.lock:
+            # Above every stamp issued so far (issue() may have stamped
+            # not_before itself); issue() never stamps a new token below it
+            self.not_before = max(int(time.time() * 1000), self.not_before) + 1
+            self.verified.clear()
+            self.revoked.clear()
+
+
+def extract_token(request) -> Optional[str]:
+    """
+    Find a session token on a Flask request.
+
+    Looks at the Authorization: Bearer header, X-Session-Token, the ?token=
+    query arg (for <img>/<video> tags that cannot set headers) and a
+    'token' field in a JSON body.
+    """
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        return header[len('Bearer '):].strip()
+
+    token = request.headers.get('X-Session-Token') or request.args.get('token')
+    if token:
+        return token
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        return data.get('token')
+    return None
@@ -0,0 +1,101 @@
+"""
+Signaling - ICE candidate batching for the SocketIO relay
+
+Browsers trickle ICE candidates one at a time, and relaying each as its own
+SocketIO message multiplies traffic when many clients negotiate together.
+CandidateBatcher collects candidates per (sender, recipient) pair for a
+short window and hands them on as one batch. An end-of-candidates marker
+flushes its batch straight away, so the last candidates of a negotiation
+never wait for the window to expire.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Clients that list this in their features receive 'ice_candidates' batches
+ICE_BATCH_FEATURE = 'ice_batch'
+
+
+def is_end_of_candidates(candidate: Optional[dict]) -> bool:
+    """True for the null / empty candidate that ends trickle ICE"""
+    if not candidate:
+        return True
+    return isinstance(candidate, dict) and candidate.get('candidate') == ''
+
+
+class CandidateBatcher:
+    """Coalesces trickled ICE candidates over a short window"""
+
+    def __init__(self, send: Callable[[str, str, List[dict], bool], None], window: float = 0.03,
+                 sleep: Callable[[float], None] = time.sleep):
+        """
+        Args:
+            send: send(sender, recipient, candidates, done) delivers one batch
+            window: Seconds to collect candidates after the first one
+            sleep: Sleep function of the server's async mode
+        """
+        self.send = send
+        self.window = window
+        self.sleep = sleep
+        self.pending: Dict[Tuple[str, str], List[dict]] = {}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.batches_sent = 0
+        self.candidates_sent = 0
+
+    def add(self, sender: str, recipient: str, candidate: Optional[dict]):
+        """Queue one candidate; end-of-candidates flushes the pair now"""
+        key = (sender, recipient)
+        if is_end_of_candidates(candidate):
+            with self.lock:
+                batch = self.pending.pop(key, [])
+            self._deliver(sender, recipient, batch, True)
+            return
+
+        with self.lock:
+            self.pending.setdefault(key, []).append(candidate)
+        self.wakeup.set()
+
+    def add_many(self, sender: str, recipient: str, candidates: List[Optional[dict]], done: bool = False):
+        """Queue a batch the sender already made (e.g. an 'ice_candidates' message)"""
+        for candidate in candidates:
+            if is_end_of_candidates(candidate):
+                done = True
+            else:
+                self.add(sender, recipient, candidate)
+        if done:
+            self.add(sender, recipient, None)
+
+    def discard(self, sid: str):
+        """Drop pending candidates from or to a disconnected client"""
+        with self.lock:
+            for key in [key for key in self.pending if sid in key]:
+                del self.pending[key]
+
+    def flush(self):
+        """Deliver everything pending"""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for (sender, recipient), batch in pending.items():
+            if batch:
+                self._deliver(sender, recipient, batch, False)
+
+    def _deliver(self, sender: str, recipient: str, batch: List[dict], done: bool):
+        self.batches_sent += 1
+        self.candidates_sent += len(batch)
+        try:
+            self.send(sender, recipient, batch, done)
+        except Exception as e:
+            logger.error(f"Error sending ICE candidates to {recipient}: {e}")
+
+    def run(self):
+        """Background task: flush one window after candidates arrive"""
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            self.sleep(self.window)
+            self.flush()
@@ -0,0 +1,166 @@
+"""
+Signaling Client - Device connection to the cloud signaling relay
+
+Keeps one SocketIO connection to the relay alive:
+
+- Reconnects are event driven. The disconnect handler wakes the reconnect
+  loop at once instead of a poll noticing up to 30 s later.
+- Each attempt waits an exponentially growing delay with full jitter
+  (uniform between 0 and the current cap). When the relay comes back
+  after an outage, a fleet of devices spreads out its reconnects instead
+  of all hitting it in the same second.
+- Every (re)connect replays state: the registration payload is rebuilt
+  from current values and sent, and messages emitted while disconnected
+  (answers, candidates) are flushed if they are still fresh.
+"""
+
+import logging
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Backoff:
+    """Exponential backoff with full jitter"""
+
+    def __init__(self, base: float = 1.0, cap: float = 60.0, factor: float = 2.0):
+        """
+        Args:
+            base: Upper bound of the first delay
+            cap: Largest upper bound
+            factor: Growth of the upper bound per failed attempt
+        """
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.attempt = 0
+
+    def next(self) -> float:
+        """Delay before the next attempt"""
+        bound = min(self.cap, self.base * self.factor ** self.attempt)
+        self.attempt += 1
+        return random.uniform(0, bound)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class SignalingClient:
+    """SocketIO client with jittered reconnects and state replay"""
+
+    def __init__(self, url: str, sio, register: Callable[[], List[Tuple[str, dict]]],
+                 backoff: Optional[Backoff] = None, outbox_size: int = 100, outbox_ttl: float = 10.0,
+                 transports: Optional[List[str]] = None, stable_after: float = 30.0):
+        """
+        Args:
+            url: Relay URL
+            sio: socketio.Client created with reconnection=False
+            register: Returns the (event, data) messages that restore this
+                device's state on the relay, sent on every connect
+            backoff: Reconnect delays (1 s growing to 60 s by default)
+            outbox_size: Messages kept while disconnected
+            outbox_ttl: Seconds a kept message stays worth sending
+            transports: Engine.IO transports to try
+            stable_after: Seconds a connection must last before the
+                backoff starts over, so a flapping relay is not hammered
+        """
+        self.url = url
+        self.sio = sio
+        self.register = register
+        self.backoff = backoff or Backoff()
+        self.outbox: Deque[Tuple[float, str, dict]] = deque(maxlen=outbox_size)
+        self.outbox_ttl = outbox_ttl
+        self.transports = transports or ['websocket', 'polling']
+        self.stable_after = stable_after
+        self.wake = threading.Event()  # set on disconnect
+        self.stopping = threading.Event()
+        self.lock = threading.Lock()
+        self.connects = 0
+        self.failures = 0
+        self.last_connected: Optional[float] = None
+
+        sio.on('connect', self._on_connect)
+        sio.on('disconnect', self._on_disconnect)
+
+    @property
+    def connected(self) -> bool:
+        return self.sio.connected
+
+    def _on_connect(self):
+        self.connects += 1
+        self.last_connected = time.time()
+        logger.info(f"Connected to signaling server: {self.url}")
+        for event, data in self.register():
+            self.sio.emit(event, data)
+        self._flush()
+
+    def _on_disconnect(self, *args):
+        # Newer python-socketio passes a reason
+        if not self.stopping.is_set():
+            logger.warning("Disconnected from signaling server, will reconnect...")
+        self.wake.set()
+
+    def emit(self, event: str, data: dict):
+        """Send now, or keep it for the next connect if disconnected"""
+        if self.sio.connected:
+            try:
+                self.sio.emit(event, data)
+                return
+            except Exception as e:
+                logger.debug(f"Emit {event} failed, queued: {e}")
+        with self.lock:
+            self.outbox.append((time.monotonic(), event, data))
+
+    def _flush(self):
+        with self.lock:
+            pending = list(self.outbox)
+            self.outbox.clear()
+        deadline = time.monotonic() - self.outbox_ttl
+        fresh = [(event, data) for queued, event, data in pending if queued >= deadline]
+        for event, data in fresh:
+            self.sio.emit(event, data)
+        if fresh:
+            logger.info(f"Replayed {len(fresh)} queued signaling messages")
+
+    def run(self):
+        """Connect and keep reconnecting until stop() (blocks, run it on a thread)"""
+        while not self.stopping.is_set():
+            if not self.sio.connected:
+                try:
+                    logger.info(f"Connecting to signaling server: {self.url}")
+                    self.sio.connect(self.url, transports=self.transports)
+                except Exception as e:
+                    self.failures += 1
+                    delay = self.backoff.next()
+                    logger.warning(f"Signaling server unreachable ({e}), retrying in {delay:.1f}s")
+                    self.stopping.wait(delay)
+                    continue
+
+            # Sleep until the connection drops
+            self.wake.wait()
+            self.wake.clear()
+            if self.last_connected and time.time() - self.last_connected >= self.stable_after:
+                self.backoff.reset()
+            # Jitter the first retry too: after a relay outage every device
+            # sees the disconnect at the same moment
+            self.stopping.wait(self.backoff.next())
+
+    def stop(self):
+        self.stopping.set()
+        self.wake.set()
+        if self.sio.connected:
+            self.sio.disconnect()
+
+    def describe(self) -> dict:
+        return {
+            'url': self.url,
+            'connected': self.sio.connected,
+            'connects': self.connects,
+            'failures': self.failures,
+            'last_connected': self.last_connected,
+            'queued': len(self.outbox)
+        }
@@ -0,0 +1,127 @@
+"""
+Snapshots - Time-indexed thumbnail cache for dashboards
+
+Keeps a small JPEG thumbnail of the latest published frame plus one every
+few seconds over the last few minutes. Thumbnails are made from frames the
+capture thread publishes anyway, so polling them never reaches the camera,
+and each one carries an ETag so unchanged thumbnails cost a 304.
+
+Encoding a thumbnail (for passthrough cameras a full decode, resize and
+re-encode) never happens on the capture path: history entries are encoded
+by a background thread, and the latest thumbnail on the first request
+after a new frame.
+"""
+
+import bisect
+import logging
+import queue
+import threading
+from collections import deque
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Snapshot:
+    """One encoded thumbnail"""
+
+    __slots__ = ('seq', 'timestamp', 'jpeg', 'etag')
+
+    def __init__(self, camera_id: str, seq: int, timestamp: float, jpeg: bytes):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.jpeg = jpeg
+        self.etag = f'{camera_id}-{seq}-{int(timestamp * 1000)}'
+
+
+class SnapshotCache:
+    """Latest thumbnail plus a bounded history, one entry per interval"""
+
+    def __init__(self, camera_id: str, quality: int = 50, width: Optional[int] = 320,
+                 interval: float = 5.0, history: float = 300.0):
+        """
+        Args:
+            camera_id: Part of every ETag
+            quality: JPEG quality of thumbnails
+            width: Thumbnail width (None for native)
+            interval: Seconds between history entries
+            history: Seconds of history to keep
+        """
+        self.camera_id = camera_id
+        self.quality = quality
+        self.width = width
+        self.interval = interval
+        self.entries: deque = deque(maxlen=max(1, int(history / interval)))
+        self.latest: Optional[Snapshot] = None
+        self.lock = threading.Lock()
+        self.pending: queue.Queue = queue.Queue(maxsize=1)  # frame waiting for its history thumbnail
+        self.last_recorded = 0.0
+        self.thread: Optional[threading.Thread] = None
+
+    def _snapshot(self, frame) -> Optional[Snapshot]:
+        # Same key as the matching quality tier, so viewers on that tier and
+        # the cache share one encode
+        jpeg = frame.encode(self.quality, self.width)
+        return Snapshot(self.camera_id, frame.seq, frame.timestamp, jpeg) if jpeg else None
+
+    def record(self, frame):
+        """Called for each published frame; queues one thumbnail per interval, never blocks"""
+        if frame.timestamp - self.last_recorded < self.interval:
+            return
+        try:
+            self.pending.put_nowait(frame)
+        except queue.Full:
+            return  # The previous one is still encoding, try the next frame
+        self.last_recorded = frame.timestamp
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._encode_loop, daemon=True,
+                                           name=f'snapshots-{self.camera_id}')
+            self.thread.start()
+
+    def _encode_loop(self):
+        while True:
+            frame = self.pending.get()
+            try:
+                snapshot = self._snapshot(frame)
+            except Exception as e:
+                logger.error(f"Snapshot encode error: {e}")
+                continue
+            finally:
+                del frame  # Don't keep the raw image alive until the next one
+            if snapshot is None:
+                continue
+            with self.lock:
+                self.entries.append(snapshot)
+                if self.latest is None or snapshot.timestamp >= self.latest.timestamp:
+                    self.latest = snapshot
+
+    def current(self, frame=None) -> Optional[Snapshot]:
+        """
+        Thumbnail of the newest frame.
+
+        Args:
+            frame: The camera's latest CachedFrame if it is streaming; it is
+                only encoded if it is newer than what is cached
+        """
+        latest = self.latest
+        if frame is None or (latest is not None and latest.timestamp >= frame.timestamp):
+            return latest
+        snapshot = self._snapshot(frame)
+        if snapshot is None:
+            return latest
+        with self.lock:
+            if self.latest is None or snapshot.timestamp >= self.latest.timestamp:
+                self.latest = snapshot
+            return self.latest
+
+    def at(self, timestamp: float) -> Optional[Snapshot]:
+        """Newest history entry taken at or before timestamp (else the oldest)"""
+        with self.lock:
+            entries = list(self.entries)
+        if not entries:
+            return None
+        index = bisect.bisect_right([entry.timestamp for entry in entries], timestamp)
+        return entries[max(0, index - 1)]
+
+    def timestamps(self) -> List[float]:
+        with self.lock:
+            return [entry.timestamp for entry in self.entries]
@@ -0,0 +1,203 @@
+"""
+State Backend - Shared key/value state for running several server workers
+
+Signaling state that every worker must see (registered devices, which sid
+a device is connected on) goes through a StateBackend instead of module
+level dicts. Entries live in a namespace and can carry a TTL, so a device
+whose worker died simply expires.
+
+Backends (STATE_BACKEND):
+    memory://             Single process (default)
+    sqlite:///path.db     Several processes on one machine, no extra service
+    redis://host:6379/0   Several machines (needs the redis package)
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StateBackend:
+    """Namespaced key -> JSON-able dict store with optional expiry"""
+
+    shared = False  # True when other processes see the same state
+
+    def put(self, namespace: str, key: str, value: dict, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def delete(self, namespace: str, key: str):
+        raise NotImplementedError
+
+    def items(self, namespace: str) -> Dict[str, dict]:
+        """All live entries of a namespace"""
+        raise NotImplementedError
+
+    def describe(self) -> str:
+        return self.__class__.__name__
+
+
+class MemoryBackend(StateBackend):
+    """In-process dicts; expired entries are dropped when read"""
+
+    def __init__(self):
+        self.data: Dict[str, Dict[str, tuple]] = {}  # namespace -> key -> (value, expires)
+        self.lock = threading.Lock()
+
+    def put(self, namespace: str, key: str, value: dict, ttl: Optional[float] = None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.data.setdefault(namespace, {})[key] = (value, expires)
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.data.get(namespace, {}).get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self.data[namespace][key]
+                return None
+            return dict(value)
+
+    def delete(self, namespace: str, key: str):
+        with self.lock:
+            self.data.get(namespace, {}).pop(key, None)
+
+    def items(self, namespace: str) -> Dict[str, dict]:
+        now = time.monotonic()
+        with self.lock:
+            entries = self.data.get(namespace, {})
+            for key in [key for key, (_, expires) in entries.items() if expires is not None and expires <= now]:
+                del entries[key]
+            return {key: dict(value) for key, (value, _) in entries.items()}
+
+
+class SQLiteBackend(StateBackend):
+    """SQLite file shared by worker processes on one machine"""
+
+    shared = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('''
+            CREATE TABLE IF NOT EXISTS state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires REAL,
+                PRIMARY KEY (namespace, key)
+            )
+        ''')
+        self.db.commit()
+
+    def put(self, namespace: str, key: str, value: dict, ttl: Optional[float] = None):
+        # Wall clock: monotonic clocks are not comparable across processes
+        expires = time.time() + ttl if ttl else None
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)',
+                            (namespace, key, json.dumps(value), expires))
+            self.db.commit()
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        with self.lock:
+            row = self.db.execute(
+                'SELECT value FROM state WHERE namespace = ? AND key = ? AND (expires IS NULL OR expires > ?)',
+                (namespace, key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, namespace: str, key: str):
+        with self.lock:
+            self.db.execute('DELETE FROM state WHERE namespace = ? AND key = ?', (namespace, key))
+            self.db.commit()
+
+    def items(self, namespace: str) -> Dict[str, dict]:
+        now = time.time()
+        with self.lock:
+            self.db.execute('DELETE FROM state WHERE expires IS NOT NULL AND expires <= ?', (now,))
+            self.db.commit()
+            rows = self.db.execute('SELECT key, value FROM state WHERE namespace = ?', (namespace,)).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def describe(self) -> str:
+        return f'sqlite:///{self.path}'
+
+
+class RedisBackend(StateBackend):
+    """
+    Redis (or any server speaking its protocol).
+
+    Each entry is its own key with a native TTL; a sorted set per
+    namespace, scored by expiry, makes listing a range query plus MGET.
+    """
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str = 'webcam'):
+        import redis
+        self.url = url
+        self.prefix = prefix
+        self.redis = redis.Redis.from_url(url)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f'{self.prefix}:{namespace}:{key}'
+
+    def _index(self, namespace: str) -> str:
+        return f'{self.prefix}:{namespace}'
+
+    def put(self, namespace: str, key: str, value: dict, ttl: Optional[float] = None):
+        expires = time.time() + ttl if ttl else float('inf')
+        pipe = self.redis.pipeline()
+        if ttl:
+            pipe.set(self._key(namespace, key), json.dumps(value), px=int(ttl * 1000))
+        else:
+            pipe.set(self._key(namespace, key), json.dumps(value))
+        pipe.zadd(self._index(namespace), {key: expires})
+        pipe.execute()
+
+    def get(self, namespace: str, key: str) -> Optional[dict]:
+        value = self.redis.get(self._key(namespace, key))
+        return json.loads(value) if value else None
+
+    def delete(self, namespace: str, key: str):
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key(namespace, key))
+        pipe.zrem(self._index(namespace), key)
+        pipe.execute()
+
+    def items(self, namespace: str) -> Dict[str, dict]:
+        index = self._index(namespace)
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(index, '-inf', time.time())
+        pipe.zrange(index, 0, -1)
+        _, keys = pipe.execute()
+        if not keys:
+            return {}
+        keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+        values = self.redis.mget([self._key(namespace, key) for key in keys])
+        return {key: json.loads(value) for key, value in zip(keys, values) if value}
+
+    def describe(self) -> str:
+        return self.url
+
+
+def create_backend(url: str = '') -> StateBackend:
+    """Backend for a STATE_BACKEND url ('' means in-memory)"""
+    if not url or url.startswith('memory:'):
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f'Unknown state backend: {url}')
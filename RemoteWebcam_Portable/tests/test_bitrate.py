@@ -0,0 +1,94 @@
+import pytest
+
+from bitrate import AdaptiveBitrate, Level, ThroughputEstimator, build_ladder
+
+
+def test_ladder_starts_at_requested_tier_and_never_exceeds_it():
+    ladder = build_ladder(60, 640)
+    assert ladder[0] == Level(60, 640, None)
+    assert all(level.quality <= 60 and level.width <= 640 for level in ladder)
+    assert len(set(ladder)) == len(ladder)
+
+
+def test_blocked_writes_set_the_estimate():
+    estimator = ThroughputEstimator(alpha=1.0)
+    assert estimator.sample(10000, 0.1, now=1.0)
+    assert estimator.bytes_per_second == pytest.approx(100000)
+
+
+def test_unblocked_writes_only_lift_to_delivered_rate():
+    estimator = ThroughputEstimator(alpha=1.0)
+    estimator.sample(10000, 0.5, now=0.0)
+    assert estimator.bytes_per_second == 20000
+    # 10 kB every 0.1 s went straight into the buffer: the link does at least 100 kB/s
+    for i in range(1, 5):
+        assert not estimator.sample(10000, 0.0, now=i * 0.1)
+    assert estimator.bytes_per_second == pytest.approx(100000)
+
+
+def test_unblocked_writes_never_lower_the_estimate():
+    estimator = ThroughputEstimator(alpha=1.0)
+    estimator.sample(10000, 0.01, now=0.0)
+    estimator.sample(100, 0.0, now=1.0)
+    assert estimator.bytes_per_second == 1000000
+
+
+def make_bitrate(**kwargs):
+    bitrate = AdaptiveBitrate(80, None, target_latency=0.5, **kwargs)
+    bitrate.last_change -= 60  # Past cooldown and probe delay
+    return bitrate
+
+
+def test_slightly_late_frame_steps_down_one_level():
+    bitrate = make_bitrate()
+    bitrate.on_sent(50000, 0.0, 0.6)
+    assert bitrate.index == 1
+    assert bitrate.steps_down == 1
+
+
+def test_far_too_old_frame_skips_levels():
+    bitrate = make_bitrate()
+    bitrate.on_sent(50000, 0.0, 4.0)
+    assert bitrate.index >= 3
+
+
+def test_cooldown_limits_steps_down():
+    bitrate = make_bitrate()
+    bitrate.on_sent(50000, 0.0, 0.6)
+    bitrate.on_sent(50000, 0.0, 0.6)
+    assert bitrate.index == 1
+
+
+def test_probes_up_when_frames_are_well_inside_target():
+    bitrate = make_bitrate()
+    bitrate.index = 2
+    bitrate.on_sent(5000, 0.0, 0.01)
+    assert bitrate.index == 1
+    assert bitrate.steps_up == 1
+
+
+def test_blocked_write_counts_send_buffer_drain_in_age():
+    bitrate = make_bitrate(max_send_buffer=64 * 1024)
+    # 20 kB/s: a full 64 kB buffer takes seconds, far over the target
+    bitrate.on_sent(20000, 1.0, 0.1)
+    assert bitrate.age > 0.5
+    assert bitrate.index >= 1
+
+
+def test_send_buffer_follows_throughput():
+    bitrate = AdaptiveBitrate(80, None, target_latency=0.5, min_send_buffer=8192, max_send_buffer=65536)
+    assert bitrate.send_buffer() == 65536
+    bitrate.throughput.bytes_per_second = 100000
+    assert bitrate.send_buffer() == 25000
+    bitrate.throughput.bytes_per_second = 1000
+    assert bitrate.send_buffer() == 8192
+    bitrate.throughput.bytes_per_second = 10 ** 9
+    assert bitrate.send_buffer() == 65536
+
+
+def test_delay_respects_level_fps():
+    bitrate = AdaptiveBitrate(80, None)
+    assert bitrate.delay() == 0.0
+    bitrate.index = len(bitrate.ladder) - 1
+    bitrate.on_sent(1000, 0.0, 0.01)
+    assert 0 < bitrate.delay() <= 1 / bitrate.level.fps
@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+
+import pytest
+
+import metrics
+
+
+def make_counter():
+    return metrics.Counter('test_total', 'Test counter', ['kind'], registry=metrics.Registry())
+
+
+def test_counter_sums_threads():
+    counter = make_counter()
+
+    def work():
+        for _ in range(100):
+            counter.inc(1, ('a',))
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.render() == ['test_total{kind="a"} 800']
+
+
+def test_dead_thread_shards_retired_without_scrape():
+    counter = make_counter()
+    for _ in range(200):
+        thread = threading.Thread(target=counter.inc)
+        thread.start()
+        thread.join()
+    counter.inc()  # Registering this thread's shard retires the dead ones
+    assert len(counter.shards) == 1
+    assert counter.render() == ['test_total 201']
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = metrics.Histogram('test_seconds', 'Test histogram', registry=metrics.Registry(),
+                                  buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.render() == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1"} 3',
+        'test_seconds_bucket{le="+Inf"} 4',
+        'test_seconds_sum 6.05',
+        'test_seconds_count 4',
+    ]
+
+
+def test_label_values_escaped():
+    assert metrics.format_labels(('path',), ('a"b\\c',)) == '{path="a\\"b\\\\c"}'
+
+
+def test_registry_render_has_help_and_type():
+    registry = metrics.Registry()
+    counter = metrics.Counter('test_total', 'Things counted', registry=registry)
+    counter.inc(2)
+    assert registry.render() == '# HELP test_total Things counted\n# TYPE test_total counter\ntest_total 2\n'
+
+
+def test_green_threads_share_os_thread_shard():
+    pytest.importorskip('eventlet')
+    # Monkey patching is process wide, so run it in a child interpreter
+    script = textwrap.dedent('''
+        import eventlet
+        eventlet.monkey_patch()
+        import metrics
+        counter = metrics.Counter('green_total', 'Green counter', registry=metrics.Registry())
+        for _ in range(2000):
+            eventlet.spawn(counter.inc).wait()
+        print(len(counter.shards), counter.render()[0])
+    ''')
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, '-c', script], cwd=here, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.split(None, 1) == ['1', 'green_total 2000\n']
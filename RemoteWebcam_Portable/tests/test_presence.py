@@ -0,0 +1,65 @@
+import json
+import time
+
+from presence import PresenceTracker
+
+
+def tracked(ttl=90.0):
+    tracker = PresenceTracker(ttl)
+    events = []
+    tracker.on_change = lambda device_id, online, info: events.append((device_id, online))
+    return tracker, events
+
+
+def test_heartbeats_notify_only_when_coming_online():
+    tracker, events = tracked()
+    tracker.seen('a', {'device_id': 'a', 'last_seen': 1})
+    tracker.seen('a', {'device_id': 'a', 'last_seen': 2})
+    assert events == [('a', True)]
+    assert tracker.is_online('a')
+    assert len(tracker) == 1
+
+
+def test_expire_takes_silent_devices_offline():
+    tracker, events = tracked(ttl=0.01)
+    tracker.seen('a', {'device_id': 'a'})
+    time.sleep(0.02)
+    assert tracker.expire() == ['a']
+    assert events == [('a', True), ('a', False)]
+    assert not tracker.is_online('a')
+
+
+def test_heartbeat_moves_deadline():
+    tracker, _ = tracked(ttl=0.01)
+    tracker.seen('a', {'device_id': 'a'})
+    tracker.seen('a', {'device_id': 'a'}, ttl=60)
+    time.sleep(0.02)
+    assert tracker.expire() == []
+    assert tracker.is_online('a')
+
+
+def test_remove_and_sync():
+    tracker, events = tracked()
+    tracker.seen('a', {'device_id': 'a'})
+    tracker.seen('b', {'device_id': 'b'})
+    tracker.remove('a')
+    tracker.sync([{'device_id': 'c'}])
+    assert not tracker.is_online('a') and not tracker.is_online('b') and tracker.is_online('c')
+    assert ('a', False) in events and ('b', False) in events and ('c', True) in events
+
+
+def test_listing_rebuilt_only_after_change():
+    tracker, _ = tracked()
+    renders = []
+
+    def render(devices):
+        renders.append(devices)
+        return {'devices': sorted(device['device_id'] for device in devices)}
+
+    tracker.seen('a', {'device_id': 'a', 'last_seen': 1})
+    first = tracker.listing(render)
+    tracker.seen('a', {'device_id': 'a', 'last_seen': 2})  # Heartbeat only
+    assert tracker.listing(render) is first
+    tracker.seen('a', {'device_id': 'a', 'last_seen': 3, 'cameras': ['cam0']})
+    assert json.loads(tracker.listing(render)) == {'devices': ['a']}
+    assert len(renders) == 2
@@ -0,0 +1,112 @@
+import os
+import struct
+import time
+
+from recorder import AviSegment, Recorder, RetentionPolicy, jpeg_size
+from recording_index import RecordingIndex, read_avi_index
+
+
+def fake_jpeg(width=64, height=48, payload=b''):
+    """Just enough JPEG for jpeg_size: SOI, a SOF0 segment, EOI"""
+    sof = b'\xff\xc0\x00\x11\x08' + struct.pack('>HH', height, width) + b'\x03' + bytes(9)
+    return b'\xff\xd8' + sof + payload + b'\xff\xd9'
+
+
+def test_jpeg_size():
+    assert jpeg_size(fake_jpeg(640, 480)) == (640, 480)
+    assert jpeg_size(b'not a jpeg') == (0, 0)
+
+
+def test_segment_pads_gaps_with_repeats(tmp_path):
+    path = str(tmp_path / 'cam_20240101_000000_000.avi')
+    segment = AviSegment(path, 64, 48, fps=10)
+    first, second = fake_jpeg(payload=b'1'), fake_jpeg(payload=b'22')
+    assert segment.write(first, 100.0)
+    assert not segment.write(first, 100.01)  # Same slot
+    assert segment.write(second, 100.5)
+    segment.pad(101.0)
+    segment.close()
+
+    assert len(segment.frames) == 10
+    assert [size for _, _, size in segment.frames] == [len(first)] * 5 + [len(second)] * 5
+    assert segment.end_time == 100.9
+
+    positions, fps = read_avi_index(path)
+    assert fps == 10
+    assert positions == [(offset, size) for _, offset, size in segment.frames]
+    with open(path, 'rb') as f:
+        f.seek(positions[7][0])
+        assert f.read(positions[7][1]) == second
+
+
+def make_recorder(tmp_path, **kwargs):
+    recorder = Recorder('cam', str(tmp_path), RetentionPolicy(str(tmp_path), 0),
+                        segment_seconds=1, fps=10, **kwargs)
+    os.makedirs(recorder.directory)
+    closed = []
+    recorder.on_segment_closed = closed.append
+    return recorder, closed
+
+
+def test_rollover_carries_last_frame_into_next_segment(tmp_path):
+    recorder, closed = make_recorder(tmp_path, continuous=True)
+    jpeg = fake_jpeg()
+    recorder._write(jpeg, 1000.0)
+    recorder._write(fake_jpeg(payload=b'x'), 1002.5)  # Two segment lengths later
+    recorder._close_segment(1003.0)
+
+    assert [len(segment.frames) for segment in closed] == [10, 10, 10]
+    assert closed[1].start_time == 1001.0
+    assert closed[1].frames[0][2] == len(jpeg)
+    assert closed[2].frames[5][2] == len(jpeg) + 1
+    # Each segment plays for its full length at the nominal rate
+    for segment in closed:
+        assert read_avi_index(segment.path)[1] == 10
+
+
+def test_trigger_writes_pre_roll_first(tmp_path):
+    recorder, closed = make_recorder(tmp_path, pre_roll=2)
+    now = time.time()
+    ring = [fake_jpeg(payload=bytes([i])) for i in range(5)]
+    for i, jpeg in enumerate(ring):
+        recorder._handle(jpeg, now - 4.1 + i * 0.5)
+    assert recorder.segment is None
+    assert len(recorder.ring) == 5
+
+    recorder.trigger(10)
+    recorder._handle(fake_jpeg(payload=b'live'), now)
+    recorder._close_segment(now + 0.1)
+    segment = closed[0]
+    # Starts at the window, with the frame that was showing then
+    assert segment.start_time == now - 2
+    assert segment.frames[0][2] == len(ring[4])
+    with open(segment.path, 'rb') as f:
+        f.seek(segment.frames[0][1])
+        assert f.read(segment.frames[0][2]) == ring[4]
+    assert recorder.frames_written == 2
+
+
+def test_index_seek_and_rebuild(tmp_path):
+    recorder, closed = make_recorder(tmp_path, continuous=True)
+    start = 1700000000.0
+    frames = [fake_jpeg(payload=bytes([i]) * (i + 1)) for i in range(5)]
+    for i, jpeg in enumerate(frames):
+        recorder._write(jpeg, start + i * 0.1)
+    recorder._close_segment(start + 0.5)
+
+    index = RecordingIndex(str(tmp_path / 'index.db'))
+    index.add_segment('cam', closed[0])
+    found = index.seek('cam', start + 0.25)
+    assert found['frame_index'] == 2
+    with open(found['path'], 'rb') as f:
+        f.seek(found['offset'])
+        assert f.read(found['length']) == frames[2]
+    assert index.seek('cam', start + 60) is None
+    index.close()
+
+    rebuilt = RecordingIndex(str(tmp_path / 'rebuilt.db'))
+    assert rebuilt.rebuild(str(tmp_path)) == 1
+    [segment] = rebuilt.list('cam')
+    assert segment['frames'] == 5
+    assert (segment['width'], segment['height']) == (64, 48)
+    rebuilt.close()
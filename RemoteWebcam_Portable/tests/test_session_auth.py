@@ -0,0 +1,69 @@
+import time
+
+from session_auth import TokenAuthority, extract_token
+
+
+class FakeRequest:
+    def __init__(self, headers=None, args=None, json=None):
+        self.headers = headers or {}
+        self.args = args or {}
+        self.json = json
+
+    def get_json(self, silent=False):
+        return self.json
+
+
+def test_issued_token_verifies():
+    authority = TokenAuthority()
+    token, expires = authority.issue()
+    assert authority.verify(token)
+    assert expires > time.time()
+
+
+def test_tampered_token_rejected():
+    authority = TokenAuthority()
+    token, _ = authority.issue()
+    token_id, issued, expires, signature = token.split('.')
+    assert not authority.verify(f'{token_id}.{issued}.{int(expires) + 3600}.{signature}')
+    assert not authority.verify('garbage')
+    assert not authority.verify(None)
+
+
+def test_other_secret_rejected():
+    token, _ = TokenAuthority(b'one').issue()
+    assert not TokenAuthority(b'two').verify(token)
+
+
+def test_expired_token_rejected():
+    authority = TokenAuthority(ttl=-1)
+    token, _ = authority.issue()
+    assert not authority.verify(token)
+
+
+def test_revoke_single_token():
+    authority = TokenAuthority()
+    token, _ = authority.issue()
+    other, _ = authority.issue()
+    assert authority.verify(token)  # Cached now
+    assert authority.revoke(token)
+    assert not authority.verify(token)
+    assert authority.verify(other)
+
+
+def test_revoke_all_keeps_tokens_issued_right_after():
+    authority = TokenAuthority()
+    for _ in range(500):
+        old, _ = authority.issue()
+        authority.verify(old)
+        authority.revoke_all()
+        new, _ = authority.issue()
+        assert not authority.verify(old)
+        assert authority.verify(new)
+
+
+def test_extract_token_sources():
+    assert extract_token(FakeRequest(headers={'Authorization': 'Bearer abc'})) == 'abc'
+    assert extract_token(FakeRequest(headers={'X-Session-Token': 'def'})) == 'def'
+    assert extract_token(FakeRequest(args={'token': 'ghi'})) == 'ghi'
+    assert extract_token(FakeRequest(json={'token': 'jkl'})) == 'jkl'
+    assert extract_token(FakeRequest()) is None
@@ -0,0 +1,74 @@
+import threading
+
+from signaling import CandidateBatcher, is_end_of_candidates
+
+
+def candidate(i):
+    return {'candidate': f'candidate:{i} 1 udp 1 10.0.0.{i} 5000 typ host', 'sdpMid': '0'}
+
+
+def recording_batcher(**kwargs):
+    sent = []
+    batcher = CandidateBatcher(lambda *batch: sent.append(batch), **kwargs)
+    return batcher, sent
+
+
+def test_end_of_candidates():
+    assert is_end_of_candidates(None)
+    assert is_end_of_candidates({})
+    assert is_end_of_candidates({'candidate': '', 'sdpMid': '0'})
+    assert not is_end_of_candidates(candidate(1))
+
+
+def test_flush_sends_one_batch_per_pair():
+    batcher, sent = recording_batcher()
+    batcher.add('viewer', 'device', candidate(1))
+    batcher.add('viewer', 'device', candidate(2))
+    batcher.add('other', 'device', candidate(3))
+    batcher.flush()
+    assert sorted(sent, key=lambda batch: batch[0]) == [
+        ('other', 'device', [candidate(3)], False),
+        ('viewer', 'device', [candidate(1), candidate(2)], False),
+    ]
+    assert batcher.batches_sent == 2 and batcher.candidates_sent == 3
+
+
+def test_end_of_candidates_flushes_immediately():
+    batcher, sent = recording_batcher()
+    batcher.add('viewer', 'device', candidate(1))
+    batcher.add('viewer', 'device', {'candidate': ''})
+    assert sent == [('viewer', 'device', [candidate(1)], True)]
+    batcher.flush()
+    assert len(sent) == 1
+
+
+def test_add_many_with_trailing_end():
+    batcher, sent = recording_batcher()
+    batcher.add_many('viewer', 'device', [candidate(1), candidate(2), None])
+    assert sent == [('viewer', 'device', [candidate(1), candidate(2)], True)]
+
+
+def test_discard_drops_pending_for_sid():
+    batcher, sent = recording_batcher()
+    batcher.add('viewer', 'device', candidate(1))
+    batcher.add('device', 'viewer', candidate(2))
+    batcher.add('other', 'device', candidate(3))
+    batcher.discard('viewer')
+    batcher.flush()
+    assert sent == [('other', 'device', [candidate(3)], False)]
+
+
+def test_run_flushes_after_window():
+    delivered = threading.Event()
+    batcher = CandidateBatcher(lambda *batch: delivered.set(), window=0.01)
+    threading.Thread(target=batcher.run, daemon=True).start()
+    batcher.add('viewer', 'device', candidate(1))
+    assert delivered.wait(timeout=2)
+
+
+def test_send_errors_are_contained():
+    def fail(*batch):
+        raise RuntimeError('gone')
+    batcher = CandidateBatcher(fail)
+    batcher.add('viewer', 'device', None)
+    assert batcher.batches_sent == 1
@@ -0,0 +1,59 @@
+import time
+
+import pytest
+
+from state_backend import MemoryBackend, SQLiteBackend, create_backend
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryBackend()
+    return SQLiteBackend(str(tmp_path / 'state.db'))
+
+
+def test_put_get_delete(backend):
+    backend.put('devices', 'a', {'sid': '1'})
+    assert backend.get('devices', 'a') == {'sid': '1'}
+    assert backend.get('other', 'a') is None
+    backend.delete('devices', 'a')
+    assert backend.get('devices', 'a') is None
+
+
+def test_items_per_namespace(backend):
+    backend.put('devices', 'a', {'n': 1})
+    backend.put('devices', 'b', {'n': 2})
+    backend.put('sids', 'a', {'n': 3})
+    assert backend.items('devices') == {'a': {'n': 1}, 'b': {'n': 2}}
+
+
+def test_ttl_expiry(backend):
+    backend.put('devices', 'short', {'n': 1}, ttl=0.01)
+    backend.put('devices', 'long', {'n': 2}, ttl=60)
+    time.sleep(0.02)
+    assert backend.get('devices', 'short') is None
+    assert backend.items('devices') == {'long': {'n': 2}}
+
+
+def test_returned_values_are_copies(backend):
+    backend.put('devices', 'a', {'n': 1})
+    backend.get('devices', 'a')['n'] = 2
+    assert backend.get('devices', 'a') == {'n': 1}
+
+
+def test_sqlite_shared_between_connections(tmp_path):
+    path = str(tmp_path / 'state.db')
+    first, second = SQLiteBackend(path), SQLiteBackend(path)
+    first.put('devices', 'a', {'worker': 'one'})
+    assert second.get('devices', 'a') == {'worker': 'one'}
+    assert second.shared and not MemoryBackend.shared
+
+
+def test_create_backend(tmp_path):
+    assert isinstance(create_backend(''), MemoryBackend)
+    assert isinstance(create_backend('memory://'), MemoryBackend)
+    backend = create_backend(f'sqlite:///{tmp_path / "state.db"}')
+    assert isinstance(backend, SQLiteBackend)
+    assert backend.describe().startswith('sqlite:///')
+    with pytest.raises(ValueError):
+        create_backend('etcd://localhost')
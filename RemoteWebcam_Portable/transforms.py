@@ -0,0 +1,177 @@
+"""
+Transforms - Crop, downscale, privacy masks and timestamp overlay
+
+A TransformPipeline runs between capture and encode. Every step is a
+vectorised OpenCV/NumPy operation:
+
+    crop       A slice of the source frame (a view, no copy)
+    resize     cv2.resize straight into the output frame
+    masks      Privacy rectangles, precomputed once per frame geometry as a
+               boolean array and applied with a single masked assignment
+    timestamp  A label rendered once per second and pasted on each frame
+
+Every frame gets a freshly allocated output array. A published frame can
+be referenced long after it is replaced, as a NumPy view or through its
+base array (recorder pre-roll, snapshot cache, in-flight encodes, WebRTC
+tracks), so an output buffer is never written to twice.
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from lazy_import import LazyModule
+
+cv2 = LazyModule('cv2')
+
+logger = logging.getLogger(__name__)
+
+Rect = Tuple[int, int, int, int]  # x, y, width, height
+
+
+def parse_rect(value: str) -> Optional[Rect]:
+    """'x,y,w,h' -> rect, None if empty or malformed"""
+    try:
+        x, y, w, h = (int(float(part)) for part in value.split(','))
+    except (ValueError, AttributeError):
+        return None
+    if w <= 0 or h <= 0:
+        return None
+    return max(0, x), max(0, y), w, h
+
+
+def parse_rects(value: str) -> List[Rect]:
+    """'x,y,w,h;x,y,w,h' -> rects, skipping malformed entries"""
+    rects = [parse_rect(part) for part in (value or '').split(';') if part.strip()]
+    return [rect for rect in rects if rect]
+
+
+class TimestampOverlay:
+    """Burned-in capture time, rendered once per second and size"""
+
+    def __init__(self, fmt: str = '%Y-%m-%d %H:%M:%S'):
+        self.fmt = fmt
+        self.cached_key: Optional[Tuple[int, int]] = None
+        self.cached_label: Optional[np.ndarray] = None
+        self.lock = threading.Lock()
+
+    def label(self, timestamp: float, frame_width: int) -> np.ndarray:
+        """White-on-black label for the second containing timestamp"""
+        key = (int(timestamp), frame_width)
+        with self.lock:
+            if key != self.cached_key:
+                self.cached_label = self._render(time.strftime(self.fmt, time.localtime(key[0])), frame_width)
+                self.cached_key = key
+            return self.cached_label
+
+    @staticmethod
+    def _render(text: str, frame_width: int) -> np.ndarray:
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        scale = max(0.4, frame_width / 1280.0)
+        thickness = max(1, int(round(scale * 1.5)))
+        (text_width, text_height), baseline = cv2.getTextSize(text, font, scale, thickness)
+        pad = max(2, int(4 * scale))
+        label = np.zeros((text_height + baseline + 2 * pad, text_width + 2 * pad, 3), np.uint8)
+        cv2.putText(label, text, (pad, pad + text_height), font, scale, (255, 255, 255), thickness, cv2.LINE_AA)
+        return label
+
+    def apply(self, image: np.ndarray, timestamp: float):
+        """Paste the label into the bottom left corner, in place"""
+        label = self.label(timestamp, image.shape[1])
+        height = min(label.shape[0], image.shape[0])
+        width = min(label.shape[1], image.shape[1])
+        image[image.shape[0] - height:, :width] = label[label.shape[0] - height:, :width]
+
+
+class TransformPipeline:
+    """Crop -> resize -> privacy masks -> timestamp, on BGR frames"""
+
+    def __init__(self, crop: Optional[Rect] = None, width: Optional[int] = None,
+                 masks: Optional[List[Rect]] = None, timestamp: Optional[str] = None):
+        """
+        Args:
+            crop: Region of the source frame to keep
+            width: Downscale to this width (never upscales)
+            masks: Rectangles in source pixels to black out
+            timestamp: strftime format of the burned-in capture time
+        """
+        self.crop = crop
+        self.width = width
+        self.masks = list(masks or [])
+        self.overlay = TimestampOverlay(timestamp) if timestamp else None
+        # Output geometry and mask per source shape, computed on first use
+        self.geometry: Dict[Tuple[int, ...], Tuple[Tuple[slice, slice], Tuple[int, int], Optional[np.ndarray]]] = {}
+        self.key = (crop, width, tuple(self.masks), timestamp)
+
+    @property
+    def active(self) -> bool:
+        return bool(self.crop or self.width or self.masks or self.overlay)
+
+    def _geometry(self, shape: Tuple[int, ...]):
+        """(crop slices, output (width, height), mask or None) for a source shape"""
+        geometry = self.geometry.get(shape)
+        if geometry is not None:
+            return geometry
+
+        source_height, source_width = shape[:2]
+        x, y, w, h = self.crop or (0, 0, source_width, source_height)
+        x, y = min(x, source_width - 1), min(y, source_height - 1)
+        w, h = min(w, source_width - x), min(h, source_height - y)
+        out_width, out_height = w, h
+        if self.width and self.width < w:
+            out_width = self.width
+            out_height = max(1, round(h * self.width / w))
+
+        mask = None
+        if self.masks:
+            # Rectangles in source pixels -> output pixels, rounded outwards
+            mask = np.zeros((out_height, out_width), dtype=bool)
+            scale_x, scale_y = out_width / w, out_height / h
+            for mx, my, mw, mh in self.masks:
+                left = max(0, int(np.floor((mx - x) * scale_x)))
+                top = max(0, int(np.floor((my - y) * scale_y)))
+                right = min(out_width, int(np.ceil((mx + mw - x) * scale_x)))
+                bottom = min(out_height, int(np.ceil((my + mh - y) * scale_y)))
+                if right > left and bottom > top:
+                    mask[top:bottom, left:right] = True
+            if not mask.any():
+                mask = None
+
+        geometry = ((slice(y, y + h), slice(x, x + w)), (out_width, out_height), mask)
+        self.geometry[shape] = geometry
+        return geometry
+
+    def apply(self, image: np.ndarray, timestamp: Optional[float] = None) -> np.ndarray:
+        """
+        Run the pipeline on one frame.
+
+        Args:
+            image: BGR source frame (not modified)
+            timestamp: Capture time for the overlay (now if omitted)
+
+        Returns:
+            A new frame
+        """
+        (rows, cols), (out_width, out_height), mask = self._geometry(image.shape)
+        source = image[rows, cols]
+        out = np.empty((out_height, out_width) + image.shape[2:], image.dtype)
+        if (out_width, out_height) != (source.shape[1], source.shape[0]):
+            cv2.resize(source, (out_width, out_height), dst=out, interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(out, source)
+        if mask is not None:
+            out[mask] = 0
+        if self.overlay:
+            self.overlay.apply(out, timestamp if timestamp is not None else time.time())
+        return out
+
+    def describe(self) -> dict:
+        return {
+            'crop': self.crop,
+            'width': self.width,
+            'masks': self.masks,
+            'timestamp': self.overlay.fmt if self.overlay else None
+        }
@@ -0,0 +1,286 @@
+"""
+WebRTC Helper - Answers WebRTC offers with a live camera track
+
+Uses aiortc (software VP8/H.264 via libvpx/libx264, no hardware encoder
+needed). aiortc is optional: when it is not installed WEBRTC_AVAILABLE is
+False and viewers fall back to the MJPEG endpoints.
+
+Loopback self-check (two peers on this machine, synthetic frames):
+    python webrtc_helper.py --loopback
+"""
+
+import asyncio
+import concurrent.futures
+import fractions
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+try:
+    from aiortc import RTCPeerConnection, RTCSessionDescription, RTCRtpSender, VideoStreamTrack
+    from aiortc.mediastreams import MediaStreamError
+    from aiortc.sdp import candidate_from_sdp
+    from av import VideoFrame
+    WEBRTC_AVAILABLE = True
+except ImportError:
+    WEBRTC_AVAILABLE = False
+    VideoStreamTrack = object
+
+# Preferred video codec: 'VP8' or 'H264' (others are kept as fallbacks)
+WEBRTC_CODEC = os.environ.get('WEBRTC_CODEC', 'VP8')
+
+# RTP video clock rate
+VIDEO_CLOCK_RATE = 90000
+VIDEO_TIME_BASE = fractions.Fraction(1, VIDEO_CLOCK_RATE)
+
+
+class StreamerVideoTrack(VideoStreamTrack):
+    """
+    Video track fed by a frame provider.
+
+    The provider is any callable with the signature of
+    WebcamStreamer.wait_for_frame(last_seq, timeout) returning an object
+    with .seq, .image (BGR ndarray) and .timestamp, or None.
+    """
+
+    kind = 'video'
+
+    def __init__(self, wait_for_frame):
+        super().__init__()
+        self.wait_for_frame = wait_for_frame
+        self.last_seq = 0
+        self.last_image = None
+        self.start_time = None
+
+    async def recv(self):
+        """Return the next camera frame as soon as it is published"""
+        loop = asyncio.get_running_loop()
+
+        while True:
+            if self.readyState != 'live':
+                raise MediaStreamError
+
+            # Blocking wait runs in the default executor, not on the event loop
+            cached = await loop.run_in_executor(None, self.wait_for_frame, self.last_seq, 1.0)
+            if cached is not None:
+                self.last_seq = cached.seq
+                self.last_image = cached.image
+                timestamp = cached.timestamp
+                break
+            if self.last_image is not None:
+                # Camera stalled: repeat the last image to keep the track alive
+                timestamp = time.time()
+                break
+
+        if self.start_time is None:
+            self.start_time = timestamp
+
+        frame = VideoFrame.from_ndarray(self.last_image, format='bgr24')
+        frame.pts = int((timestamp - self.start_time) * VIDEO_CLOCK_RATE)
+        frame.time_base = VIDEO_TIME_BASE
+        return frame
+
+
+class WebRTCPeerManager:
+    """Owns the device-side peer connections and their asyncio loop"""
+
+    def __init__(self, wait_for_frame, codec: str = WEBRTC_CODEC):
+        self.wait_for_frame = wait_for_frame
+        self.codec = codec
+        self.peers = {}  # peer_id -> RTCPeerConnection
+        self.close_callbacks = {}  # peer_id -> callable run when the peer closes
+        self.loop = None
+        self.loop_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        """Start the background event loop on first use"""
+        with self.loop_lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        return self.loop
+
+    def _run(self, coro, timeout: float = 10):
+        """Run a coroutine on the peer loop from any thread"""
+        future = asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            # The caller gives up; don't let the coroutine finish behind its back
+            future.cancel()
+            raise
+
+    def handle_offer(self, peer_id: str, offer: dict, wait_for_frame=None, on_close=None) -> dict:
+        """
+        Answer an SDP offer from peer_id.
+
+        Args:
+            wait_for_frame: Frame provider for this peer (defaults to the
+                manager's), e.g. to pick one of several cameras
+            on_close: Called once when this peer connection goes away
+
+        Returns:
+            dict: {'sdp': ..., 'type': 'answer'}
+        """
+        return self._run(self.answer(peer_id, offer, wait_for_frame, on_close))
+
+    def add_ice_candidate(self, peer_id: str, candidate: dict):
+        """Add a trickled remote ICE candidate"""
+        try:
+            self._run(self._add_ice_candidate(peer_id, candidate))
+        except Exception as e:
+            logger.warning(f"Ignoring ICE candidate from {peer_id}: {e}")
+
+    def close_peer(self, peer_id: str):
+        """Close the connection to peer_id if there is one"""
+        if self.loop is not None and peer_id in self.peers:
+            self._run(self._close(peer_id))
+
+    async def answer(self, peer_id: str, offer: dict, wait_for_frame=None, on_close=None) -> dict:
+        """Create a peer connection with our video track and answer the offer"""
+        await self._close(peer_id)
+
+        pc = RTCPeerConnection()
+        self.peers[peer_id] = pc
+        if on_close is not None:
+            self.close_callbacks[peer_id] = on_close
+
+        @pc.on('connectionstatechange')
+        async def on_connectionstatechange():
+            logger.info(f"WebRTC peer {peer_id}: {pc.connectionState}")
+            if pc.connectionState in ('failed', 'closed'):
+                await self._close(peer_id)
+
+        try:
+            await pc.setRemoteDescription(RTCSessionDescription(sdp=offer['sdp'], type=offer['type']))
+
+            for transceiver in pc.getTransceivers():
+                if transceiver.kind == 'video':
+                    self._prefer_codec(transceiver)
+            pc.addTrack(StreamerVideoTrack(wait_for_frame or self.wait_for_frame))
+
+            answer = await pc.createAnswer()
+            await pc.setLocalDescription(answer)
+        except BaseException:
+            # Malformed offer or cancelled: the caller cleans up after a
+            # failed answer, so on_close must not run for this peer too
+            if self.peers.get(peer_id) is pc:
+                self.close_callbacks.pop(peer_id, None)
+                await self._close(peer_id)
+            raise
+        return {'sdp': pc.localDescription.sdp, 'type': pc.localDescription.type}
+
+    def _prefer_codec(self, transceiver):
+        """Put the configured codec (and its RTX) first in the negotiation"""
+        codecs = RTCRtpSender.getCapabilities('video').codecs
+        preferred = f'video/{self.codec}'.lower()
+        ordered = sorted(codecs, key=lambda c: c.mimeType.lower() not in (preferred, 'video/rtx'))
+        transceiver.setCodecPreferences(ordered)
+
+    async def _add_ice_candidate(self, peer_id: str, candidate: dict):
+        pc = self.peers.get(peer_id)
+        if pc is None or not candidate or not candidate.get('candidate'):
+            return
+
+        sdp = candidate['candidate']
+        if sdp.startswith('candidate:'):
+            sdp = sdp[len('candidate:'):]
+        ice = candidate_from_sdp(sdp)
+        ice.sdpMid = candidate.get('sdpMid')
+        ice.sdpMLineIndex = candidate.get('sdpMLineIndex')
+        await pc.addIceCandidate(ice)
+
+    async def _close(self, peer_id: str):
+        pc = self.peers.pop(peer_id, None)
+        callback = self.close_callbacks.pop(peer_id, None)
+        if pc is not None:
+            await pc.close()
+        if callback is not None:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"WebRTC close callback error: {e}")
+
+
+class SyntheticFrameProvider:
+    """wait_for_frame interface over a SyntheticSource, for loopback checks"""
+
+    class Frame:
+        def __init__(self, seq, image, timestamp):
+            self.seq = seq
+            self.image = image
+            self.timestamp = timestamp
+
+    def __init__(self, width: int = 640, height: int = 480, fps: int = 30):
+        from frame_sources import SyntheticSource
+        self.source = SyntheticSource(width=width, height=height, fps=fps)
+        self.source.open()
+
+    def wait_for_frame(self, last_seq: int, timeout: float = 1.0):
+        image = self.source.read()
+        return self.Frame(last_seq + 1, image, time.time())
+
+
+async def run_loopback_check(frames: int = 60) -> dict:
+    """
+    Negotiate a device peer and a viewer peer over loopback and receive
+    frames from a synthetic source.
+
+    Returns:
+        dict: frames received, elapsed seconds, fps and negotiated codec
+    """
+    provider = SyntheticFrameProvider()
+    manager = WebRTCPeerManager(provider.wait_for_frame)
+
+    viewer = RTCPeerConnection()
+    viewer.addTransceiver('video', direction='recvonly')
+    received = asyncio.get_running_loop().create_future()
+
+    @viewer.on('track')
+    def on_track(track):
+        async def consume():
+            start = time.time()
+            for _ in range(frames):
+                await track.recv()
+            received.set_result(time.time() - start)
+        asyncio.ensure_future(consume())
+
+    offer = await viewer.createOffer()
+    await viewer.setLocalDescription(offer)
+    answer = await manager.answer('loopback', {
+        'sdp': viewer.localDescription.sdp,
+        'type': viewer.localDescription.type
+    })
+    await viewer.setRemoteDescription(RTCSessionDescription(**answer))
+
+    elapsed = await asyncio.wait_for(received, timeout=30)
+    codec = next((line.split(' ', 1)[1] for line in answer['sdp'].splitlines()
+                  if line.startswith('a=rtpmap:')), 'unknown')
+
+    await viewer.close()
+    await manager._close('loopback')
+    return {
+        'frames': frames,
+        'elapsed': round(elapsed, 2),
+        'fps': round(frames / elapsed, 1),
+        'codec': codec
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='WebRTC helper')
+    parser.add_argument('--loopback', action='store_true', help='Run a two-peer loopback check')
+    parser.add_argument('--frames', type=int, default=60)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not WEBRTC_AVAILABLE:
+        print("aiortc is not installed: pip install aiortc")
+        raise SystemExit(1)
+    if args.loopback:
+        print(asyncio.run(run_loopback_check(args.frames)))